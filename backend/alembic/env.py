@@ -3,9 +3,10 @@ from sqlalchemy import engine_from_config, pool
 from alembic import context
 import sys
 import os
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
-from backend import models
-from backend.database import DATABASE_URL
+# Import the backend modules the same way the app does (database.py imports its siblings by name)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import models
+from database import DATABASE_URL
 
 config = context.config
 # Set the sqlalchemy.url in the alembic config
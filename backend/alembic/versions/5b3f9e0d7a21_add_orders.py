@@ -0,0 +1,60 @@
+"""add orders
+
+orders and order_lines, filled at checkout from the cart with the product/service name,
+price and period snapshotted on each line.
+
+Revision ID: 5b3f9e0d7a21
+Revises: a4e8d2c61b07
+Create Date: 2026-10-18 19:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b3f9e0d7a21'
+down_revision = 'a4e8d2c61b07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table('orders'):
+        return  # Already created by init_db.py's create_all
+    op.create_table(
+        'orders',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('company_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['company_id'], ['companies.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_orders_id', 'orders', ['id'])
+    op.create_index('ix_orders_user_id_id', 'orders', ['user_id', 'id'])
+    op.create_table(
+        'order_lines',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=True),
+        sa.Column('service_id', sa.Integer(), nullable=True),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('unit_price', sa.Integer(), nullable=True),
+        sa.Column('period', sa.String(), nullable=True),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['order_id'], ['orders.id']),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id']),
+        sa.ForeignKeyConstraint(['service_id'], ['services.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_order_lines_id', 'order_lines', ['id'])
+    op.create_index('ix_order_lines_order_id', 'order_lines', ['order_id'])
+
+
+def downgrade() -> None:
+    op.drop_table('order_lines')
+    op.drop_table('orders')
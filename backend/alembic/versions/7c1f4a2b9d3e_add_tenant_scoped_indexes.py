@@ -0,0 +1,78 @@
+"""add tenant-scoped indexes
+
+Composite (company_id, id) indexes for the tenant-scoped tables, (user_id, product_id) and
+(user_id, service_id) for the cart, the foreign keys the routers filter on, and lower(name)
+for the case-insensitive company lookup. On PostgreSQL
+the indexes are built CONCURRENTLY, outside a transaction, so writes are not blocked.
+
+Revision ID: 7c1f4a2b9d3e
+Revises:
+Create Date: 2026-10-18 18:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1f4a2b9d3e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_users_company_id_id", "users", ["company_id", "id"]),
+    ("ix_products_company_id_id", "products", ["company_id", "id"]),
+    ("ix_services_company_id_id", "services", ["company_id", "id"]),
+    ("ix_faqs_company_id_id", "faqs", ["company_id", "id"]),
+    ("ix_policies_company_id_id", "policies", ["company_id", "id"]),
+    ("ix_cart_items_user_id_product_id", "cart_items", ["user_id", "product_id"]),
+    ("ix_cart_items_user_id_service_id", "cart_items", ["user_id", "service_id"]),
+    ("ix_product_questions_customer_id", "product_questions", ["customer_id"]),
+    ("ix_product_answers_question_id", "product_answers", ["question_id"]),
+    ("ix_companies_lower_name", "companies", [sa.text("lower(name)")]),
+]
+
+
+def _existing_indexes(bind) -> dict:
+    # table -> index names, for the tables that exist (create_all may already have added the indexes).
+    # Read from the catalog because the SQLite inspector skips expression indexes such as lower(name).
+    tables = set(sa.inspect(bind).get_table_names())
+    if bind.dialect.name == "sqlite":
+        rows = bind.execute(sa.text("SELECT tbl_name, name FROM sqlite_master WHERE type = 'index'"))
+    elif bind.dialect.name == "postgresql":
+        rows = bind.execute(sa.text("SELECT tablename, indexname FROM pg_indexes WHERE schemaname = current_schema()"))
+    else:
+        inspector = sa.inspect(bind)
+        rows = [(table, index["name"]) for table in tables for index in inspector.get_indexes(table)]
+    existing = {table: set() for table in tables}
+    for table, name in rows:
+        existing.setdefault(table, set()).add(name)
+    return existing
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    existing = _existing_indexes(bind)
+    missing = [(name, table, columns) for name, table, columns in INDEXES
+               if table in existing and name not in existing[table]]
+    if bind.dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            for name, table, columns in missing:
+                op.create_index(name, table, columns, postgresql_concurrently=True)
+    else:
+        for name, table, columns in missing:
+            op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    existing = _existing_indexes(bind)
+    present = [(name, table) for name, table, _ in INDEXES if name in existing.get(table, ())]
+    if bind.dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            for name, table in present:
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+    else:
+        for name, table in present:
+            op.drop_index(name, table_name=table)
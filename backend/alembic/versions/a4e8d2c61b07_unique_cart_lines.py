@@ -0,0 +1,82 @@
+"""unique cart lines
+
+Replaces the (user_id, product_id) and (user_id, service_id) indexes on cart_items with
+unique ones, so a user has at most one line per product or service and add-to-cart can
+be an INSERT ... ON CONFLICT DO UPDATE. Existing duplicate lines are merged into the
+oldest one first, summing their quantities. On PostgreSQL the indexes are built
+CONCURRENTLY, outside a transaction.
+
+Revision ID: a4e8d2c61b07
+Revises: 7c1f4a2b9d3e
+Create Date: 2026-10-18 19:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4e8d2c61b07'
+down_revision = '7c1f4a2b9d3e'
+branch_labels = None
+depends_on = None
+
+# (old non-unique index, new unique index, column next to user_id)
+INDEXES = [
+    ("ix_cart_items_user_id_product_id", "uq_cart_items_user_id_product_id", "product_id"),
+    ("ix_cart_items_user_id_service_id", "uq_cart_items_user_id_service_id", "service_id"),
+]
+
+
+def _merge_duplicate_lines(column: str) -> None:
+    # Keep the oldest line of each (user_id, column) group, holding the group's total quantity
+    op.execute(f"""
+        UPDATE cart_items SET quantity = (
+            SELECT SUM(other.quantity) FROM cart_items AS other
+            WHERE other.user_id = cart_items.user_id AND other.{column} = cart_items.{column})
+        WHERE id IN (
+            SELECT MIN(id) FROM cart_items WHERE {column} IS NOT NULL
+            GROUP BY user_id, {column} HAVING COUNT(*) > 1)
+    """)
+    op.execute(f"""
+        DELETE FROM cart_items WHERE {column} IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM cart_items WHERE {column} IS NOT NULL GROUP BY user_id, {column})
+    """)
+
+
+def _existing_indexes(bind) -> set:
+    return {index["name"] for index in sa.inspect(bind).get_indexes("cart_items")}
+
+
+def _swap_indexes(drop: list, create: list, unique: bool) -> None:
+    bind = op.get_bind()
+    existing = _existing_indexes(bind)
+    if bind.dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            for name, column in create:
+                if name not in existing:
+                    op.create_index(name, "cart_items", ["user_id", column], unique=unique, postgresql_concurrently=True)
+            for name in drop:
+                if name in existing:
+                    op.drop_index(name, table_name="cart_items", postgresql_concurrently=True)
+    else:
+        for name, column in create:
+            if name not in existing:
+                op.create_index(name, "cart_items", ["user_id", column], unique=unique)
+        for name in drop:
+            if name in existing:
+                op.drop_index(name, table_name="cart_items")
+
+
+def upgrade() -> None:
+    if not sa.inspect(op.get_bind()).has_table("cart_items"):
+        return
+    for _, _, column in INDEXES:
+        _merge_duplicate_lines(column)
+    _swap_indexes([old for old, _, _ in INDEXES], [(new, column) for _, new, column in INDEXES], unique=True)
+
+
+def downgrade() -> None:
+    if not sa.inspect(op.get_bind()).has_table("cart_items"):
+        return
+    _swap_indexes([new for _, new, _ in INDEXES], [(old, column) for old, _, column in INDEXES], unique=False)
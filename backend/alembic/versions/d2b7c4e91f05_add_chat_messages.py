@@ -0,0 +1,39 @@
+"""add chat messages
+
+chat_messages, the conversation history kept by the sql chat history store
+(CHAT_HISTORY_BACKEND=sql). Rows are read newest first per user, by (user_id, id).
+
+Revision ID: d2b7c4e91f05
+Revises: 5b3f9e0d7a21
+Create Date: 2026-10-18 20:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b7c4e91f05'
+down_revision = '5b3f9e0d7a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table('chat_messages'):
+        return  # Already created by init_db.py's create_all, or by the store itself before this migration
+    op.create_table(
+        'chat_messages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.String(), nullable=False),
+        sa.Column('role', sa.String(), nullable=False),
+        sa.Column('content', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_chat_messages_id', 'chat_messages', ['id'])
+    op.create_index('ix_chat_messages_user_id', 'chat_messages', ['user_id'])
+
+
+def downgrade() -> None:
+    op.drop_table('chat_messages')
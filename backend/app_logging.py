@@ -0,0 +1,160 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+
+# Root level, and per-logger overrides such as "main=DEBUG,routers.cart=WARNING"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# Applied before LOG_LEVELS: libraries that log every outbound request at INFO
+DEFAULT_LOGGER_LEVELS = "httpx=WARNING,httpcore=WARNING"
+# Records waiting for the writer thread; past this, new records are dropped (and counted) instead of blocking
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Keep one DEBUG record in this many from each call site (1 keeps them all)
+LOG_DEBUG_SAMPLE_EVERY = int(os.getenv("LOG_DEBUG_SAMPLE_EVERY", "10"))
+
+# Attributes every LogRecord has (plus uvicorn's ANSI-coloured copy of the message);
+# anything else on a record came from `extra=` and is logged as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "color_message"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, then the record's `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """
+    Pass one DEBUG record in `every` from each call site; higher levels always pass.
+    A kept record carries sampled=<every> so readers can scale counts back up.
+    """
+
+    def __init__(self, every: int = LOG_DEBUG_SAMPLE_EVERY):
+        super().__init__()
+        self.every = max(1, every)
+        self._lock = threading.Lock()
+        self._seen = {}  # (pathname, lineno) -> records seen
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        site = (record.pathname, record.lineno)
+        with self._lock:
+            seen = self._seen.get(site, 0)
+            self._seen[site] = seen + 1
+            if seen % self.every:
+                self.sampled_out += 1
+                return False
+        record.sampled = self.every
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a bounded queue and returns; a QueueListener thread formats and writes
+    them. The caller only resolves the message (its args may change after the call); JSON
+    encoding and the write itself happen off the event loop. A full queue drops the record.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room rather than fail when stopping with a full queue
+        self.queue.put(self._sentinel)
+
+
+class LoggingSetup:
+    """Root logger -> sampler -> bounded queue -> writer thread -> JSON lines on `stream`."""
+
+    def __init__(self):
+        self.queue = None
+        self.handler = None
+        self.sampler = None
+        self.listener = None
+
+    def configure(self, stream=None, level: str = LOG_LEVEL, levels: str = LOG_LEVELS,
+                  queue_size: int = LOG_QUEUE_SIZE, debug_sample_every: int = LOG_DEBUG_SAMPLE_EVERY) -> None:
+        """Install the handler on the root logger. Calling it again replaces the previous setup."""
+        self.shutdown()
+        writer = logging.StreamHandler(stream or sys.stdout)
+        writer.setFormatter(JsonFormatter())
+        self.queue = queue.Queue(queue_size)
+        self.sampler = DebugSampler(debug_sample_every)
+        self.handler = NonBlockingQueueHandler(self.queue)
+        self.handler.addFilter(self.sampler)
+        root = logging.getLogger()
+        root.handlers = [self.handler]
+        root.setLevel(level)
+        for override in filter(None, (part.strip() for part in f"{DEFAULT_LOGGER_LEVELS},{levels}".split(","))):
+            name, _, logger_level = override.partition("=")
+            logging.getLogger(name.strip()).setLevel(logger_level.strip().upper())
+        # uvicorn installs its own stream handlers, which write synchronously on the event loop;
+        # send its error and access logs through the queue instead
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            logging.getLogger(name).handlers = []
+            logging.getLogger(name).propagate = True
+        self.listener = _QueueListener(self.queue, writer)
+        self.listener.start()
+
+    def shutdown(self) -> None:
+        """Write out what is queued and stop the writer thread."""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def stats(self) -> dict:
+        if self.handler is None:
+            return {"configured": False}
+        return {
+            "queued": self.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "debug_sampled_out": self.sampler.sampled_out,
+        }
+
+
+logging_setup = LoggingSetup()
+atexit.register(logging_setup.shutdown)
+
+
+def configure_logging(**kwargs) -> None:
+    logging_setup.configure(**kwargs)
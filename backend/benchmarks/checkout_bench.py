@@ -0,0 +1,134 @@
+"""
+Checking out a 500-line cart: row by row through the ORM (load each line, look up its
+product or service, add an order line, delete the cart item) versus POST /api/cart/checkout,
+which does it with a fixed number of set-based statements and leaves confirmation and
+analytics to the order event queue.
+
+Usage (from the backend directory):
+    python benchmarks/checkout_bench.py
+    python benchmarks/checkout_bench.py --lines 2000 --repeat 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Benchmark against a throwaway SQLite database, never the app's own
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir.name, 'bench.db')}"
+
+import httpx
+from sqlalchemy import event, insert, select
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dependencies
+import main
+import models
+from database import async_engine, engine, SessionLocal
+
+HEADERS = {"Authorization": "Bearer demo_token_for_user"}
+statements = []
+
+
+def count_statements(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+
+def setup_database(lines):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        dependencies.bootstrap_demo_principals(db)
+    finally:
+        db.close()
+    customer = dependencies.demo_principals["demo_token_for_user"]
+    with engine.begin() as connection:
+        connection.execute(insert(models.Product), [
+            {"name": f"Product {n}", "price": 100 + n, "company_id": customer.company_id} for n in range(lines // 2)
+        ])
+        connection.execute(insert(models.Service), [
+            {"name": f"Service {n}", "price": 1000 + n, "period": "monthly", "company_id": customer.company_id}
+            for n in range(lines - lines // 2)
+        ])
+    return customer
+
+
+def fill_cart(customer):
+    now = datetime.now().isoformat()
+    with engine.begin() as connection:
+        product_ids = connection.scalars(select(models.Product.id)).all()
+        service_ids = connection.scalars(select(models.Service.id)).all()
+        connection.execute(insert(models.CartItem), [
+            {"user_id": customer.id, "product_id": product_id, "service_id": None, "quantity": 2, "added_at": now}
+            for product_id in product_ids
+        ] + [
+            {"user_id": customer.id, "product_id": None, "service_id": service_id, "quantity": 1, "added_at": now}
+            for service_id in service_ids
+        ])
+
+
+def row_by_row_checkout(customer):
+    db = SessionLocal()
+    try:
+        order = models.Order(user_id=customer.id, company_id=customer.company_id, total=0,
+                             created_at=datetime.now().isoformat())
+        db.add(order)
+        for item in db.query(models.CartItem).filter(models.CartItem.user_id == customer.id).all():
+            catalog = item.product if item.product_id else item.service
+            order.lines.append(models.OrderLine(product_id=item.product_id, service_id=item.service_id, name=catalog.name,
+                                                unit_price=catalog.price, period=getattr(catalog, "period", None),
+                                                quantity=item.quantity))
+            order.total += (catalog.price or 0) * item.quantity
+            db.delete(item)
+        db.commit()
+        return order.total
+    finally:
+        db.close()
+
+
+async def endpoint_checkout(client):
+    response = await client.post("/api/cart/checkout", headers=HEADERS)
+    response.raise_for_status()
+    return response.json()["total"]
+
+
+async def bench(args, customer):
+    totals = set()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        calls = {
+            "row by row": lambda: asyncio.get_running_loop().run_in_executor(None, row_by_row_checkout, customer),
+            "checkout endpoint": lambda: endpoint_checkout(client),
+        }
+        for name, call in calls.items():
+            samples, counts = [], []
+            for _ in range(args.repeat):
+                fill_cart(customer)
+                del statements[:]
+                start = time.perf_counter()
+                totals.add(await call())
+                samples.append(time.perf_counter() - start)
+                counts.append(len(statements))
+            print(f"{name:>17}: p50 {statistics.median(samples) * 1000:8.2f} ms  max {max(samples) * 1000:8.2f} ms  "
+                  f"{max(counts)} statements")
+        await main.order_events.shutdown()
+    assert len(totals) == 1, f"both checkouts should produce the same order total, got {totals}"
+    print(f"order total {totals.pop()} cents, {main.order_events.stats()['processed']} order events processed")
+
+
+def run(args):
+    customer = setup_database(args.lines)
+    event.listen(engine, "before_cursor_execute", count_statements)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_statements)
+    print(f"Checking out a {args.lines}-line cart, {args.repeat} times per mode")
+    asyncio.run(bench(args, customer))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=10)
+    run(parser.parse_args())
@@ -0,0 +1,76 @@
+"""
+Requests/sec for GET /api/products/ with demo tokens.
+
+"before" re-provisions the demo accounts on every request (four SELECTs, which is what
+get_current_user used to do per demo-token request); "after" serves the principal from
+the in-memory table filled at startup.
+
+Keep --concurrency below the engine's pool size (5 + 10 overflow): the "before" path runs
+synchronous queries inside an async dependency, which blocks the event loop while other
+requests hold every pooled connection.
+
+Usage (from the backend directory):
+    python benchmarks/demo_auth_bench.py
+    python benchmarks/demo_auth_bench.py --requests 5000 --concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Benchmark against a throwaway SQLite database, never the app's own
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir.name, 'bench.db')}"
+
+import httpx
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dependencies
+import main
+import models
+from database import engine, SessionLocal
+
+TOKENS = list(dependencies.DEMO_USERS)
+
+
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        dependencies.bootstrap_demo_principals(db)
+        company_id = dependencies.demo_principals["demo_token_for_admin"].company_id
+        db.add_all(models.Product(name=f"Product {n}", price=n * 100, company_id=company_id) for n in range(20))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def run(mode, total, concurrency):
+    transport = httpx.ASGITransport(app=main.app)
+    remaining = iter(range(total))
+
+    async def worker(client):
+        for n in remaining:
+            if mode == "before":
+                dependencies.demo_principals.clear()  # Force the per-request provisioning path
+            response = await client.get("/api/products/", headers={"Authorization": f"Bearer {TOKENS[n % len(TOKENS)]}"})
+            response.raise_for_status()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    print(f"{mode:>6}: {total / elapsed:8.1f} req/s ({total} requests, concurrency {concurrency})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    setup_database()
+    asyncio.run(run("before", args.requests, args.concurrency))
+    dependencies.init_demo_principals()
+    asyncio.run(run("after", args.requests, args.concurrency))
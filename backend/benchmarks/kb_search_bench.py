@@ -0,0 +1,69 @@
+"""
+Query latency benchmark for the BM25 knowledge base index.
+
+Usage (from the backend directory):
+    python benchmarks/kb_search_bench.py                # 10k, 100k and 1M documents
+    python benchmarks/kb_search_bench.py 10000 50000    # custom corpus sizes
+"""
+import itertools
+import random
+import statistics
+import sys
+import os
+import time
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from kb_index import KnowledgeBaseIndex
+
+VOCABULARY_SIZE = 50_000
+WORDS_PER_DOC = 24
+QUERIES = 500
+# Real support queries mix very common words with rarer, specific ones
+COMMON_WORDS = ["order", "refund", "account", "password", "shipping", "support", "product", "billing"]
+
+def make_vocabulary(rng):
+    return [f"w{n}" for n in range(VOCABULARY_SIZE)] + COMMON_WORDS
+
+def make_documents(n_docs, vocabulary, rng):
+    # Zipf-like word distribution so postings lists have realistic skew
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(vocabulary))))
+    for doc_id in range(n_docs):
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=WORDS_PER_DOC)
+        yield {
+            "type": "faq",
+            "id": f"faq_{doc_id}",
+            "question": " ".join(words[:8]),
+            "answer": " ".join(words[8:]),
+        }
+
+def make_queries(vocabulary, rng):
+    queries = []
+    for _ in range(QUERIES):
+        words = [rng.choice(COMMON_WORDS)] + rng.sample(vocabulary[:5_000], 2)
+        queries.append(" ".join(words))
+    return queries
+
+def run(n_docs):
+    rng = random.Random(n_docs)
+    vocabulary = make_vocabulary(rng)
+    index = KnowledgeBaseIndex()
+
+    start = time.perf_counter()
+    index.add_many(make_documents(n_docs, vocabulary, rng))
+    build_seconds = time.perf_counter() - start
+
+    latencies = []
+    for query in make_queries(vocabulary, rng):
+        start = time.perf_counter()
+        index.search(query, top_k=3)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{n_docs:>10,} docs | build {build_seconds:7.2f}s | p50 {p50:8.3f} ms | p99 {p99:8.3f} ms")
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,123 @@
+"""
+Chat turns while the LLM provider is degraded: a fixed client timeout versus adaptive
+timeouts with a circuit breaker.
+
+A stub provider answers in --latency for --warmup turns, then stops answering in time
+(every request takes --degraded-latency). Chat turns keep arriving at --rate per second.
+With only the fixed timeout (LLM_REQUEST_TIMEOUT, shortened here with --fixed-timeout so
+the run stays short), every turn holds a provider connection and a coroutine until that
+timeout, and the pile-up spills into the gateway queue. With the breaker, calls time out
+after a multiple of the provider's recent latency, the circuit opens after
+LLM_BREAKER_MIN_CALLS failures, and later turns get a knowledge base answer at once.
+
+Usage (from the backend directory):
+    python benchmarks/llm_breaker_bench.py
+    python benchmarks/llm_breaker_bench.py --fixed-timeout 30 --rate 10 --duration 60
+"""
+import argparse
+import asyncio
+import collections
+import os
+import sys
+import tempfile
+import time
+
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stub_llm_server import StubLLMServer
+
+DEFAULTS = {}  # breaker settings as configured, restored for the breaker scenario
+
+
+def configure_environment(args):
+    # Benchmark against a throwaway SQLite database, never the app's own
+    tmpdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    os.environ["HUGGINGFACE_API_KEY"] = "bench-key"  # the stub accepts any key
+    os.environ["LLM_HEDGING"] = "false"  # measure the primary alone
+    os.environ["LLM_REQUEST_TIMEOUT"] = str(args.fixed_timeout)
+    os.environ["RESPONSE_CACHE_NEAR_DUPLICATES"] = "false"  # every turn below reaches the provider
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, max(0, int(len(ordered) * p / 100 + 0.5) - 1))] if ordered else 0.0
+
+
+async def chat(client, n):
+    started = time.perf_counter()
+    response = await client.post("/api/chat", json={"user_id": f"bench_user_{n}", "message": f"Where is order #{n}?"})
+    elapsed = time.perf_counter() - started
+    if response.status_code != 200:
+        return f"HTTP {response.status_code}", elapsed
+    body = response.json()
+    if body.get("degraded"):
+        return "knowledge base / handoff", elapsed
+    if body.get("error"):
+        return "error response", elapsed
+    return "AI answer", elapsed
+
+
+async def run_scenario(main, server, client, args, label, breaker):
+    import llm_breaker
+    import llm_router
+    # Without the breaker, circuits never open and timeouts stay at the fixed client timeout
+    llm_breaker.LLM_BREAKER_MIN_CALLS = DEFAULTS["min_calls"] if breaker else 10 ** 9
+    llm_router.LLM_TIMEOUT_MIN_SAMPLES = DEFAULTS["min_samples"] if breaker else 10 ** 9
+    main.llm_router = router = llm_router.ProviderRouter("huggingface")
+    router.register("huggingface", main.call_huggingface_ai, main.stream_huggingface_ai)
+
+    server.latency = args.latency
+    for n in range(args.warmup):
+        await chat(client, f"{label}-warmup-{n}")
+
+    server.latency = args.degraded_latency
+    requests_before = server.requests
+    started = time.perf_counter()
+    turns = []
+    for n in range(int(args.rate * args.duration)):
+        turns.append(asyncio.ensure_future(chat(client, f"{label}-{n}")))
+        await asyncio.sleep(1 / args.rate)
+    results = await asyncio.gather(*turns)
+    total = time.perf_counter() - started
+
+    outcomes = collections.Counter(outcome for outcome, _ in results)
+    latencies = sorted(elapsed for _, elapsed in results)
+    provider = router.stats()["providers"]["huggingface"]
+    print(f"{label}: {len(results)} turns in {total:.1f}s | p50 {percentile(latencies, 50):6.2f}s "
+          f"p99 {percentile(latencies, 99):6.2f}s | requests sent to the provider {server.requests - requests_before}")
+    print("    " + ", ".join(f"{name} {count}" for name, count in sorted(outcomes.items()))
+          + f" | circuit {provider['state']}, timeout {provider['timeout_seconds']['complete']}s")
+
+
+async def run(args):
+    async with StubLLMServer(latency=args.latency, tokens=5) as server:
+        os.environ["HUGGINGFACE_API_BASE"] = server.base_url
+        import httpx
+        import llm_breaker
+        import llm_router
+        import main
+        import models
+        from database import engine
+        DEFAULTS.update(min_calls=llm_breaker.LLM_BREAKER_MIN_CALLS, min_samples=llm_router.LLM_TIMEOUT_MIN_SAMPLES)
+        models.Base.metadata.create_all(bind=engine)
+        print(f"Provider degraded to {args.degraded_latency:.0f}s responses after {args.warmup} turns at "
+              f"{args.latency * 1000:.0f} ms; {args.rate:.0f} turns/s for {args.duration:.0f}s")
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench",
+                                     timeout=None) as client:
+            await run_scenario(main, server, client, args, f"fixed {args.fixed_timeout:.0f}s timeout", breaker=False)
+            await run_scenario(main, server, client, args, "adaptive timeout + breaker", breaker=True)
+        await main.llm_clients.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--warmup", type=int, default=30, help="healthy turns before the provider degrades")
+    parser.add_argument("--latency", type=float, default=0.05, help="healthy provider latency in seconds")
+    parser.add_argument("--degraded-latency", type=float, default=120.0, help="degraded provider latency in seconds")
+    parser.add_argument("--fixed-timeout", type=float, default=10.0, help="LLM_REQUEST_TIMEOUT for the run")
+    parser.add_argument("--rate", type=float, default=20.0, help="chat turns per second while degraded")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of degraded traffic")
+    args = parser.parse_args()
+    configure_environment(args)
+    asyncio.run(run(args))
@@ -0,0 +1,81 @@
+"""
+Per-turn latency of LLM provider calls: a fresh httpx client per request (the old
+behaviour, paying a TCP+TLS handshake every turn) versus the shared pooled client
+from llm_clients.
+
+Usage (from the backend directory):
+    python benchmarks/llm_client_bench.py
+    python benchmarks/llm_client_bench.py --turns 500 --concurrency 20 --latency 0.05 --no-tls
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import httpx
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import llm_clients
+from stub_llm_server import StubLLMServer
+
+PATH = "/models/mistralai/Mixtral-8x7B-Instruct-v0.1"
+PAYLOAD = {"inputs": "User: What are your business hours?\n\nAssistant: ", "parameters": {"max_new_tokens": 512}}
+
+
+async def fresh_client_turn(base_url):
+    async with httpx.AsyncClient() as client:
+        response = await client.post(base_url + PATH, json=PAYLOAD, timeout=30.0)
+        response.raise_for_status()
+
+
+async def pooled_client_turn(client):
+    response = await client.post(PATH, json=PAYLOAD)
+    response.raise_for_status()
+
+
+async def measure(turn, turns, concurrency):
+    latencies = []
+    remaining = iter(range(turns))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            await turn()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    latencies.sort()
+    return statistics.median(latencies), latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+
+
+async def main(args):
+    async with StubLLMServer(latency=args.latency, tls=not args.no_tls) as server:
+        if server.cert_path:
+            os.environ["SSL_CERT_FILE"] = server.cert_path  # Trust the stub's self-signed certificate
+        print(f"Stub at {server.base_url}, {args.turns} turns, concurrency {args.concurrency}, "
+              f"model latency {args.latency * 1000:.0f} ms, http2={llm_clients.HTTP2_AVAILABLE}")
+
+        connections = server.connections
+        p50, p99 = await measure(lambda: fresh_client_turn(server.base_url), args.turns, args.concurrency)
+        print(f"before (client per request) | p50 {p50:7.2f} ms | p99 {p99:7.2f} ms | "
+              f"connections {server.connections - connections}")
+
+        client = llm_clients.create_client(server.base_url)
+        connections = server.connections
+        try:
+            p50, p99 = await measure(lambda: pooled_client_turn(client), args.turns, args.concurrency)
+        finally:
+            await client.aclose()
+        print(f"after  (pooled client)      | p50 {p50:7.2f} ms | p99 {p99:7.2f} ms | "
+              f"connections {server.connections - connections}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.02, help="stub model latency in seconds")
+    parser.add_argument("--no-tls", action="store_true", help="plain HTTP instead of HTTPS")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,97 @@
+"""
+A burst of chat turns against a provider with a concurrency rate limit: calls sent straight
+through (gateway limit above the burst) versus queued by the LLM gateway.
+
+The stub provider answers 429 while --provider-limit requests are already in progress, like
+a provider enforcing a rate limit. Unbounded, most of the burst is turned away by the
+provider and surfaces as provider errors; with the gateway at or under the provider's
+limit, the burst queues and drains, and only calls past --queue-size or --queue-timeout are rejected up
+front (429/503 with Retry-After) without ever reaching the provider.
+
+Usage (from the backend directory):
+    python benchmarks/llm_gateway_bench.py
+    python benchmarks/llm_gateway_bench.py --burst 500 --provider-limit 16 --latency 0.1
+"""
+import argparse
+import asyncio
+import collections
+import os
+import sys
+import tempfile
+import time
+
+# Benchmark against a throwaway SQLite database, never the app's own
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir.name, 'bench.db')}"
+os.environ.setdefault("HUGGINGFACE_API_KEY", "bench-key")  # the stub accepts any key
+os.environ["LLM_HEDGING"] = "false"  # measure the gateway alone
+
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stub_llm_server import StubLLMServer
+
+MESSAGES = [
+    {"role": "system", "content": "You are a helpful customer support assistant."},
+    {"role": "user", "content": "What are your business hours?"},
+]
+
+
+async def burst(main, size):
+    from fastapi import HTTPException
+    from llm_gateway import LLMOverloaded
+    outcomes = collections.Counter()
+    latencies = []
+
+    async def turn():
+        started = time.perf_counter()
+        try:
+            await main.call_ai_service(MESSAGES)
+        except LLMOverloaded as e:
+            outcomes[f"gateway {e.status_code}"] += 1
+            return
+        except HTTPException as e:
+            outcomes[f"provider error ({e.status_code})"] += 1
+            return
+        outcomes["ok"] += 1
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(turn() for _ in range(size)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000 if latencies else 0
+    return outcomes, elapsed, p50, p99
+
+
+async def run(args):
+    async with StubLLMServer(latency=args.latency, max_concurrent=args.provider_limit) as server:
+        os.environ["HUGGINGFACE_API_BASE"] = server.base_url
+        import main
+        from llm_gateway import LLMGateway
+        from llm_router import ProviderRouter
+        print(f"Burst of {args.burst} chat turns, provider allows {args.provider_limit} concurrent requests, "
+              f"model latency {args.latency * 1000:.0f} ms")
+        for label, limit in (("unbounded", args.burst), ("gateway", args.gateway_limit)):
+            main.llm_gateway = gateway = LLMGateway(limit, args.queue_size, args.queue_timeout)
+            # A fresh router per run: the unbounded run's provider errors would open the circuit
+            main.llm_router = ProviderRouter("huggingface", gateway=gateway)
+            main.llm_router.register("huggingface", main.call_huggingface_ai, main.stream_huggingface_ai)
+            server.peak_in_progress = server.rate_limited = 0
+            outcomes, elapsed, p50, p99 = await burst(main, args.burst)
+            summary = ", ".join(f"{name} {count}" for name, count in sorted(outcomes.items()))
+            print(f"{label:>9} (limit {limit:4}) | {summary} | {elapsed:5.2f}s | ok p50 {p50:7.1f} ms, "
+                  f"p99 {p99:7.1f} ms | provider peak {server.peak_in_progress}, 429s {server.rate_limited}")
+        await main.llm_clients.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst", type=int, default=200, help="chat turns started at once")
+    parser.add_argument("--provider-limit", type=int, default=8, help="concurrent requests the stub provider allows")
+    parser.add_argument("--gateway-limit", type=int, default=8, help="LLM_MAX_CONCURRENCY for the gateway run")
+    parser.add_argument("--queue-size", type=int, default=256)
+    parser.add_argument("--queue-timeout", type=float, default=10.0)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub model latency in seconds")
+    asyncio.run(run(parser.parse_args()))
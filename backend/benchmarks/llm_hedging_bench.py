@@ -0,0 +1,112 @@
+"""
+Tail latency of chat turns with and without hedging to a secondary provider.
+
+Two stub providers stand in for Hugging Face and Groq. The primary usually answers in
+--latency but takes --slow-latency on a --slow-probability fraction of requests (model cold
+starts); the secondary always answers in --secondary-latency. With hedging, a turn whose
+primary hasn't answered within the router's percentile of recent latencies is also sent to
+the secondary, and the first answer wins. Reports p50/p95/p99 for completions and time to
+first token for streams, the hedge and win rates, and the extra load the hedges cost.
+
+Usage (from the backend directory):
+    python benchmarks/llm_hedging_bench.py
+    python benchmarks/llm_hedging_bench.py --turns 1000 --slow-probability 0.02 --slow-latency 3
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Benchmark against a throwaway SQLite database, never the app's own
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir.name, 'bench.db')}"
+# The stubs accept any key; never send turns to the real providers
+os.environ["HUGGINGFACE_API_KEY"] = "bench-key"
+os.environ["GROQ_API_KEY"] = "bench-key"
+
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stub_llm_server import StubLLMServer
+
+MESSAGES = [
+    {"role": "system", "content": "You are a helpful customer support assistant."},
+    {"role": "user", "content": "What are your business hours?"},
+]
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, max(0, int(len(ordered) * p / 100 + 0.5) - 1))]
+
+
+async def complete_turn(main):
+    await main.call_ai_service(MESSAGES)
+
+
+async def stream_turn(main):
+    # Time to first token: the caller gets the rest of the stream from the same provider
+    stream = main.stream_ai_service(MESSAGES)
+    try:
+        await anext(stream)
+    finally:
+        await stream.aclose()
+
+
+async def measure(main, turn, turns, concurrency):
+    latencies = []
+    remaining = iter(range(turns))
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            await turn(main)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return sorted(latencies)
+
+
+async def run(args):
+    primary = StubLLMServer(latency=args.latency, slow_probability=args.slow_probability,
+                            slow_latency=args.slow_latency, seed=args.seed)
+    secondary = StubLLMServer(latency=args.secondary_latency)
+    async with primary, secondary:
+        os.environ["HUGGINGFACE_API_BASE"] = primary.base_url
+        os.environ["GROQ_API_BASE"] = secondary.base_url
+        import main
+        from llm_router import MODE_COMPLETE, MODE_STREAM, ProviderRouter
+        print(f"{args.turns} turns per run, concurrency {args.concurrency}; primary {args.latency * 1000:.0f} ms, "
+              f"{args.slow_probability:.0%} at {args.slow_latency * 1000:.0f} ms; "
+              f"secondary {args.secondary_latency * 1000:.0f} ms")
+        for mode, turn, label in ((MODE_COMPLETE, complete_turn, "completion"), (MODE_STREAM, stream_turn, "first token")):
+            for hedging in (False, True):
+                router = ProviderRouter("huggingface", "groq" if hedging else None, percentile=args.percentile)
+                router.register("huggingface", main.call_huggingface_ai, main.stream_huggingface_ai)
+                router.register("groq", main.call_groq_ai, main.stream_groq_ai)
+                main.llm_router = router
+                await measure(main, turn, args.warmup, args.concurrency)  # fill the latency window
+                primary_requests, secondary_requests = primary.requests, secondary.requests
+                latencies = await measure(main, turn, args.turns, args.concurrency)
+                stats = router.stats()["modes"][mode]
+                extra = (secondary.requests - secondary_requests) / args.turns
+                print(f"{label:>11} {'hedged' if hedging else 'primary':>8} | p50 {percentile(latencies, 50) * 1000:7.1f} ms"
+                      f" | p95 {percentile(latencies, 95) * 1000:7.1f} ms | p99 {percentile(latencies, 99) * 1000:7.1f} ms"
+                      f" | hedge rate {stats['hedge_rate']:.1%}, secondary won {stats['win_rate']:.0%}"
+                      f" | extra requests {extra:.1%}, hedge delay {stats['hedge_delay_seconds'] * 1000:.0f} ms")
+        await main.llm_clients.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=400)
+    parser.add_argument("--warmup", type=int, default=50, help="turns run first to fill the latency window")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="primary latency in seconds")
+    parser.add_argument("--slow-probability", type=float, default=0.05, help="fraction of primary cold starts")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="primary cold-start latency in seconds")
+    parser.add_argument("--secondary-latency", type=float, default=0.15, help="secondary latency in seconds")
+    parser.add_argument("--percentile", type=float, default=95.0, help="LLM_HEDGE_PERCENTILE")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
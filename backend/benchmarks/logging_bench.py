@@ -0,0 +1,134 @@
+"""
+Requests/sec of a chat-like handler that logs 15 lines per request, with stdout piped to a
+slow consumer (a log shipper that can't keep up): print() versus the queue-backed JSON
+logger from app_logging.
+
+Each mode runs in a child process whose stdout the parent drains in small, delayed reads.
+With print(), once the pipe buffer fills every write blocks the event loop and throughput
+collapses to the consumer's pace. With the logger, handlers only enqueue; the writer thread
+is the one that waits, and when the queue is full records are dropped and counted.
+
+Usage (from the backend directory):
+    python benchmarks/logging_bench.py
+    python benchmarks/logging_bench.py --duration 5 --concurrency 50 --read-delay 0.005
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+LINES_PER_REQUEST = 15
+
+
+def build_app(mode):
+    from fastapi import FastAPI
+    import logging
+    from app_logging import configure_logging
+
+    app = FastAPI()
+    logger = logging.getLogger("bench.chat")
+    if mode == "logging":
+        configure_logging(level="INFO")
+    elif mode == "logging-debug":
+        configure_logging(level="DEBUG", debug_sample_every=10)
+
+    @app.post("/chat")
+    async def chat(payload: dict):
+        user_id, message = payload["user_id"], payload["message"]
+        for step in range(LINES_PER_REQUEST):
+            if mode == "print":
+                print(f"Chat step {step} for user {user_id}: '{message[:50]}'")
+            elif mode == "logging":
+                logger.info("Chat step %s for user %s: '%s'", step, user_id, message[:50], extra={"user_id": user_id})
+            else:
+                logger.debug("Chat step %s for user %s: '%s'", step, user_id, message[:50], extra={"user_id": user_id})
+        await asyncio.sleep(0)
+        return {"response": "ok"}
+
+    return app
+
+
+async def drive(app, duration, concurrency):
+    import httpx
+    completed = 0
+    deadline = time.perf_counter() + duration
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def worker(n):
+            nonlocal completed
+            while time.perf_counter() < deadline:
+                response = await client.post("/chat", json={"user_id": f"user{n}", "message": "Where is my order? " * 4})
+                response.raise_for_status()
+                completed += 1
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        return completed, time.perf_counter() - started
+
+
+def child(args):
+    # Add the backend directory to sys.path
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    app = build_app(args.mode)
+    completed, elapsed = asyncio.run(drive(app, args.duration, args.concurrency))
+    from app_logging import logging_setup
+    result = {"requests": completed, "seconds": elapsed, "logging": logging_setup.stats()}
+    # Results go to stderr: stdout is the throttled log pipe
+    sys.stderr.write(json.dumps(result) + "\n")
+    sys.stderr.flush()
+    os._exit(0)  # don't wait for the slow consumer to drain what is still queued
+
+
+def run_mode(mode, args):
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--mode", mode,
+               "--duration", str(args.duration), "--concurrency", str(args.concurrency)]
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    drained = [0]
+
+    def slow_consumer():
+        while True:
+            chunk = process.stdout.read1(args.read_bytes)
+            if not chunk:
+                break
+            drained[0] += len(chunk)
+            time.sleep(args.read_delay)
+
+    reader = threading.Thread(target=slow_consumer, daemon=True)
+    reader.start()
+    stderr = process.stderr.read().decode()
+    process.wait()
+    lines = [line for line in stderr.splitlines() if line.startswith("{")]
+    if process.returncode or not lines:
+        raise SystemExit(f"{mode} run failed:\n{stderr}")
+    result = json.loads(lines[-1])
+    result["log_bytes_drained"] = drained[0]
+    return result
+
+
+def run(args):
+    consumer_rate = args.read_bytes / args.read_delay / 1024
+    print(f"{LINES_PER_REQUEST} log lines per request, {args.concurrency} concurrent clients for {args.duration}s, "
+          f"stdout drained at ~{consumer_rate:.0f} KiB/s")
+    for mode in ("print", "logging", "logging-debug"):
+        result = run_mode(mode, args)
+        rps = result["requests"] / result["seconds"]
+        extra = ""
+        if mode != "print":
+            stats = result["logging"]
+            extra = f"  dropped {stats['dropped']}, debug sampled out {stats['debug_sampled_out']}"
+        print(f"{mode:>13}: {rps:9.1f} req/s  ({result['requests']} requests){extra}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--read-bytes", type=int, default=4096, help="bytes the slow consumer reads at a time")
+    parser.add_argument("--read-delay", type=float, default=0.01, help="seconds the slow consumer waits between reads")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=("print", "logging", "logging-debug"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    child(args) if args.child else run(args)
@@ -0,0 +1,128 @@
+"""
+Chat latency while a burst of password logins is in flight.
+
+Chat clients send /api/chat turns (answered by a stub LLM server) while `--logins`
+concurrent /api/json-login requests verify bcrypt passwords. "blocking" verifies on the
+event loop, as the login endpoints used to; "pooled" goes through password_hasher's
+bounded worker pool. Chat p50/p99 are reported with no logins and during the storm.
+
+Usage (from the backend directory):
+    python benchmarks/login_storm_bench.py
+    python benchmarks/login_storm_bench.py --logins 50 --chat-clients 10 --workers 2
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Benchmark against a throwaway SQLite database and a stub LLM, never the real ones
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir.name, 'bench.db')}"
+os.environ.setdefault("HUGGINGFACE_API_KEY", "bench")
+os.environ["RESPONSE_CACHE_NEAR_DUPLICATES"] = "false"
+
+import httpx
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import llm_clients
+import main
+import models
+import password_hashing
+from database import engine, SessionLocal
+from stub_llm_server import StubLLMServer
+
+EMAIL = "storm@example.com"
+PASSWORD = "correct horse battery staple"
+_turns = itertools.count()
+
+
+def setup_database():
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.add(models.User(user_id="storm", email=EMAIL, role="Customer",
+                           hashed_password=password_hashing.pwd_context.hash(PASSWORD)))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def chat_turn(client):
+    # A distinct message per turn so the response cache never answers
+    body = {"user_id": "bench", "message": f"What are your business hours? #{next(_turns)}"}
+    start = time.perf_counter()
+    response = await client.post("/api/chat", json=body)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def login(client):
+    response = await client.post("/api/json-login", json={"username": EMAIL, "password": PASSWORD})
+    response.raise_for_status()
+    assert response.json()["access_token"].count(".") == 2, "expected a JWT for the registered user"
+
+
+async def chat_until(client, stop, latencies):
+    while not stop.is_set():
+        latencies.append(await chat_turn(client))
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+    return f"p50 {statistics.median(latencies) * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms  ({len(latencies)} turns)"
+
+
+async def run(mode, args):
+    if mode == "blocking":
+        async def verify(plain_password, hashed_password):
+            return password_hashing.pwd_context.verify(plain_password, hashed_password)
+        main.password_hasher.verify = verify
+    else:
+        main.password_hasher = password_hashing.PasswordHasher(max_workers=args.workers)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60.0) as client:
+        # Quiet period: chat traffic only
+        stop, quiet = asyncio.Event(), []
+        chatters = [asyncio.create_task(chat_until(client, stop, quiet)) for _ in range(args.chat_clients)]
+        await asyncio.sleep(args.quiet_seconds)
+        stop.set()
+        await asyncio.gather(*chatters)
+
+        # Storm: the same chat traffic while the logins run
+        stop, storm = asyncio.Event(), []
+        chatters = [asyncio.create_task(chat_until(client, stop, storm)) for _ in range(args.chat_clients)]
+        start = time.perf_counter()
+        await asyncio.gather(*(login(client) for _ in range(args.logins)))
+        login_seconds = time.perf_counter() - start
+        stop.set()
+        await asyncio.gather(*chatters)
+
+    print(f"{mode:>8}: no logins  {percentiles(quiet)}")
+    print(f"{mode:>8}: {args.logins} logins {percentiles(storm)}  logins took {login_seconds:.2f} s")
+
+
+async def bench(args):
+    async with StubLLMServer(latency=args.latency) as server:
+        llm_clients.PROVIDER_BASE_URLS["huggingface"] = server.base_url
+        for mode in ("blocking", "pooled"):
+            await run(mode, args)
+        await llm_clients.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--chat-clients", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=password_hashing.settings.PASSWORD_HASH_WORKERS)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub LLM response time in seconds")
+    parser.add_argument("--quiet-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+    setup_database()
+    asyncio.run(bench(args))
@@ -0,0 +1,140 @@
+"""
+Cost of the metrics instrumentation relative to a real request.
+
+Times the per-request work HTTPMetricsMiddleware adds (around a no-op ASGI app) and the
+per-call cost of Histogram.observe / Counter.inc, single-threaded and from several threads
+at once, then compares the middleware plus the statement timers of a request against the
+median latency of GET /api/products/ through the full app. Exits with status 1 if the
+instrumentation exceeds --max-overhead percent of that request.
+
+Usage (from the backend directory):
+    python benchmarks/metrics_overhead_bench.py
+    python benchmarks/metrics_overhead_bench.py --requests 5000 --max-overhead 1
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# Benchmark against a throwaway SQLite database, never the app's own
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir.name, 'bench.db')}"
+os.environ.setdefault("CATALOG_CACHE_BACKEND", "none")  # every request reaches the database
+
+import httpx
+from sqlalchemy import insert
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dependencies
+import main
+import metrics
+import models
+from database import engine, SessionLocal
+
+HEADERS = {"Authorization": "Bearer demo_token_for_user"}
+
+
+def setup_database(products):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        dependencies.bootstrap_demo_principals(db)
+    finally:
+        db.close()
+    company_id = dependencies.demo_principals["demo_token_for_user"].company_id
+    with engine.begin() as connection:
+        connection.execute(insert(models.Product), [
+            {"name": f"Product {n}", "price": 100 + n, "company_id": company_id} for n in range(products)
+        ])
+
+
+def per_call_ns(func, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls * 1e9
+
+
+def threaded_ns(func, calls, threads):
+    def run():
+        for _ in range(calls):
+            func()
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - started) / (calls * threads) * 1e9
+
+
+async def middleware_ns(requests):
+    async def noop_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "GET", "path": "/bench", "root_path": ""}
+    samples = {}
+    for name, app in (("bare", noop_app), ("instrumented", metrics.HTTPMetricsMiddleware(noop_app))):
+        started = time.perf_counter()
+        for _ in range(requests):
+            await app(dict(scope), receive, send)
+        samples[name] = (time.perf_counter() - started) / requests * 1e9
+    return samples["instrumented"] - samples["bare"]
+
+
+async def request_latency_ns(requests):
+    samples = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = await client.get("/api/products/?limit=20", headers=HEADERS)
+            samples.append(time.perf_counter() - started)
+            response.raise_for_status()
+    return statistics.median(samples) * 1e9
+
+
+def run(args):
+    setup_database(200)
+    histogram = metrics.histogram("bench_observe_seconds", "Benchmark histogram", ("route",))
+    counter = metrics.counter("bench_events_total", "Benchmark counter", ("status",))
+    observe_ns = per_call_ns(lambda: histogram.observe(0.003, "/bench"), args.calls)
+    inc_ns = per_call_ns(lambda: counter.inc("200"), args.calls)
+    clock_ns = per_call_ns(time.perf_counter, args.calls)
+    threaded_observe_ns = threaded_ns(lambda: histogram.observe(0.003, "/bench"), args.calls // args.threads, args.threads)
+    print(f"Histogram.observe      {observe_ns:7.0f} ns/call  ({threaded_observe_ns:.0f} ns/call across {args.threads} threads)")
+    print(f"Counter.inc            {inc_ns:7.0f} ns/call")
+
+    middleware = asyncio.run(middleware_ns(args.requests))
+    print(f"HTTPMetricsMiddleware  {middleware:7.0f} ns/request")
+
+    latency = asyncio.run(request_latency_ns(args.requests))
+    queries_per_request = 1
+    # Each statement is timed with two perf_counter() calls and one observe() in the engine events
+    instrumentation = middleware + queries_per_request * (observe_ns + 2 * clock_ns)
+    overhead = instrumentation / latency * 100
+    print(f"GET /api/products/     {latency / 1000:7.1f} us median; instrumentation {instrumentation / 1000:.1f} us "
+          f"= {overhead:.2f}% of the request")
+    if overhead > args.max_overhead:
+        print(f"FAIL: instrumentation overhead {overhead:.2f}% exceeds {args.max_overhead}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--calls", type=int, default=200000, help="calls per metric micro-benchmark")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--max-overhead", type=float, default=1.0, help="allowed overhead in percent")
+    sys.exit(run(parser.parse_args()))
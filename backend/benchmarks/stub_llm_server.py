@@ -0,0 +1,224 @@
+"""
+Local stand-in for the LLM providers, used by the benchmarks.
+
+Speaks just enough HTTP/1.1 (keep-alive, chunked responses) to answer:
+    POST /models/{model_id}          Hugging Face text-generation API
+    POST /v1/chat/completions        OpenAI-compatible chat API (Groq)
+Both honor "stream": true and reply with Server-Sent Events, one token per event.
+
+Run standalone and point the app at it:
+    python benchmarks/stub_llm_server.py --port 9100 --latency 0.3
+    HUGGINGFACE_API_BASE=http://127.0.0.1:9100 uvicorn main:app
+"""
+import argparse
+import asyncio
+import datetime
+import ipaddress
+import json
+import os
+import random
+import ssl
+import tempfile
+
+
+def make_self_signed_cert(directory: str):
+    """Write a throwaway certificate for 127.0.0.1 and return (cert_path, key_path)."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "stub-cert.pem")
+    key_path = os.path.join(directory, "stub-key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+class StubLLMServer:
+    """
+    Args:
+        latency: seconds before the first byte of a response (model "thinking" time)
+        tokens: number of tokens in every completion
+        token_interval: seconds between streamed tokens
+        tls: serve HTTPS with a self-signed certificate; `cert_path` can be fed to SSL_CERT_FILE
+        status_code: non-200 status to inject failures
+        max_concurrent: answer 429 while this many requests are already in progress (a rate limit)
+        slow_probability, slow_latency: the chance that a request takes `slow_latency` instead
+            of `latency` (a model cold start)
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, tokens=20, token_interval=0.0,
+                 tls=False, status_code=200, max_concurrent=None, slow_probability=0.0, slow_latency=None,
+                 seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.tokens = tokens
+        self.token_interval = token_interval
+        self.tls = tls
+        self.status_code = status_code
+        self.max_concurrent = max_concurrent
+        self.slow_probability = slow_probability
+        self.slow_latency = slow_latency
+        self._random = random.Random(seed)
+        self.in_progress = 0
+        self.peak_in_progress = 0
+        self.rate_limited = 0
+        self.cert_path = None
+        self.requests = 0
+        self.connections = 0
+        self._server = None
+        self._tmpdir = None
+
+    @property
+    def base_url(self) -> str:
+        scheme = "https" if self.tls else "http"
+        return f"{scheme}://{self.host}:{self.port}"
+
+    async def start(self):
+        ssl_context = None
+        if self.tls:
+            self._tmpdir = tempfile.TemporaryDirectory()
+            self.cert_path, key_path = make_self_signed_cert(self._tmpdir.name)
+            ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            ssl_context.load_cert_chain(self.cert_path, key_path)
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, ssl=ssl_context)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def _completion_tokens(self):
+        return [f"token{n} " for n in range(self.tokens)]
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, value = line.decode().split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+                await self._respond(writer, path, json.loads(body or b"{}"))
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, path, payload):
+        if self.max_concurrent is not None and self.in_progress >= self.max_concurrent:
+            self.rate_limited += 1
+            body = json.dumps({"error": "rate limit exceeded"}).encode()
+            writer.write(f"HTTP/1.1 429 Too Many Requests\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            return
+        self.in_progress += 1
+        self.peak_in_progress = max(self.peak_in_progress, self.in_progress)
+        try:
+            await self._respond_admitted(writer, path, payload)
+        finally:
+            self.in_progress -= 1
+
+    async def _respond_admitted(self, writer, path, payload):
+        slow = self.slow_latency is not None and self._random.random() < self.slow_probability
+        await asyncio.sleep(self.slow_latency if slow else self.latency)
+        if self.status_code != 200:
+            body = json.dumps({"error": "injected failure"}).encode()
+            writer.write(f"HTTP/1.1 {self.status_code} Error\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            return
+
+        openai_style = path.endswith("/chat/completions")
+        tokens = self._completion_tokens()
+        if payload.get("stream"):
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+            for token in tokens:
+                if openai_style:
+                    event = {"choices": [{"delta": {"content": token}}]}
+                else:
+                    event = {"token": {"text": token}}
+                self._write_chunk(writer, f"data: {json.dumps(event)}\n\n".encode())
+                await writer.drain()
+                if self.token_interval:
+                    await asyncio.sleep(self.token_interval)
+            if openai_style:
+                self._write_chunk(writer, b"data: [DONE]\n\n")
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+            return
+
+        text = "".join(tokens).strip()
+        if openai_style:
+            body = {"choices": [{"message": {"role": "assistant", "content": text}}]}
+        else:
+            body = [{"generated_text": payload.get("inputs", "") + text}]
+        encoded = json.dumps(body).encode()
+        writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(encoded)}\r\n\r\n".encode() + encoded)
+        await writer.drain()
+
+    @staticmethod
+    def _write_chunk(writer, data: bytes):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+
+async def _serve_forever(args):
+    server = await StubLLMServer(port=args.port, latency=args.latency, tokens=args.tokens,
+                                 token_interval=args.token_interval).start()
+    print(f"Stub LLM server listening on {server.base_url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    try:
+        asyncio.run(_serve_forever(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,289 @@
+import os
+import time
+from abc import ABC, abstractmethod
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+import metrics
+from database import READ_YOUR_WRITES_SECONDS, replica_engines
+from pagination import PageParams, set_next_page_headers, split_page
+from ttl_cache import TTLCache
+
+# Which CatalogCacheBackend serves the product and service reads: memory, redis or none
+CATALOG_CACHE_BACKEND = os.getenv("CATALOG_CACHE_BACKEND", "memory").lower()
+CATALOG_CACHE_MAX_ENTRIES = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", "20000"))
+# Writes through the API invalidate right away; the TTL bounds staleness after out-of-band edits (seed scripts, SQL)
+# and, for the memory backend, in the other workers, which never see another worker's invalidations
+CATALOG_CACHE_TTL_SECONDS = float(os.getenv("CATALOG_CACHE_TTL_SECONDS", "3600" if CATALOG_CACHE_BACKEND == "redis" else "60"))
+# After a write, misses are served but not cached for this long: they may come from a replica that hasn't caught up
+CATALOG_CACHE_REFILL_DELAY_SECONDS = float(os.getenv(
+    "CATALOG_CACHE_REFILL_DELAY_SECONDS", str(READ_YOUR_WRITES_SECONDS if replica_engines else 0)))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+lookup_duration = metrics.histogram(
+    "catalog_cache_lookup_seconds", "Time to answer a catalog read, by router and cache result", ("router", "result"))
+
+
+class CatalogCacheBackend(ABC):
+    """
+    Encoded catalog responses of one tenant's catalog (`kind` is "products" or "services").
+
+    Pages are keyed by "limit:cursor", items by id. Each (kind, company_id) also has a
+    generation that every write bumps: a reader takes the generation before querying the
+    database and its result is only stored if no write happened meanwhile, so a slow read
+    can't put back what a concurrent write just invalidated. Nothing is stored either for
+    `refill_delay` seconds after a write, while replicas may still return the old rows.
+    """
+
+    @abstractmethod
+    async def get_page(self, kind: str, company_id: int, page_key: str) -> bytes | None:
+        """The cached page, or None."""
+
+    @abstractmethod
+    async def get_item(self, kind: str, company_id: int, item_id: int) -> bytes | None:
+        """The cached item, or None."""
+
+    @abstractmethod
+    async def generation(self, kind: str, company_id: int) -> int:
+        """Number of writes to this catalog so far."""
+
+    @abstractmethod
+    async def set_page(self, kind: str, company_id: int, page_key: str, value: bytes, generation: int) -> None:
+        """Cache a page read at `generation`, unless the catalog has been written since."""
+
+    @abstractmethod
+    async def set_item(self, kind: str, company_id: int, item_id: int, value: bytes, generation: int) -> None:
+        """Cache an item read at `generation`, unless the catalog has been written since."""
+
+    @abstractmethod
+    async def invalidate(self, kind: str, company_id: int, item_id: int | None = None) -> None:
+        """
+        After a write: bump the generation and drop every page of this catalog (a create,
+        update or delete can change any page's contents or boundaries) and the written item.
+        Other tenants' and other catalogs' entries are untouched.
+        """
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__}
+
+
+class InMemoryCatalogCacheBackend(CatalogCacheBackend):
+    """
+    Process-local LRU with a TTL, for a single worker. With several workers each has its own
+    copy and only the worker that handled a write invalidates it: the others serve the old
+    data until the TTL (60 s by default for this backend) expires. Use redis there.
+    """
+
+    def __init__(self, max_entries: int = CATALOG_CACHE_MAX_ENTRIES, ttl_seconds: float = CATALOG_CACHE_TTL_SECONDS,
+                 refill_delay: float = CATALOG_CACHE_REFILL_DELAY_SECONDS):
+        self._entries = TTLCache(max_entries, ttl_seconds)  # (kind, company_id, "page" | "item", key) -> bytes
+        self._generations = {}  # (kind, company_id) -> int
+        self._written_at = {}  # (kind, company_id) -> time.monotonic() of the last write
+        self.refill_delay = refill_delay
+
+    async def get_page(self, kind: str, company_id: int, page_key: str) -> bytes | None:
+        return self._entries.get((kind, company_id, "page", page_key))
+
+    async def get_item(self, kind: str, company_id: int, item_id: int) -> bytes | None:
+        return self._entries.get((kind, company_id, "item", item_id))
+
+    async def generation(self, kind: str, company_id: int) -> int:
+        return self._generations.get((kind, company_id), 0)
+
+    def _can_store(self, kind: str, company_id: int, generation: int) -> bool:
+        written_at = self._written_at.get((kind, company_id))
+        if written_at is not None and time.monotonic() - written_at < self.refill_delay:
+            return False
+        return self._generations.get((kind, company_id), 0) == generation
+
+    async def set_page(self, kind: str, company_id: int, page_key: str, value: bytes, generation: int) -> None:
+        if self._can_store(kind, company_id, generation):
+            self._entries.set((kind, company_id, "page", page_key), value)
+
+    async def set_item(self, kind: str, company_id: int, item_id: int, value: bytes, generation: int) -> None:
+        if self._can_store(kind, company_id, generation):
+            self._entries.set((kind, company_id, "item", item_id), value)
+
+    async def invalidate(self, kind: str, company_id: int, item_id: int | None = None) -> None:
+        self._generations[(kind, company_id)] = self._generations.get((kind, company_id), 0) + 1
+        if self.refill_delay:
+            self._written_at[(kind, company_id)] = time.monotonic()
+        self._entries.pop_where(lambda key, value: key[:3] == (kind, company_id, "page"))
+        if item_id is not None:
+            self._entries.pop((kind, company_id, "item", item_id))
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self._entries.stats()}
+
+
+class RedisCatalogCacheBackend(CatalogCacheBackend):
+    """
+    Shared by every worker. A catalog's pages live in one hash, so invalidating them is a
+    single DEL; items are plain keys. Both expire after `ttl_seconds`. Stores WATCH the
+    generation and refill-delay keys, so an invalidation landing between the check and the
+    write aborts the write.
+
+    `client` is any object with the redis-py asyncio API (`redis.asyncio.Redis`, or
+    `fakeredis.aioredis.FakeRedis` for local testing).
+    """
+
+    def __init__(self, client, ttl_seconds: float = CATALOG_CACHE_TTL_SECONDS, key_prefix: str = "catalog:",
+                 refill_delay: float = CATALOG_CACHE_REFILL_DELAY_SECONDS):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.key_prefix = key_prefix
+        self.refill_delay = refill_delay
+
+    def _key(self, kind: str, company_id: int, suffix: str) -> str:
+        return f"{self.key_prefix}{kind}:{company_id}:{suffix}"
+
+    async def get_page(self, kind: str, company_id: int, page_key: str) -> bytes | None:
+        return await self.client.hget(self._key(kind, company_id, "pages"), page_key)
+
+    async def get_item(self, kind: str, company_id: int, item_id: int) -> bytes | None:
+        return await self.client.get(self._key(kind, company_id, f"item:{item_id}"))
+
+    async def generation(self, kind: str, company_id: int) -> int:
+        return int(await self.client.get(self._key(kind, company_id, "generation")) or 0)
+
+    async def _store(self, kind: str, company_id: int, generation: int, write) -> None:
+        """Run `write(pipe)` in a MULTI block if the catalog is still at `generation` and not just written."""
+        from redis.exceptions import WatchError
+        generation_key = self._key(kind, company_id, "generation")
+        written_key = self._key(kind, company_id, "written")
+        async with self.client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(generation_key, written_key)
+                if int(await pipe.get(generation_key) or 0) != generation or await pipe.exists(written_key):
+                    return
+                pipe.multi()
+                write(pipe)
+                await pipe.execute()
+            except WatchError:
+                pass  # a write landed meanwhile; leave this result uncached
+
+    async def set_page(self, kind: str, company_id: int, page_key: str, value: bytes, generation: int) -> None:
+        key = self._key(kind, company_id, "pages")
+
+        def write(pipe):
+            pipe.hset(key, page_key, value)
+            pipe.expire(key, int(self.ttl_seconds))
+        await self._store(kind, company_id, generation, write)
+
+    async def set_item(self, kind: str, company_id: int, item_id: int, value: bytes, generation: int) -> None:
+        key = self._key(kind, company_id, f"item:{item_id}")
+        await self._store(kind, company_id, generation, lambda pipe: pipe.set(key, value, ex=int(self.ttl_seconds)))
+
+    async def invalidate(self, kind: str, company_id: int, item_id: int | None = None) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.incr(self._key(kind, company_id, "generation"))
+            if self.refill_delay:
+                pipe.set(self._key(kind, company_id, "written"), 1, px=max(1, int(self.refill_delay * 1000)))
+            pipe.delete(self._key(kind, company_id, "pages"))
+            if item_id is not None:
+                pipe.delete(self._key(kind, company_id, f"item:{item_id}"))
+            await pipe.execute()
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+class CatalogCache:
+    """
+    Read-through cache of GET /api/products and /api/services responses, pages and single
+    items, stored as the JSON bytes sent to the client so a hit skips both the database and
+    serialization. The routers' write handlers call `invalidate` after committing.
+    """
+
+    def __init__(self, backend: CatalogCacheBackend | None):
+        self.backend = backend
+        self._counts = {}  # router -> {"hits", "misses", "invalidations"}
+
+    def _count(self, router: str, counter: str) -> None:
+        counts = self._counts.setdefault(router, {"hits": 0, "misses": 0, "invalidations": 0})
+        counts[counter] += 1
+
+    async def page(self, kind: str, company_id: int, page: PageParams, request: Request, load_rows,
+                   adapter: TypeAdapter) -> Response:
+        """
+        One page of a catalog list. `load_rows()` runs the page query (limit + 1 rows) on a
+        miss; the next cursor is cached with the body and sent in the usual headers.
+        """
+        started = time.perf_counter()
+        page_key = f"{page.limit}:{page.cursor or ''}"
+        cached = await self.backend.get_page(kind, company_id, page_key) if self.backend else None
+        if cached is None:
+            generation = await self.backend.generation(kind, company_id) if self.backend else 0
+            rows, next_cursor = split_page(await load_rows(), company_id, page)
+            body = adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+            if self.backend:
+                await self.backend.set_page(kind, company_id, page_key, (next_cursor or "").encode() + b"\n" + body,
+                                            generation)
+        else:
+            cursor, _, body = cached.partition(b"\n")
+            next_cursor = cursor.decode() or None
+        response = Response(body, media_type="application/json")
+        set_next_page_headers(response, next_cursor, page, request)
+        self._record(kind, cached is not None, started)
+        return response
+
+    async def item(self, kind: str, company_id: int, item_id: int, load_item, adapter: TypeAdapter) -> Response | None:
+        """A single catalog entry; `load_item()` fetches it on a miss. None if it doesn't exist (not cached)."""
+        started = time.perf_counter()
+        body = await self.backend.get_item(kind, company_id, item_id) if self.backend else None
+        hit = body is not None
+        if not hit:
+            generation = await self.backend.generation(kind, company_id) if self.backend else 0
+            row = await load_item()
+            if row is None:
+                self._record(kind, False, started)
+                return None
+            body = adapter.dump_json(adapter.validate_python(row, from_attributes=True))
+            if self.backend:
+                await self.backend.set_item(kind, company_id, item_id, body, generation)
+        self._record(kind, hit, started)
+        return Response(body, media_type="application/json")
+
+    async def invalidate(self, kind: str, company_id: int, item_id: int | None = None) -> None:
+        self._count(kind, "invalidations")
+        if self.backend:
+            await self.backend.invalidate(kind, company_id, item_id)
+
+    def _record(self, router: str, hit: bool, started: float) -> None:
+        self._count(router, "hits" if hit else "misses")
+        lookup_duration.observe(time.perf_counter() - started, router, "hit" if hit else "miss")
+
+    def stats(self) -> dict:
+        routers = {}
+        for router, counts in self._counts.items():
+            lookups = counts["hits"] + counts["misses"]
+            routers[router] = {**counts, "hit_rate": round(counts["hits"] / lookups, 4) if lookups else 0.0}
+        backend = self.backend.stats() if self.backend else {"backend": "none"}
+        return {**backend, "routers": routers}
+
+
+def create_catalog_cache(backend: str = CATALOG_CACHE_BACKEND) -> CatalogCache:
+    if backend == "memory":
+        return CatalogCache(InMemoryCatalogCacheBackend())
+    if backend == "none":
+        return CatalogCache(None)
+    if backend == "redis":
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as e:
+            raise RuntimeError("CATALOG_CACHE_BACKEND=redis requires the 'redis' package (pip install redis)") from e
+        return CatalogCache(RedisCatalogCacheBackend(redis_asyncio.from_url(REDIS_URL)))
+    raise ValueError(f"Unknown CATALOG_CACHE_BACKEND: {backend!r} (expected memory, redis or none)")
+
+
+_cache = None
+
+
+def get_catalog_cache() -> CatalogCache:
+    """FastAPI dependency returning the process-wide catalog cache."""
+    global _cache
+    if _cache is None:
+        _cache = create_catalog_cache()
+    return _cache
@@ -0,0 +1,234 @@
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from starlette.concurrency import run_in_threadpool
+import models
+from database import SessionLocal
+
+# Max number of messages (user + assistant) kept per conversation for LLM context
+MAX_HISTORY_LEN = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "10"))
+# Which ChatHistoryStore backs the chat endpoints: memory, sql or redis
+CHAT_HISTORY_BACKEND = os.getenv("CHAT_HISTORY_BACKEND", "memory").lower()
+# Conversations idle for longer than this are dropped (memory) or expire (redis)
+CHAT_HISTORY_IDLE_SECONDS = float(os.getenv("CHAT_HISTORY_IDLE_SECONDS", "3600"))
+# Global cap on messages held by the in-memory store, across all conversations
+CHAT_HISTORY_MAX_TOTAL_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_TOTAL_MESSAGES", "200000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class ChatHistoryStore(ABC):
+    """Per-user conversation history, keeping only the newest `max_messages` messages."""
+
+    def __init__(self, max_messages: int = MAX_HISTORY_LEN):
+        self.max_messages = max_messages
+
+    @abstractmethod
+    async def get_messages(self, user_id: str) -> list:
+        """Return the stored messages for a user, oldest first."""
+
+    @abstractmethod
+    async def append(self, user_id: str, message: dict) -> None:
+        """Add a {"role": ..., "content": ...} message, dropping the oldest past `max_messages`."""
+
+    @abstractmethod
+    async def clear(self, user_id: str) -> None:
+        """Forget a user's conversation."""
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__}
+
+
+class InMemoryChatHistoryStore(ChatHistoryStore):
+    """
+    Process-local store. Each conversation is a ring buffer (deque with maxlen); whole
+    conversations are evicted least recently used first when idle for `idle_seconds` or
+    when the total number of messages exceeds `max_total_messages`.
+    """
+
+    def __init__(self, max_messages: int = MAX_HISTORY_LEN, idle_seconds: float = CHAT_HISTORY_IDLE_SECONDS,
+                 max_total_messages: int = CHAT_HISTORY_MAX_TOTAL_MESSAGES):
+        super().__init__(max_messages)
+        self.idle_seconds = idle_seconds
+        self.max_total_messages = max_total_messages
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # user_id -> (deque of messages, last access time), least recent first
+        self._total_messages = 0
+        self.evictions = 0
+
+    async def get_messages(self, user_id: str) -> list:
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            session = self._sessions.get(user_id)
+            if session is None:
+                return []
+            self._sessions.move_to_end(user_id)
+            return list(session[0])
+
+    async def append(self, user_id: str, message: dict) -> None:
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.pop(user_id, None)
+            messages = session[0] if session else deque(maxlen=self.max_messages)
+            if len(messages) < self.max_messages:
+                self._total_messages += 1  # Otherwise the deque drops its oldest message
+            messages.append(message)
+            self._sessions[user_id] = (messages, now)
+            self._evict_idle(now)
+            while self._total_messages > self.max_total_messages and len(self._sessions) > 1:
+                self._evict_oldest()
+
+    async def clear(self, user_id: str) -> None:
+        with self._lock:
+            session = self._sessions.pop(user_id, None)
+            if session:
+                self._total_messages -= len(session[0])
+
+    def _evict_idle(self, now: float) -> None:
+        # Caller must hold the lock; sessions are ordered by last access so stop at the first fresh one
+        while self._sessions:
+            _, last_access = next(iter(self._sessions.values()))
+            if now - last_access < self.idle_seconds:
+                break
+            self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        _, (messages, _) = self._sessions.popitem(last=False)
+        self._total_messages -= len(messages)
+        self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "messages": self._total_messages,
+                "evictions": self.evictions,
+            }
+
+
+class SQLChatHistoryStore(ChatHistoryStore):
+    """Stores messages in the chat_messages table of the application database (created by `alembic upgrade head`)."""
+
+    def __init__(self, max_messages: int = MAX_HISTORY_LEN, session_factory=SessionLocal):
+        super().__init__(max_messages)
+        self.session_factory = session_factory
+
+    async def get_messages(self, user_id: str) -> list:
+        return await run_in_threadpool(self._get_messages, user_id)
+
+    async def append(self, user_id: str, message: dict) -> None:
+        await run_in_threadpool(self._append, user_id, message)
+
+    async def clear(self, user_id: str) -> None:
+        await run_in_threadpool(self._clear, user_id)
+
+    def _get_messages(self, user_id: str) -> list:
+        db = self.session_factory()
+        try:
+            rows = (db.query(models.ChatMessage.role, models.ChatMessage.content)
+                    .filter(models.ChatMessage.user_id == user_id)
+                    .order_by(models.ChatMessage.id.desc())
+                    .limit(self.max_messages)
+                    .all())
+            return [{"role": role, "content": content} for role, content in reversed(rows)]
+        finally:
+            db.close()
+
+    def _append(self, user_id: str, message: dict) -> None:
+        db = self.session_factory()
+        try:
+            db.add(models.ChatMessage(user_id=user_id, role=message["role"], content=message["content"]))
+            db.flush()
+            # Trim to the newest max_messages rows: find the oldest id to keep, delete everything older
+            oldest_kept_id = (db.query(models.ChatMessage.id)
+                              .filter(models.ChatMessage.user_id == user_id)
+                              .order_by(models.ChatMessage.id.desc())
+                              .offset(self.max_messages - 1)
+                              .limit(1)
+                              .scalar())
+            if oldest_kept_id is not None:
+                (db.query(models.ChatMessage)
+                 .filter(models.ChatMessage.user_id == user_id, models.ChatMessage.id < oldest_kept_id)
+                 .delete(synchronize_session=False))
+            db.commit()
+        finally:
+            db.close()
+
+    def _clear(self, user_id: str) -> None:
+        db = self.session_factory()
+        try:
+            db.query(models.ChatMessage).filter(models.ChatMessage.user_id == user_id).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        return {"backend": "sql"}
+
+
+class RedisChatHistoryStore(ChatHistoryStore):
+    """
+    Stores each conversation as a Redis list of JSON messages, shared by every worker.
+
+    `client` is any object with the redis-py asyncio API (`redis.asyncio.Redis`, or
+    `fakeredis.aioredis.FakeRedis` for local testing).
+    """
+
+    def __init__(self, client, max_messages: int = MAX_HISTORY_LEN, idle_seconds: float = CHAT_HISTORY_IDLE_SECONDS,
+                 key_prefix: str = "chat_history:"):
+        super().__init__(max_messages)
+        self.client = client
+        self.idle_seconds = idle_seconds
+        self.key_prefix = key_prefix
+
+    def _key(self, user_id: str) -> str:
+        return f"{self.key_prefix}{user_id}"
+
+    async def get_messages(self, user_id: str) -> list:
+        raw = await self.client.lrange(self._key(user_id), -self.max_messages, -1)
+        return [json.loads(item) for item in raw]
+
+    async def append(self, user_id: str, message: dict) -> None:
+        key = self._key(user_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, json.dumps(message))
+            pipe.ltrim(key, -self.max_messages, -1)
+            pipe.expire(key, int(self.idle_seconds))
+            await pipe.execute()
+
+    async def clear(self, user_id: str) -> None:
+        await self.client.delete(self._key(user_id))
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+def create_chat_history_store(backend: str = CHAT_HISTORY_BACKEND) -> ChatHistoryStore:
+    if backend == "memory":
+        return InMemoryChatHistoryStore()
+    if backend == "sql":
+        return SQLChatHistoryStore()
+    if backend == "redis":
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as e:
+            raise RuntimeError("CHAT_HISTORY_BACKEND=redis requires the 'redis' package (pip install redis)") from e
+        return RedisChatHistoryStore(redis_asyncio.from_url(REDIS_URL))
+    raise ValueError(f"Unknown CHAT_HISTORY_BACKEND: {backend!r} (expected memory, sql or redis)")
+
+
+_store = None
+
+
+def get_chat_history_store() -> ChatHistoryStore:
+    """FastAPI dependency returning the process-wide chat history store."""
+    global _store
+    if _store is None:
+        _store = create_chat_history_store()
+    return _store
@@ -0,0 +1,68 @@
+"""
+Write .br and .gz siblings next to the built frontend assets, for /assets to serve
+precompressed (see frontend_files.PrecompressedStaticFiles). Run after `vite build`;
+build.sh does.
+
+Usage (from the backend directory):
+    python compress_assets.py
+    python compress_assets.py ../frontend/dist/assets --min-bytes 512
+"""
+import argparse
+import gzip
+import os
+import sys
+from frontend_files import ASSETS_DIR, PRECOMPRESSED_SUFFIXES
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Already-compressed formats gain nothing from another pass
+SKIP_EXTENSIONS = {".br", ".gz", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif", ".woff", ".woff2", ".zip", ".mp4"}
+
+
+def compress_file(path: str, min_ratio: float) -> list:
+    """Write the siblings that are at least `min_ratio` smaller than the original; returns their suffixes."""
+    with open(path, "rb") as f:
+        body = f.read()
+    variants = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    written = []
+    for encoding, compressed in variants.items():
+        sibling = path + PRECOMPRESSED_SUFFIXES[encoding]
+        if len(compressed) <= len(body) * (1 - min_ratio):
+            with open(sibling, "wb") as f:
+                f.write(compressed)
+            written.append(PRECOMPRESSED_SUFFIXES[encoding])
+        elif os.path.exists(sibling):
+            os.remove(sibling)  # Stale sibling of an older build
+    return written
+
+
+def main(args) -> int:
+    if not os.path.isdir(args.directory):
+        print(f"Assets directory not found: {args.directory}")
+        return 1
+    if brotli is None:
+        print("brotli is not installed, writing .gz siblings only (pip install brotli)")
+    count = 0
+    for root, _, filenames in os.walk(args.directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            if os.path.splitext(filename)[1].lower() in SKIP_EXTENSIONS or os.path.getsize(path) < args.min_bytes:
+                continue
+            written = compress_file(path, args.min_ratio)
+            if written:
+                count += 1
+                print(f"{os.path.relpath(path, args.directory)}: {', '.join(written)}")
+    print(f"Compressed {count} assets in {args.directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory", nargs="?", default=ASSETS_DIR)
+    parser.add_argument("--min-bytes", type=int, default=1024, help="leave smaller files uncompressed")
+    parser.add_argument("--min-ratio", type=float, default=0.1, help="keep a sibling only if it saves this fraction")
+    sys.exit(main(parser.parse_args()))
@@ -5,6 +5,12 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30 # 30 minutes
     DEMO_MODE: bool = True  # Enable demo mode for easier testing
+    # Auth caches: verified tokens (until their exp) and user principals (short TTL)
+    AUTH_TOKEN_CACHE_SIZE: int = 10000
+    AUTH_USER_CACHE_SIZE: int = 10000
+    AUTH_USER_CACHE_TTL_SECONDS: float = 30.0
+    # bcrypt hashing/verification runs on this many worker threads; extra calls wait in a queue
+    PASSWORD_HASH_WORKERS: int = 4
 
     class Config:
         env_file = ".env"
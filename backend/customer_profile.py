@@ -0,0 +1,135 @@
+import os
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import configure_mappers, joinedload, selectinload
+import models
+from ttl_cache import TTLCache
+
+CUSTOMER_PROFILE_CACHE_SIZE = int(os.getenv("CUSTOMER_PROFILE_CACHE_SIZE", "10000"))
+# Cart writes drop the profile right away; the TTL bounds staleness for everything else
+CUSTOMER_PROFILE_TTL_SECONDS = float(os.getenv("CUSTOMER_PROFILE_TTL_SECONDS", "60"))
+
+# users.id -> profile dict
+customer_profile_cache = TTLCache(CUSTOMER_PROFILE_CACHE_SIZE, CUSTOMER_PROFILE_TTL_SECONDS)
+# (company_id, user_id or email) -> users.id, so a profile looked up either way is dropped with one pop
+customer_profile_ids = TTLCache(CUSTOMER_PROFILE_CACHE_SIZE, CUSTOMER_PROFILE_TTL_SECONDS)
+
+# User.cart_items and ProductQuestion.product are backrefs, which exist once the mappers are configured
+configure_mappers()
+
+
+def customer_profile_select(customer_id: str, company_id: int | None = None):
+    """
+    The user (by user_id, or by email if it contains "@") with everything the profile shows.
+
+    Four queries however big the cart is: the user joined to its company, the cart items
+    joined to their products and services, the questions joined to their products, and
+    the answers to those questions.
+    """
+    column = models.User.email if "@" in customer_id else models.User.user_id
+    query = select(models.User).where(column == customer_id).options(
+        joinedload(models.User.company),
+        selectinload(models.User.cart_items).options(
+            joinedload(models.CartItem.product),
+            joinedload(models.CartItem.service),
+        ),
+        selectinload(models.User.product_questions).options(
+            joinedload(models.ProductQuestion.product),
+            selectinload(models.ProductQuestion.answers),
+        ),
+    )
+    if company_id is not None:
+        query = query.where(models.User.company_id == company_id)
+    return query
+
+
+def _cart_item_details(item: models.CartItem) -> dict:
+    details = {"quantity": item.quantity, "added_at": item.added_at}
+    if item.product is not None:
+        details.update({
+            "type": "product",
+            "id": item.product.id,
+            "name": item.product.name,
+            "description": item.product.description,
+            "price": item.product.price
+        })
+    if item.service is not None:
+        details.update({
+            "type": "service",
+            "id": item.service.id,
+            "name": item.service.name,
+            "description": item.service.description,
+            "price": item.service.price,
+            "period": item.service.period
+        })
+    return details
+
+
+def build_customer_profile(user: models.User) -> dict:
+    """Profile dict of a user loaded with customer_profile_select; touches no lazy relationships."""
+    cart_details = [_cart_item_details(item) for item in user.cart_items]
+    return {
+        "personal_info": {
+            "id": user.id,
+            "user_id": user.user_id,
+            "email": user.email,
+            "role": user.role,
+            "company": user.company.name if user.company else "Unknown Company",
+            "company_id": user.company_id
+        },
+        "cart": {
+            "item_count": len(cart_details),
+            "items": cart_details
+        },
+        "questions": [
+            {
+                "product_name": q.product.name if q.product else "Unknown Product",
+                "question": q.question,
+                "answers": [a.answer for a in q.answers]
+            }
+            for q in user.product_questions
+        ]
+    }
+
+
+async def get_customer_profile(db: AsyncSession, customer_id: str, company_id: int) -> dict | None:
+    """The customer's profile within `company_id`, served from cache when fresh; None if there is no such customer."""
+    key = (company_id, customer_id)
+    user_pk = customer_profile_ids.get(key)
+    profile = customer_profile_cache.get(user_pk) if user_pk is not None else None
+    if profile is None:
+        user = await db.scalar(customer_profile_select(customer_id, company_id))
+        if user is None:
+            return None
+        profile = build_customer_profile(user)
+        customer_profile_cache.set(user.id, profile)
+        customer_profile_ids.set(key, user.id)
+    return profile
+
+
+def invalidate_customer_profile(user_id: int) -> None:
+    """Drop the cached profile of users.id `user_id`, however it was looked up."""
+    customer_profile_cache.pop(user_id)
+
+
+def _format_price(cents):
+    return f"${cents / 100:.2f}" if cents is not None else "n/a"
+
+
+def format_customer_profile(profile: dict) -> str:
+    """Compact plain-text profile for LLM prompts."""
+    info = profile["personal_info"]
+    lines = [f"Customer profile: {info['email']} (user id {info['user_id']}, role {info['role']}, {info['company']})"]
+    items = profile["cart"]["items"]
+    if items:
+        lines.append(f"Cart ({len(items)} items):")
+        for item in items:
+            period = f" {item['period']}" if item.get("period") else ""
+            lines.append(f"- {item['quantity']} x {item.get('name', 'Unknown item')} "
+                         f"({item.get('type', 'item')}, {_format_price(item.get('price'))}{period})")
+    else:
+        lines.append("Cart: empty")
+    for q in profile["questions"]:
+        answers = "; ".join(q["answers"]) if q["answers"] else "unanswered"
+        lines.append(f"Asked about {q['product_name']}: {q['question']} -> {answers}")
+    return "\n".join(lines)
@@ -1,8 +1,17 @@
+import hashlib
+import itertools
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import time
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from dotenv import load_dotenv
 import pathlib
+import metrics
+from ttl_cache import TTLCache
 
 load_dotenv()
 
@@ -13,12 +22,281 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./support.db")
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(DATABASE_URL)
+# Async drivers for the same databases: asyncpg for PostgreSQL, aiosqlite for SQLite
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+def to_async_url(url: str) -> str:
+    """Swap the driver of a sync database URL for its asyncio counterpart."""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {parsed.get_backend_name()!r} databases")
+    parsed = parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}")
+    if driver == "asyncpg" and "sslmode" in parsed.query:
+        # asyncpg takes ssl=... instead of libpq's sslmode=...
+        parsed = parsed.difference_update_query(["sslmode"]).update_query_dict({"ssl": parsed.query["sslmode"]})
+    return parsed.render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+# Named engine profiles; DATABASE_PROFILE picks one, by default the one matching the database.
+# "defaults" is plain create_engine() behaviour. Any setting can be overridden with its DB_* env var.
+ENGINE_PROFILES = {
+    "defaults": {},
+    "sqlite": {
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        "sqlite_journal_mode": "WAL",      # Readers no longer block the writer (or each other)
+        "sqlite_synchronous": "NORMAL",    # Safe with WAL; fsync at checkpoints instead of every commit
+        "sqlite_mmap_size": 256 * 1024 * 1024,
+        "sqlite_busy_timeout_ms": 5000,    # Wait for the write lock instead of failing with "database is locked"
+    },
+    "postgres": {
+        "pool_size": 20,
+        "max_overflow": 20,
+        "pool_timeout": 10,                # Fail a request after 10 s rather than queueing for 30 s
+        "pool_pre_ping": True,             # Drop connections the server or a proxy closed while idle
+        "pool_recycle": 1800,
+        "statement_timeout_ms": 30000,
+    },
+}
+ENGINE_PROFILES["postgresql"] = ENGINE_PROFILES["postgres"]
+
+_ENV_OVERRIDES = {
+    "pool_size": ("DB_POOL_SIZE", int),
+    "max_overflow": ("DB_MAX_OVERFLOW", int),
+    "pool_timeout": ("DB_POOL_TIMEOUT", float),
+    "pool_pre_ping": ("DB_POOL_PRE_PING", lambda value: value.lower() in ("1", "true", "yes")),
+    "pool_recycle": ("DB_POOL_RECYCLE", int),
+    "statement_timeout_ms": ("DB_STATEMENT_TIMEOUT_MS", int),
+    "sqlite_journal_mode": ("SQLITE_JOURNAL_MODE", str),
+    "sqlite_synchronous": ("SQLITE_SYNCHRONOUS", str),
+    "sqlite_mmap_size": ("SQLITE_MMAP_SIZE", int),
+    "sqlite_busy_timeout_ms": ("SQLITE_BUSY_TIMEOUT_MS", int),
+}
+
+def get_engine_profile(url: str = DATABASE_URL, name: str | None = None) -> dict:
+    """Settings of the named profile (DATABASE_PROFILE, else the database's own), with DB_* env overrides applied."""
+    name = (name or os.getenv("DATABASE_PROFILE") or make_url(url).get_backend_name()).lower()
+    if name not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown DATABASE_PROFILE: {name!r} (expected one of {', '.join(ENGINE_PROFILES)})")
+    profile = dict(ENGINE_PROFILES[name])
+    for key, (env_var, parse) in _ENV_OVERRIDES.items():
+        if os.getenv(env_var):
+            profile[key] = parse(os.environ[env_var])
+    return profile
+
+DATABASE_PROFILE = get_engine_profile()
+
+pool_wait = metrics.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection", ("engine",))
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    engine_label = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait.observe(time.perf_counter() - start, self.engine_label)
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    engine_label = "async"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait.observe(time.perf_counter() - start, self.engine_label)
+
+def engine_options(url: str, profile: dict, is_async: bool = False, label: str | None = None) -> dict:
+    """create_engine() keyword arguments for a profile; `label` names the engine in the pool metrics."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    options = {}
+    if backend == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return options  # One in-memory database per connection: leave SQLAlchemy's pool choice alone
+    pool_keys = ("pool_size", "max_overflow", "pool_timeout", "pool_pre_ping", "pool_recycle")
+    options.update({key: profile[key] for key in pool_keys if key in profile})
+    if "pool_size" in options or "max_overflow" in options:
+        poolclass = InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool
+        if label is not None:
+            poolclass = type(poolclass.__name__, (poolclass,), {"engine_label": label})
+        options["poolclass"] = poolclass
+    if backend == "sqlite" and not is_async and options:
+        options["connect_args"] = {"check_same_thread": False}
+    statement_timeout = profile.get("statement_timeout_ms")
+    if backend == "postgresql" and statement_timeout:
+        if is_async:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(statement_timeout)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+    return options
+
+def apply_sqlite_pragmas(sync_engine, profile: dict) -> None:
+    """Set the profile's PRAGMAs on every new SQLite connection."""
+    pragmas = [
+        ("journal_mode", profile.get("sqlite_journal_mode")),
+        ("synchronous", profile.get("sqlite_synchronous")),
+        ("mmap_size", profile.get("sqlite_mmap_size")),
+        ("busy_timeout", profile.get("sqlite_busy_timeout_ms")),
+    ]
+    pragmas = [(name, value) for name, value in pragmas if value is not None]
+    if not pragmas or sync_engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+query_duration = metrics.histogram(
+    "db_query_duration_seconds", "Time to execute each SQL statement, by engine and statement type",
+    ("engine", "operation"), buckets=metrics.FAST_BUCKETS)
+
+_QUERY_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+def instrument_queries(sync_engine, label: str) -> None:
+    """Record every statement's execution time in db_query_duration_seconds."""
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def observe_query(conn, cursor, statement, parameters, context, executemany):
+        words = statement[:16].split(None, 1)
+        operation = words[0].upper() if words else ""
+        query_duration.observe(time.perf_counter() - context._query_started, label,
+                               operation if operation in _QUERY_OPERATIONS else "OTHER")
+
+def create_engines(url: str, async_url: str, label: str = ""):
+    """Sync and async engines for one database, both configured from DATABASE_PROFILE."""
+    sync_label, async_label = (f"{label}-sync", f"{label}-async") if label else ("sync", "async")
+    sync_engine = create_engine(url, **engine_options(url, DATABASE_PROFILE, label=sync_label))
+    apply_sqlite_pragmas(sync_engine, DATABASE_PROFILE)
+    async_engine = create_async_engine(async_url, **engine_options(async_url, DATABASE_PROFILE, is_async=True, label=async_label))
+    apply_sqlite_pragmas(async_engine.sync_engine, DATABASE_PROFILE)
+    instrument_queries(sync_engine, sync_label)
+    instrument_queries(async_engine.sync_engine, async_label)
+    return sync_engine, async_engine
+
+engine, async_engine = create_engines(DATABASE_URL, ASYNC_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay loaded after commit so handlers can return them without another round trip
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
-def get_db():
-    db = SessionLocal()
+# Optional read replicas (comma-separated URLs); GET handlers using get_read_db/get_async_read_db
+# are spread across them round-robin
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# After a client writes, its reads go to the primary for this long so it sees its own changes
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+replica_engines = []  # (label, sync engine, async engine)
+for _index, _url in enumerate(DATABASE_REPLICA_URLS):
+    if _url.startswith("postgres://"):
+        _url = _url.replace("postgres://", "postgresql://", 1)
+    replica_engines.append((f"replica{_index}", *create_engines(_url, to_async_url(_url), f"replica{_index}")))
+ReplicaSessions = [sessionmaker(autocommit=False, autoflush=False, bind=sync) for _, sync, _ in replica_engines]
+AsyncReplicaSessions = [async_sessionmaker(async_, autoflush=False, expire_on_commit=False) for _, _, async_ in replica_engines]
+_replica_turn = itertools.count()
+
+# client key -> True while the client is inside its read-your-writes window
+recent_writers = TTLCache(max_entries=100000, ttl_seconds=READ_YOUR_WRITES_SECONDS)
+
+def client_key(request: Request) -> str:
+    """Identify the caller: its bearer token if it sent one, else its address."""
+    authorization = request.headers.get("authorization")
+    if authorization:
+        return "auth:" + hashlib.sha256(authorization.encode()).hexdigest()
+    return "addr:" + (request.client.host if request.client else "unknown")
+
+@event.listens_for(Session, "after_flush")
+def _remember_writer(session, flush_context):
+    # Runs on the primary before the write is committed, so the client's next read already sticks
+    key = session.info.get("client_key")
+    if key is not None:
+        recent_writers.set(key, True)
+
+def _read_replica_index(request: Request) -> int | None:
+    if not replica_engines or recent_writers.get(client_key(request)):
+        return None
+    return next(_replica_turn) % len(replica_engines)
+
+def async_read_sessionmaker(request: Request):
+    """Session factory for a read-only job outliving the request's own session, e.g. a streamed export."""
+    index = _read_replica_index(request)
+    return AsyncSessionLocal if index is None else AsyncReplicaSessions[index]
+
+def pool_stats() -> dict:
+    """Checked-out/overflow counts of every engine's pool, plus checkout wait totals."""
+    waits = pool_wait.snapshot()
+    engines = [("sync", engine), ("async", async_engine.sync_engine)]
+    for label, sync_engine, replica_async_engine in replica_engines:
+        engines += [(f"{label}-sync", sync_engine), (f"{label}-async", replica_async_engine.sync_engine)]
+    stats = {}
+    for label, pool in ((label, e.pool) for label, e in engines):
+        wait = waits.get((label,), {"count": 0, "sum": 0.0})
+        entry = {"pool": type(pool).__name__, "checkouts": wait["count"], "wait_seconds_total": round(wait["sum"], 6)}
+        if isinstance(pool, QueuePool):
+            entry.update(size=pool.size(), checked_out=pool.checkedout(), checked_in=pool.checkedin(), overflow=max(pool.overflow(), 0))
+        stats[label] = entry
+    return stats
+
+def _pool_connections() -> dict:
+    return {(label, state): entry[state] for label, entry in pool_stats().items()
+            for state in ("checked_out", "checked_in", "overflow") if state in entry}
+
+pool_connections = metrics.gauge(
+    "db_pool_connections", "Connections of each engine's pool, by state", ("engine", "state"), function=_pool_connections)
+
+def get_db(request: Request):
+    db = SessionLocal(info={"client_key": client_key(request)})
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db(request: Request):
+    async with AsyncSessionLocal(info={"client_key": client_key(request)}) as db:
+        yield db
+
+# Same pool as async_engine; on PostgreSQL its connections begin every transaction REPEATABLE READ
+repeatable_read_async_engine = (async_engine.execution_options(isolation_level="REPEATABLE READ")
+                                if async_engine.dialect.name == "postgresql" else async_engine)
+
+async def get_async_repeatable_read_db(request: Request):
+    """
+    Like get_async_db, for writes whose statements must all see one snapshot. A session of its
+    own, so nothing else in the request (e.g. the principal lookup) has begun its transaction
+    before the isolation level applies.
+    """
+    async with AsyncSessionLocal(bind=repeatable_read_async_engine, info={"client_key": client_key(request)}) as db:
+        yield db
+
+def get_read_db(request: Request):
+    """Like get_db, for read-only handlers: a replica session unless the client just wrote."""
+    index = _read_replica_index(request)
+    if index is None:
+        yield from get_db(request)
+        return
+    db = ReplicaSessions[index]()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(request: Request):
+    """Like get_async_db, for read-only handlers: a replica session unless the client just wrote."""
+    index = _read_replica_index(request)
+    db = AsyncSessionLocal(info={"client_key": client_key(request)}) if index is None else AsyncReplicaSessions[index]()
+    async with db:
+        yield db
@@ -1,112 +1,171 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt # Changed from 'import jwt' to 'from jose import jwt'
+import hashlib
+import logging
 import sys
 import os
+import time
 # Add the parent directory to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 import schemas
 from config import settings
-from database import get_db
+from database import get_async_db, SessionLocal
+from ttl_cache import TTLCache
 from typing import List, Optional
 
+logger = logging.getLogger(__name__)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/users/login") # Adjusted tokenUrl to match your user router
+# Same, but a missing Authorization header yields None instead of a 401 (endpoints open to anonymous callers)
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/users/login", auto_error=False)
+
+# sha256(token) -> email of a token that passed jwt.decode, kept until the token's exp
+verified_token_cache = TTLCache(settings.AUTH_TOKEN_CACHE_SIZE)
+# email -> schemas.Principal, short TTL and dropped when the user's role or company changes
+user_principal_cache = TTLCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL_SECONDS)
+
+def verify_access_token(token: str) -> str | None:
+    """Return the email (sub) of a valid access token, or None. Decoded tokens are cached until they expire."""
+    token_key = hashlib.sha256(token.encode()).hexdigest()
+    email = verified_token_cache.get(token_key)
+    if email is not None:
+        return email
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        email: str = payload.get("sub")
+        user_id: str = payload.get("user_id") # if you need user_id
+        company_id: int = int(payload.get("company_id")) # ensure company_id is int
+        if email is None or user_id is None or company_id is None:
+            return None
+    except (JWTError, TypeError, ValueError):
+        return None
+    # jwt.decode already rejected expired tokens; cache for the remaining lifetime only
+    exp = payload.get("exp")
+    if exp is not None:
+        verified_token_cache.set(token_key, email, ttl=exp - time.time())
+    return email
+
+async def get_user_principal(db: AsyncSession, email: str) -> schemas.Principal | None:
+    principal = user_principal_cache.get(email)
+    if principal is None:
+        result = await db.execute(select(models.User).where(models.User.email == email))
+        user = result.scalars().first()
+        if user is None:
+            return None
+        principal = schemas.Principal.model_validate(user)
+        user_principal_cache.set(email, principal)
+    return principal
+
+def invalidate_user_principal(email: str) -> None:
+    user_principal_cache.pop(email)
+    for token, principal in list(demo_principals.items()):
+        if principal.email == email:
+            demo_principals.pop(token, None)
+
+# Demo accounts behind the demo_token_for_* tokens, all in the Test Company
+DEMO_COMPANY = {"name": "Test Company", "email": "company@example.com"}
+DEMO_USERS = {
+    "demo_token_for_admin": {"user_id": "admin_user_id", "email": "admin@example.com", "role": "Admin"},  # Note the capital A
+    "demo_token_for_user": {"user_id": "test_user_id", "email": "user@example.com", "role": "Customer"},
+    "demo_token_for_agent": {"user_id": "agent_user_id", "email": "agent@example.com", "role": "Agent"},
+}
+# demo token -> schemas.Principal, filled by bootstrap_demo_principals
+demo_principals = {}
+
+def _get_or_create(db: Session, model, lookup: dict, defaults: dict):
+    instance = db.query(model).filter_by(**lookup).first()
+    if instance is not None:
+        return instance
+    instance = model(**lookup, **defaults)
+    db.add(instance)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker created it first
+        db.rollback()
+        return db.query(model).filter_by(**lookup).one()
+    db.refresh(instance)
+    return instance
+
+def bootstrap_demo_principals(db: Session) -> dict:
+    """
+    Create the Test Company and demo users if they don't exist yet and load their
+    principals into memory. Safe to run repeatedly and from several workers at once.
+    """
+    test_company = _get_or_create(
+        db, models.Company, {"name": DEMO_COMPANY["name"]},
+        {"email": DEMO_COMPANY["email"], "hashed_password": "hashed_password"},  # In a real app, this would be properly hashed
+    )
+    for token, account in DEMO_USERS.items():
+        user = _get_or_create(
+            db, models.User, {"email": account["email"]},
+            {"user_id": account["user_id"], "hashed_password": "hashed_password", "company_id": test_company.id, "role": account["role"]},
+        )
+        demo_principals[token] = schemas.Principal.model_validate(user)
+    return demo_principals
+
+def init_demo_principals() -> None:
+    """Startup hook: provision the demo accounts once so demo-token auth never touches the database."""
+    db = SessionLocal()
+    try:
+        bootstrap_demo_principals(db)
+        logger.info("Demo principals ready: %s", ', '.join(demo_principals))
+    except Exception as e:
+        # Tables may not exist yet; get_current_user provisions on first demo-token request instead
+        logger.error("Could not provision demo principals at startup: %s", e)
+    finally:
+        db.close()
+
+@event.listens_for(models.User, "after_update")
+def _invalidate_changed_user(mapper, connection, target):
+    # Role or company changes must not be served from the principal cache
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ("role", "company_id", "email")):
+        for email in set(state.attrs.email.history.deleted or ()) | {target.email}:
+            invalidate_user_principal(email)
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+@event.listens_for(models.User, "after_delete")
+def _invalidate_deleted_user(mapper, connection, target):
+    invalidate_user_principal(target.email)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    # For testing: Accept demo tokens
-    if token in ["demo_token_for_admin", "demo_token_for_user", "demo_token_for_agent"]:
-        # Create a test company first if it doesn't exist
-        test_company = db.query(models.Company).filter(models.Company.name == "Test Company").first()
-        if not test_company:
-            test_company = models.Company(
-                name="Test Company",
-                email="company@example.com",
-                hashed_password="hashed_password",  # In a real app, this would be properly hashed
-            )
-            db.add(test_company)
-            db.commit()
-            db.refresh(test_company)
-        
-        # Check for admin user
-        admin_user = db.query(models.User).filter(models.User.email == "admin@example.com").first()
-        if not admin_user:
-            admin_user = models.User(
-                user_id="admin_user_id",
-                email="admin@example.com",
-                hashed_password="hashed_password",  # In a real app, this would be properly hashed
-                company_id=test_company.id,
-                role="Admin"  # Note the capital A
-            )
-            db.add(admin_user)
-            db.commit()
-            db.refresh(admin_user)
-        
-        # Check for regular user
-        test_user = db.query(models.User).filter(models.User.email == "user@example.com").first()
-        if not test_user:
-            test_user = models.User(
-                user_id="test_user_id",
-                email="user@example.com",
-                hashed_password="hashed_password",  # In a real app, this would be properly hashed
-                company_id=test_company.id,
-                role="Customer"
-            )
-            db.add(test_user)
-            db.commit()
-            db.refresh(test_user)
-        
-        # Check for agent user
-        agent_user = db.query(models.User).filter(models.User.email == "agent@example.com").first()
-        if not agent_user:
-            agent_user = models.User(
-                user_id="agent_user_id",
-                email="agent@example.com",
-                hashed_password="hashed_password",  # In a real app, this would be properly hashed
-                company_id=test_company.id,
-                role="Agent"
-            )
-            db.add(agent_user)
-            db.commit()
-            db.refresh(agent_user)
-        
-        # Return the appropriate user based on the token
-        if token == "demo_token_for_admin":
-            return admin_user
-        elif token == "demo_token_for_user":
-            return test_user
-        elif token == "demo_token_for_agent":
-            return agent_user
-        else:
-            # Fallback to admin user
-            return admin_user
+    # For testing: Accept demo tokens, served from the in-memory table filled at startup
+    if token in DEMO_USERS:
+        principal = demo_principals.get(token)
+        if principal is None:
+            # Startup bootstrap did not run (e.g. tables were created afterwards), provision once now
+            principal = (await db.run_sync(bootstrap_demo_principals))[token]
+        return principal
     
-    # Normal JWT validation for real tokens
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        user_id: str = payload.get("user_id") # if you need user_id
-        company_id: int = int(payload.get("company_id")) # ensure company_id is int
-        if user_id is None or company_id is None:
-            raise credentials_exception
-    except JWTError:
+    # Normal JWT validation for real tokens, both steps are usually served from memory
+    email = verify_access_token(token)
+    if email is None:
         raise credentials_exception
     
-    user = db.query(models.User).filter(models.User.email == email).first()
+    user = await get_user_principal(db, email)
     if user is None:
         raise credentials_exception
-    # You can return the full user object or just specific parts like company_id
-    # For company-specific resources, returning an object that includes company_id is useful.
-    return user # Return the full user model
+    # Handlers get an immutable Principal (id, user_id, email, company_id, role) rather than the ORM row,
+    # so it can be shared across requests and sessions
+    return user
+
+async def get_optional_user(token: str | None = Depends(optional_oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    # Anonymous callers get None; a token that is sent must still be valid
+    if token is None:
+        return None
+    return await get_current_user(token, db)
 
 async def get_current_active_user(current_user: models.User = Depends(get_current_user)):
     # If you have an is_active field on your user model, you can check it here.
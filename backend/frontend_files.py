@@ -0,0 +1,365 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+from collections import Counter
+from email.utils import formatdate
+import anyio
+from fastapi import Request, Response
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip and identity variants are served
+    brotli = None
+
+FRONTEND_DIST_DIR = os.getenv(
+    "FRONTEND_DIST_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend", "dist"))
+# Dev: re-read index.html when it changes on disk (checked at most every SPA_SHELL_RELOAD_INTERVAL seconds)
+SPA_SHELL_RELOAD = os.getenv("SPA_SHELL_RELOAD", "false").lower() in ("1", "true", "yes")
+SPA_SHELL_RELOAD_INTERVAL = float(os.getenv("SPA_SHELL_RELOAD_INTERVAL", "1.0"))
+
+# Best first; identity is always available
+ENCODINGS = ("br", "gzip", "identity")
+
+ASSETS_DIR = os.path.join(FRONTEND_DIST_DIR, "assets")
+# Assets up to this size are kept in memory after their first request; larger ones are streamed from disk
+ASSET_MEMORY_MAX_BYTES = int(os.getenv("ASSET_MEMORY_MAX_BYTES", str(256 * 1024)))
+ASSET_CHUNK_SIZE = 256 * 1024
+# Vite names build output [name]-[hash].[ext] with an 8-character hash; those files never change, so caches may
+# keep them for a year. Anything else (favicon.ico, robots.txt, vendor files without a hash) revalidates.
+HASHED_NAME_RE = re.compile(r"-[A-Za-z0-9_-]{8}\.[a-z0-9]+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Precompressed siblings written at build time (see compress_assets.py)
+PRECOMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def compress_variants(body: bytes) -> dict:
+    """encoding -> body for every encoding we can produce, computed once."""
+    variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    return variants
+
+
+def choose_encoding(accept_encoding: str, available) -> str:
+    """Best encoding in `available` that the Accept-Encoding header allows (q > 0), else identity."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            accepted[name] = q
+    for encoding in ENCODINGS:
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+
+def etag_matches(if_none_match: str, etags) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return any(etag in candidates for etag in etags)
+
+
+class SPAShell:
+    """
+    frontend/dist/index.html held in memory, with precomputed gzip/brotli variants and strong ETags.
+
+    The file is read once (at startup, or on first request) instead of on every navigation;
+    with `reload` its mtime is checked at most every `reload_interval` seconds and the
+    variants are rebuilt when it changes. Handlers await `refresh()`, which does that file
+    work in a worker thread, never on the event loop. Each encoding has its own ETag,
+    derived from the uncompressed content.
+    """
+
+    def __init__(self, path: str = os.path.join(FRONTEND_DIST_DIR, "index.html"), reload: bool = SPA_SHELL_RELOAD,
+                 reload_interval: float = SPA_SHELL_RELOAD_INTERVAL):
+        self.path = path
+        self.reload = reload
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._mtime = None
+        self._checked_at = 0.0
+        self.variants = {}  # encoding -> body, empty when index.html doesn't exist
+        self.etags = {}  # encoding -> quoted strong ETag
+        self.loads = 0
+
+    def load(self) -> None:
+        """(Re)read index.html and rebuild the variants; blocking, run it off the event loop."""
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                with open(self.path, "rb") as f:
+                    body = f.read()
+            except FileNotFoundError:
+                mtime, body = None, None
+            if body is None:
+                self.variants, self.etags = {}, {}
+            else:
+                digest = hashlib.sha256(body).hexdigest()[:32]
+                self.variants = compress_variants(body)
+                self.etags = {encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+                              for encoding in self.variants}
+            self._mtime = mtime
+            self._loaded = True
+            self._checked_at = time.monotonic()
+            self.loads += 1
+
+    def _reload_if_changed(self) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            self.load()
+
+    async def refresh(self) -> bool:
+        """Load index.html, or re-check it when reloading, in a worker thread; returns `available`."""
+        if not self._loaded:
+            await anyio.to_thread.run_sync(self.load)  # Used without the app lifespan (tests, scripts)
+        elif self.reload and time.monotonic() - self._checked_at >= self.reload_interval:
+            self._checked_at = time.monotonic()  # Before awaiting, so concurrent requests don't all re-check
+            await anyio.to_thread.run_sync(self._reload_if_changed)
+        return self.available
+
+    @property
+    def available(self) -> bool:
+        return bool(self.variants)
+
+    def response(self, request: Request) -> Response:
+        """The shell for this request: 304 if the client's ETag is current, else the best encoding it accepts."""
+        headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""), self.variants)
+        headers["ETag"] = self.etags[encoding]
+        if etag_matches(request.headers.get("if-none-match", ""), self.etags.values()):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding], media_type="text/html; charset=utf-8", headers=headers)
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "available": bool(self.variants),
+            "loads": self.loads,
+            "bytes": {encoding: len(body) for encoding, body in self.variants.items()},
+        }
+
+
+class _AssetFile:
+    __slots__ = ("path", "size", "mtime", "etag", "body")
+
+    def __init__(self, path: str, stat_result: os.stat_result, name: str, encoding: str):
+        self.path = path
+        self.size = stat_result.st_size
+        self.mtime = stat_result.st_mtime
+        tag = hashlib.sha256(f"{name}:{encoding}:{stat_result.st_size}:{stat_result.st_mtime_ns}".encode()).hexdigest()[:32]
+        self.etag = f'"{tag}"'
+        self.body = None  # Filled on first request if the file is small enough
+
+
+class _Asset:
+    __slots__ = ("media_type", "cache_control", "files", "hits")
+
+    def __init__(self, name: str, files: dict):
+        media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type.endswith("javascript"):
+            media_type += "; charset=utf-8"
+        self.media_type = media_type
+        self.cache_control = IMMUTABLE_CACHE_CONTROL if HASHED_NAME_RE.search(name) else "no-cache"
+        self.files = files  # encoding -> _AssetFile, always has identity
+        self.hits = Counter()  # encoding or "not_modified"/"partial" -> responses, plus "bytes" sent
+
+
+def parse_range(range_header: str, size: int):
+    """
+    (start, end) inclusive for a single "bytes=" range, "unsatisfiable", or None to ignore the
+    header and send the whole file (malformed or multiple ranges).
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            length = int(last)
+            if length <= 0:
+                return "unsatisfiable"
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        return "unsatisfiable"
+    return start, end
+
+
+class PrecompressedStaticFiles:
+    """
+    ASGI app serving the Vite assets directory, replacing StaticFiles for /assets.
+
+    - Serves the .br/.gz sibling written at build time when Accept-Encoding allows it.
+    - Content-hashed names get `Cache-Control: public, max-age=31536000, immutable`; others
+      revalidate with their ETag (304 on If-None-Match).
+    - Answers single byte-range requests (206/416) on the uncompressed file, honouring If-Range.
+    - Small files are kept in memory; larger ones go out with the server's zero-copy
+      `http.response.zerocopysend` extension when it offers one, else in chunks read off the loop.
+    - Counts responses per file and encoding (see stats()).
+
+    The directory is scanned once, and again (at most once a second) when an unknown path is
+    asked for, so a new build is picked up without a restart. Only scanned files are served.
+    """
+
+    def __init__(self, directory: str = ASSETS_DIR, memory_max_bytes: int = ASSET_MEMORY_MAX_BYTES,
+                 chunk_size: int = ASSET_CHUNK_SIZE):
+        self.directory = directory
+        self.memory_max_bytes = memory_max_bytes
+        self.chunk_size = chunk_size
+        self._assets = {}  # path relative to the directory, "/" separated -> _Asset
+        self._scanned_at = None
+
+    def scan(self) -> None:
+        """Index every file under the directory with its precompressed siblings; blocking."""
+        assets = {}
+        for root, _, filenames in os.walk(self.directory):
+            names = set(filenames)
+            for filename in filenames:
+                if any(filename.endswith(suffix) and filename[:-len(suffix)] in names
+                       for suffix in PRECOMPRESSED_SUFFIXES.values()):
+                    continue  # A sibling, served through its original
+                name = os.path.relpath(os.path.join(root, filename), self.directory).replace(os.sep, "/")
+                files = {}
+                for encoding, suffix in (("identity", ""), *PRECOMPRESSED_SUFFIXES.items()):
+                    if encoding == "identity" or filename + suffix in names:
+                        path = os.path.join(root, filename + suffix)
+                        files[encoding] = _AssetFile(path, os.stat(path), name, encoding)
+                previous = self._assets.get(name)
+                assets[name] = _Asset(name, files)
+                if previous is not None:
+                    assets[name].hits = previous.hits
+        self._assets = assets
+        self._scanned_at = time.monotonic()
+
+    async def _lookup(self, name: str):
+        asset = self._assets.get(name)
+        if asset is None and (self._scanned_at is None or time.monotonic() - self._scanned_at >= 1.0):
+            await anyio.to_thread.run_sync(self.scan)
+            asset = self._assets.get(name)
+        return asset
+
+    async def __call__(self, scope, receive, send) -> None:
+        assert scope["type"] == "http"
+        request = Request(scope)
+        if request.method not in ("GET", "HEAD"):
+            await Response("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})(scope, receive, send)
+            return
+        asset = await self._lookup(scope["path"].lstrip("/"))
+        if asset is None:
+            await Response("Not Found", status_code=404, media_type="text/plain")(scope, receive, send)
+            return
+
+        identity = asset.files["identity"]
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if range_header and if_range and if_range.strip() != identity.etag:
+            range_header = None  # The client's copy is stale: send the whole file
+        # Ranges refer to the uncompressed bytes
+        encoding = "identity" if range_header else choose_encoding(request.headers.get("accept-encoding", ""), asset.files)
+        file = asset.files[encoding]
+        headers = {
+            "Content-Type": asset.media_type,
+            "Cache-Control": asset.cache_control,
+            "ETag": file.etag,
+            "Last-Modified": formatdate(file.mtime, usegmt=True),
+            "Accept-Ranges": "bytes",
+        }
+        if len(asset.files) > 1:
+            headers["Vary"] = "Accept-Encoding"
+
+        if etag_matches(request.headers.get("if-none-match", ""), [f.etag for f in asset.files.values()]):
+            asset.hits["not_modified"] += 1
+            del headers["Content-Type"]
+            await Response(status_code=304, headers=headers)(scope, receive, send)
+            return
+
+        status_code, start, end = 200, 0, file.size - 1
+        if range_header:
+            byte_range = parse_range(range_header, file.size)
+            if byte_range == "unsatisfiable":
+                await Response(status_code=416, headers={"Content-Range": f"bytes */{file.size}"})(scope, receive, send)
+                return
+            if byte_range is not None:
+                status_code, (start, end) = 206, byte_range
+                headers["Content-Range"] = f"bytes {start}-{end}/{file.size}"
+                asset.hits["partial"] += 1
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        length = end - start + 1
+        headers["Content-Length"] = str(length)
+        asset.hits[encoding] += 1
+
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [(key.lower().encode("latin-1"), value.encode("latin-1")) for key, value in headers.items()],
+        })
+        if request.method == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        asset.hits["bytes"] += length
+        await self._send_body(scope, send, file, start, length)
+
+    async def _send_body(self, scope, send, file: _AssetFile, start: int, length: int) -> None:
+        if file.size <= self.memory_max_bytes:
+            if file.body is None:
+                file.body = await anyio.to_thread.run_sync(_read_file, file.path)
+            await send({"type": "http.response.body", "body": file.body[start:start + length]})
+            return
+
+        fd = await anyio.to_thread.run_sync(os.open, file.path, os.O_RDONLY)
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": fd, "offset": start, "count": length})
+                return
+            offset, remaining = start, length
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(os.pread, fd, min(self.chunk_size, remaining), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b""})  # File shrank underneath us
+        finally:
+            os.close(fd)
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._assets),
+            "hits": {name: dict(asset.hits) for name, asset in sorted(self._assets.items()) if asset.hits},
+        }
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+spa_shell = SPAShell()
+static_assets = PrecompressedStaticFiles()
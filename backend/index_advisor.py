@@ -0,0 +1,143 @@
+"""
+Index advisor: runs every GET /api route, EXPLAINs each SELECT it issued and flags the
+ones that scan a whole table instead of using an index.
+
+By default the schema is created from models.py in a throwaway SQLite database, so a
+model change that drops an index (or a new query that filters on an unindexed column)
+shows up here. --use-configured-db checks the database in DATABASE_URL instead, e.g. a
+Postgres with the Alembic migrations applied. Exits with status 1 when something is flagged.
+
+Usage (from the backend directory):
+    python index_advisor.py
+    python index_advisor.py --verbose
+    DATABASE_URL=postgresql://... python index_advisor.py --use-configured-db
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+
+if "--use-configured-db" not in sys.argv:
+    _tmpdir = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir.name, 'advisor.db')}"
+os.environ.setdefault("HUGGINGFACE_API_KEY", "advisor")
+
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+import dependencies
+import main
+import models
+from database import async_engine, engine, replica_engines
+
+TOKENS = ("demo_token_for_admin", "demo_token_for_agent", "demo_token_for_user")
+PATH_PARAM = re.compile(r"{(\w+)(?::\w+)?}")
+
+
+def capture_statements(captured: dict):
+    # SQL text -> (parameters, dialect-specific paramstyle, first route that ran it)
+    current = {"route": None}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and statement not in captured:
+            captured[statement] = (parameters, conn.dialect.paramstyle, current["route"])
+
+    engines = [engine, async_engine.sync_engine]
+    engines += [e for _, sync_engine, async_replica in replica_engines for e in (sync_engine, async_replica.sync_engine)]
+    for target in engines:
+        event.listen(target, "before_cursor_execute", before_cursor_execute)
+    return current
+
+
+def get_routes():
+    return [route for route in main.app.routes
+            if isinstance(route, APIRoute) and "GET" in route.methods and route.path.startswith("/api")]
+
+
+def exercise_routes(client, current, company_id, verbose):
+    for route in get_routes():
+        path = PATH_PARAM.sub(lambda m: str(company_id) if m.group(1) == "company_id" else "1", route.path)
+        current["route"] = route.path
+        for token in TOKENS:
+            response = client.get(path, headers={"Authorization": f"Bearer {token}"})
+            if verbose:
+                print(f"  GET {path} as {token}: {response.status_code}")
+
+
+def to_pyformat(statement, parameters):
+    # asyncpg's $1, $2 placeholders -> psycopg2's %s, so the sync engine can run the EXPLAIN
+    order = [int(n) - 1 for n in re.findall(r"\$(\d+)", statement)]
+    statement = re.sub(r"\$\d+", "%s", statement.replace("%", "%%"))
+    return statement, tuple(parameters[n] for n in order)
+
+
+def sqlite_scans(connection, statement, parameters):
+    plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    # "SCAN products" reads the whole table; "SCAN products USING INDEX ..." walks an index
+    return [row[-1] for row in plan if row[-1].startswith("SCAN ") and "USING" not in row[-1]
+            and row[-1] != "SCAN CONSTANT ROW"]
+
+
+def postgres_scans(connection, statement, parameters, paramstyle):
+    if paramstyle == "numeric_dollar":
+        statement, parameters = to_pyformat(statement, parameters)
+    # Small dev tables make the planner prefer Seq Scan everywhere; only report the unavoidable ones
+    connection.exec_driver_sql("SET enable_seqscan = off")
+    plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+
+    scans = []
+
+    def walk(node):
+        if node["Node Type"] == "Seq Scan":
+            scans.append(f"Seq Scan on {node['Relation Name']}" + (f" (Filter: {node['Filter']})" if "Filter" in node else ""))
+        for child in node.get("Plans", ()):
+            walk(child)
+    walk(plan[0]["Plan"])
+    return scans
+
+
+def explain(captured):
+    findings = []
+    with engine.connect() as connection:
+        for statement, (parameters, paramstyle, route) in captured.items():
+            if engine.dialect.name == "sqlite":
+                scans = sqlite_scans(connection, statement, parameters)
+            elif engine.dialect.name == "postgresql":
+                scans = postgres_scans(connection, statement, parameters, paramstyle)
+            else:
+                raise SystemExit(f"EXPLAIN is not supported for {engine.dialect.name}")
+            if scans:
+                findings.append((route, statement, scans))
+        connection.rollback()
+    return findings
+
+
+def run(args):
+    if not args.use_configured_db:
+        models.Base.metadata.create_all(bind=engine)
+
+    captured = {}
+    current = capture_statements(captured)
+    with TestClient(main.app) as client:
+        company_id = dependencies.demo_principals["demo_token_for_admin"].company_id
+        exercise_routes(client, current, company_id, args.verbose)
+
+    findings = explain(captured)
+    print(f"{len(captured)} distinct SELECT statements from {len(get_routes())} GET routes, "
+          f"{len(findings)} with full table scans")
+    for route, statement, scans in findings:
+        print(f"\n{route}\n  {' '.join(statement.split())}")
+        for scan in scans:
+            print(f"  -> {scan}")
+    return 1 if findings else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--use-configured-db", action="store_true",
+                        help="check the database in DATABASE_URL instead of a throwaway SQLite copy of models.py")
+    parser.add_argument("--verbose", action="store_true", help="print each request the advisor makes")
+    sys.exit(run(parser.parse_args()))
@@ -0,0 +1,144 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+
+# Fields of a knowledge base item that are indexed for retrieval
+SEARCHABLE_FIELDS = ("question", "answer", "name", "title", "description", "content", "details")
+
+# Very common words that carry no retrieval signal
+STOP_WORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "for", "from", "how", "i",
+    "in", "is", "it", "me", "my", "of", "on", "or", "the", "to", "was", "what", "when",
+    "where", "which", "who", "why", "with", "you", "your",
+})
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _normalize_token(token: str) -> str:
+    # Light plural folding so "hours" matches "hour" and "returns" matches "return"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list:
+    """Lowercase, split on non-alphanumerics, drop stop words and fold plurals."""
+    return [_normalize_token(t) for t in _TOKEN_RE.findall(text.lower()) if t not in STOP_WORDS]
+
+
+def document_text(item: dict) -> str:
+    """Concatenate every searchable field of a knowledge base item."""
+    parts = [str(item[field]) for field in SEARCHABLE_FIELDS if item.get(field)]
+    parts.extend(str(feature) for feature in item.get("features", []) or [])
+    return " ".join(parts)
+
+
+class KnowledgeBaseIndex:
+    """
+    Inverted index over knowledge base items with BM25 ranking.
+
+    Items are plain dicts (the same shape as the `knowledge_base` entries in main.py)
+    and must carry a unique "id". Adding an item whose id is already indexed replaces
+    the previous version, so the index can be kept in sync one document at a time.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._items = {}        # doc id -> item
+        self._term_freqs = {}   # doc id -> Counter of term frequencies
+        self._doc_lens = {}     # doc id -> number of tokens
+        self._postings = {}     # term -> {doc id: term frequency}
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self._items
+
+    def get(self, doc_id):
+        return self._items.get(doc_id)
+
+    def add(self, item: dict) -> None:
+        """Index a single item, replacing any previous version with the same id."""
+        doc_id = item["id"]
+        term_freqs = Counter(tokenize(document_text(item)))
+        with self._lock:
+            if doc_id in self._items:
+                self._unindex(doc_id)
+            self._items[doc_id] = item
+            self._term_freqs[doc_id] = term_freqs
+            doc_len = sum(term_freqs.values())
+            self._doc_lens[doc_id] = doc_len
+            self._total_len += doc_len
+            for term, freq in term_freqs.items():
+                self._postings.setdefault(term, {})[doc_id] = freq
+
+    def add_many(self, items) -> None:
+        for item in items:
+            self.add(item)
+
+    def remove(self, doc_id) -> bool:
+        """Drop an item from the index. Returns False if it was not indexed."""
+        with self._lock:
+            if doc_id not in self._items:
+                return False
+            self._unindex(doc_id)
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._term_freqs.clear()
+            self._doc_lens.clear()
+            self._postings.clear()
+            self._total_len = 0
+
+    def _unindex(self, doc_id) -> None:
+        # Caller must hold the lock
+        for term in self._term_freqs.pop(doc_id):
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_len -= self._doc_lens.pop(doc_id)
+        del self._items[doc_id]
+
+    def search_scored(self, query: str, top_k: int = 3) -> list:
+        """Return up to `top_k` (score, item) pairs ranked by BM25, best first."""
+        query_terms = set(tokenize(query))
+        if not query_terms or top_k <= 0:
+            return []
+
+        with self._lock:
+            n_docs = len(self._items)
+            if n_docs == 0:
+                return []
+            avg_len = self._total_len / n_docs or 1.0
+            k1 = self.k1
+            length_norm = k1 * (1 - self.b)
+            length_scale = k1 * self.b / avg_len
+            doc_lens = self._doc_lens
+
+            scores = {}
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for doc_id, freq in postings.items():
+                    denom = freq + length_norm + length_scale * doc_lens[doc_id]
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (k1 + 1) / denom
+
+            best = heapq.nlargest(top_k, scores.items(), key=lambda pair: pair[1])
+            return [(score, self._items[doc_id]) for doc_id, score in best]
+
+    def search(self, query: str, top_k: int = 3) -> list:
+        """Return up to `top_k` items ranked by BM25 relevance to `query`."""
+        return [item for _, item in self.search_scored(query, top_k)]
@@ -0,0 +1,137 @@
+import logging
+import os
+import time
+from collections import deque
+from fastapi import HTTPException
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Calls considered when deciding to open a circuit: those finished in the last window, once there are enough of them
+LLM_BREAKER_WINDOW_SECONDS = float(os.getenv("LLM_BREAKER_WINDOW_SECONDS", "30"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "10"))
+# Open when this share of calls failed (errors and timeouts)...
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+# ...or when this share took longer than LLM_BREAKER_SLOW_CALL_SECONDS
+LLM_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", "10"))
+LLM_BREAKER_SLOW_RATE = float(os.getenv("LLM_BREAKER_SLOW_RATE", "0.8"))
+# How long an open circuit rejects calls, then how many trial calls half-open lets through
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+LLM_BREAKER_HALF_OPEN_CALLS = int(os.getenv("LLM_BREAKER_HALF_OPEN_CALLS", "3"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+transitions = metrics.counter(
+    "llm_circuit_transitions_total", "LLM provider circuit breaker state changes, by new state", ("provider", "state"))
+rejections = metrics.counter(
+    "llm_circuit_rejections_total", "LLM provider calls refused because the provider's circuit was open", ("provider",))
+
+
+class CircuitOpen(HTTPException):
+    """No provider can take the call: their circuits are open. Raised before any request is sent."""
+
+    def __init__(self, provider: str):
+        super().__init__(status_code=503, detail=f"The {provider} AI service is temporarily unavailable.")
+        self.provider = provider
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through and their outcomes are counted over the last
+    LLM_BREAKER_WINDOW_SECONDS. Too many failures or slow calls open the circuit.
+
+    Open: calls are refused at once for LLM_BREAKER_OPEN_SECONDS, then the circuit goes
+    half-open and lets LLM_BREAKER_HALF_OPEN_CALLS trial calls through. If they all succeed
+    in time it closes again; one failure reopens it.
+
+    `allow()` returns a permit to pass back with the call's outcome, or None when the call
+    is refused. Outcomes of calls started before the last state change are ignored.
+    """
+
+    def __init__(self, provider: str, clock=time.monotonic):
+        self.provider = provider
+        self.state = CLOSED
+        self._clock = clock
+        self._generation = 0  # bumped on every state change
+        self._calls = deque()  # (finished at, failed, slow) of calls in the window, oldest first
+        self._opened_at = 0.0
+        self._trials_started = 0
+        self._trials_passed = 0
+        self.rejected = 0
+
+    def accepting(self) -> bool:
+        """Whether a call now could go through, without taking a trial slot."""
+        if self.state == OPEN:
+            return self._clock() - self._opened_at >= LLM_BREAKER_OPEN_SECONDS
+        if self.state == HALF_OPEN:
+            return self._trials_started < LLM_BREAKER_HALF_OPEN_CALLS
+        return True
+
+    def allow(self) -> int | None:
+        if self.state == OPEN and self._clock() - self._opened_at >= LLM_BREAKER_OPEN_SECONDS:
+            self._transition(HALF_OPEN)
+        if self.state == OPEN or (self.state == HALF_OPEN and self._trials_started >= LLM_BREAKER_HALF_OPEN_CALLS):
+            self.rejected += 1
+            rejections.inc(self.provider)
+            return None
+        if self.state == HALF_OPEN:
+            self._trials_started += 1
+        return self._generation
+
+    def record_success(self, permit: int, seconds: float) -> None:
+        self._record(permit, failed=False, slow=seconds >= LLM_BREAKER_SLOW_CALL_SECONDS)
+
+    def record_failure(self, permit: int) -> None:
+        self._record(permit, failed=True, slow=False)
+
+    def record_cancelled(self, permit: int, seconds: float) -> None:
+        """A call abandoned by its caller (e.g. a hedge loser): only counts if it was already slow."""
+        if seconds >= LLM_BREAKER_SLOW_CALL_SECONDS:
+            self._record(permit, failed=False, slow=True)
+        elif permit == self._generation and self.state == HALF_OPEN:
+            self._trials_started -= 1  # free the trial for another call
+
+    def _record(self, permit: int, failed: bool, slow: bool) -> None:
+        if permit != self._generation:
+            return
+        if self.state == HALF_OPEN:
+            if failed or slow:
+                self._transition(OPEN)
+                return
+            self._trials_passed += 1
+            if self._trials_passed >= LLM_BREAKER_HALF_OPEN_CALLS:
+                self._transition(CLOSED)
+            return
+
+        now = self._clock()
+        self._calls.append((now, failed, slow))
+        while self._calls and now - self._calls[0][0] > LLM_BREAKER_WINDOW_SECONDS:
+            self._calls.popleft()
+        if len(self._calls) < LLM_BREAKER_MIN_CALLS:
+            return
+        failures = sum(1 for _, call_failed, _ in self._calls if call_failed)
+        slow_calls = sum(1 for _, _, call_slow in self._calls if call_slow)
+        if failures >= LLM_BREAKER_ERROR_RATE * len(self._calls) or slow_calls >= LLM_BREAKER_SLOW_RATE * len(self._calls):
+            logger.warning("Opening %s circuit: %s failed and %s slow of the last %s calls",
+                           self.provider, failures, slow_calls, len(self._calls))
+            self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        if state == OPEN:
+            self._opened_at = self._clock()
+        elif state == CLOSED:
+            logger.info("%s circuit closed", self.provider)
+        self.state = state
+        self._generation += 1
+        self._calls.clear()
+        self._trials_started = self._trials_passed = 0
+        transitions.inc(self.provider, state)
+
+    def stats(self) -> dict:
+        stats = {"state": self.state, "calls_in_window": len(self._calls), "rejected": self.rejected}
+        if self.state == OPEN:
+            stats["retry_in_seconds"] = round(max(0.0, LLM_BREAKER_OPEN_SECONDS - (self._clock() - self._opened_at)), 1)
+        return stats
@@ -0,0 +1,56 @@
+import importlib.util
+import os
+import httpx
+
+# Base URLs can be overridden to point at a proxy or a local stub server
+PROVIDER_BASE_URLS = {
+    "huggingface": os.getenv("HUGGINGFACE_API_BASE", "https://api-inference.huggingface.co"),
+    "groq": os.getenv("GROQ_API_BASE", "https://api.groq.com"),
+}
+
+# Connection pool tuning, shared by every provider client
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "30"))
+
+# HTTP/2 needs the optional h2 package (installed with httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_clients = {}
+
+
+def create_client(base_url: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=base_url,
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    )
+
+
+async def startup() -> None:
+    """Open one pooled client per provider. Called from the app lifespan."""
+    for provider, base_url in PROVIDER_BASE_URLS.items():
+        if provider not in _clients:
+            _clients[provider] = create_client(base_url)
+
+
+async def shutdown() -> None:
+    """Close every provider client, draining their connection pools."""
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
+
+
+def get_client(provider: str) -> httpx.AsyncClient:
+    client = _clients.get(provider)
+    if client is None:
+        # Used outside the app lifespan (scripts, ad-hoc calls): create on first use
+        client = _clients[provider] = create_client(PROVIDER_BASE_URLS[provider])
+    return client
@@ -0,0 +1,200 @@
+import asyncio
+import contextlib
+import math
+import os
+import time
+from collections import deque
+import metrics
+
+# Provider calls in flight at once, per provider; LLM_MAX_CONCURRENCY_<PROVIDER> overrides it for one provider
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+# Calls waiting for a slot, per provider; past this, new calls are rejected at once with 429
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "256"))
+# How long a call may wait for a slot before it is rejected with 503
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+LLM_RETRY_AFTER_MAX_SECONDS = 60
+
+queue_wait = metrics.histogram(
+    "llm_gateway_queue_wait_seconds", "Time a provider call waited for a gateway slot", ("provider",))
+rejections = metrics.counter(
+    "llm_gateway_rejections_total", "Provider calls turned away by the gateway, by reason", ("provider", "reason"))
+
+
+class LLMOverloaded(Exception):
+    """
+    The gateway turned a call away: its provider's queue was full (429) or the call's
+    deadline passed while queued (503). `retry_after` is a hint in whole seconds.
+    """
+
+    def __init__(self, provider: str, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.provider = provider
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Slot:
+    """A held gateway slot. `release` is idempotent, so it can be wired to several cleanup paths."""
+
+    __slots__ = ("provider", "_gate", "_acquired_at")
+
+    def __init__(self, gate: "ProviderGate"):
+        self.provider = gate.provider
+        self._gate = gate
+        self._acquired_at = time.perf_counter()
+
+    def release(self) -> None:
+        if self._gate is not None:
+            gate, self._gate = self._gate, None
+            gate.release(time.perf_counter() - self._acquired_at)
+
+
+class ProviderGate:
+    """
+    At most `limit` calls to one provider at a time. Further calls wait in FIFO order, at
+    most `max_waiting` of them; a released slot is handed straight to the oldest waiter.
+    """
+
+    def __init__(self, provider: str, limit: int, max_waiting: int, wait_timeout: float):
+        self.provider = provider
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.active = 0
+        self._waiters = deque()  # futures of queued calls, oldest first
+        self._hold_seconds = 1.0  # moving average of how long a call keeps its slot
+        self.acquired = 0
+        self.rejected_full = 0
+        self.rejected_deadline = 0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained, from the recent slot hold time."""
+        estimate = (self.waiting + 1) / self.limit * self._hold_seconds
+        return min(LLM_RETRY_AFTER_MAX_SECONDS, max(1, math.ceil(estimate)))
+
+    def try_acquire(self) -> Slot | None:
+        """A slot if one is free right now, else None; never queues."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.acquired += 1
+            queue_wait.observe(0.0, self.provider)
+            return Slot(self)
+        return None
+
+    async def acquire(self, max_wait: float | None = None) -> Slot:
+        slot = self.try_acquire()
+        if slot is not None:
+            return slot
+        if len(self._waiters) >= self.max_waiting:
+            self.rejected_full += 1
+            rejections.inc(self.provider, "queue_full")
+            raise LLMOverloaded(self.provider, 429, f"Too many pending {self.provider} requests, please retry later",
+                                self.retry_after())
+
+        started = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.wait_timeout if max_wait is None else max_wait)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self.rejected_deadline += 1
+            rejections.inc(self.provider, "deadline")
+            raise LLMOverloaded(self.provider, 503, f"Timed out waiting for a {self.provider} request slot",
+                                self.retry_after())
+        except asyncio.CancelledError:
+            # The caller went away; pass on a slot that was handed over in the meantime
+            if waiter.done() and not waiter.cancelled():
+                self.release(0.0)
+            else:
+                self._discard(waiter)
+            raise
+        self.acquired += 1
+        queue_wait.observe(time.perf_counter() - started, self.provider)
+        return Slot(self)
+
+    def release(self, held_seconds: float) -> None:
+        if held_seconds:
+            self._hold_seconds += (held_seconds - self._hold_seconds) * 0.1
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # the slot moves to this waiter; `active` is unchanged
+                return
+        self.active -= 1
+
+    def _discard(self, waiter) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.active,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "acquired": self.acquired,
+            "rejected_queue_full": self.rejected_full,
+            "rejected_deadline": self.rejected_deadline,
+            "avg_hold_seconds": round(self._hold_seconds, 3),
+        }
+
+
+class LLMGateway:
+    """
+    Per-provider admission control for LLM calls. Every provider request takes a slot first:
+
+        async with llm_gateway.slot("huggingface"):
+            ...call the provider...
+
+    so a burst of chats queues here instead of opening one provider request each and
+    tripping the provider's rate limits.
+    """
+
+    def __init__(self, default_limit: int = LLM_MAX_CONCURRENCY, max_waiting: int = LLM_QUEUE_SIZE,
+                 wait_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS):
+        self.default_limit = default_limit
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._gates = {}
+
+    def gate(self, provider: str) -> ProviderGate:
+        gate = self._gates.get(provider)
+        if gate is None:
+            limit = int(os.getenv(f"LLM_MAX_CONCURRENCY_{provider.upper()}", self.default_limit))
+            gate = self._gates[provider] = ProviderGate(provider, limit, self.max_waiting, self.wait_timeout)
+        return gate
+
+    async def acquire(self, provider: str, max_wait: float | None = None) -> Slot:
+        """Wait for a slot on `provider` (at most `max_wait` seconds, default the gateway's); raises LLMOverloaded."""
+        return await self.gate(provider).acquire(max_wait)
+
+    def try_acquire(self, provider: str) -> Slot | None:
+        """Take a free slot on `provider` without waiting, for optional work such as hedged requests."""
+        return self.gate(provider).try_acquire()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, provider: str, max_wait: float | None = None):
+        held = await self.acquire(provider, max_wait)
+        try:
+            yield held
+        finally:
+            held.release()
+
+    def stats(self) -> dict:
+        return {provider: gate.stats() for provider, gate in self._gates.items()}
+
+
+llm_gateway = LLMGateway()
+
+metrics.gauge("llm_gateway_queue_depth", "Provider calls waiting for a gateway slot", ("provider",),
+              function=lambda: {(provider,): gate.waiting for provider, gate in llm_gateway._gates.items()})
+metrics.gauge("llm_gateway_in_flight", "Provider calls holding a gateway slot", ("provider",),
+              function=lambda: {(provider,): gate.active for provider, gate in llm_gateway._gates.items()})
@@ -0,0 +1,331 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from fastapi import HTTPException
+import metrics
+from llm_breaker import CircuitBreaker, CircuitOpen
+from llm_clients import LLM_REQUEST_TIMEOUT
+from llm_gateway import LLMGateway, Slot, llm_gateway
+
+logger = logging.getLogger(__name__)
+
+# Send a hedged request to the secondary provider when the primary is slow or fails ("false" turns it off)
+LLM_HEDGING = os.getenv("LLM_HEDGING", "true").lower() == "true"
+# Hedge once the primary has gone this percentile of its recent first-token latencies without a token
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# Hedge delay floor, and the delay used until LLM_HEDGE_MIN_SAMPLES latencies have been seen
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "0.25"))
+LLM_HEDGE_INITIAL_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_INITIAL_DELAY_SECONDS", "2"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Recent latencies kept per provider and call mode
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+# A provider's first output must arrive within LLM_TIMEOUT_MULTIPLIER x its recent LLM_TIMEOUT_PERCENTILE latency,
+# kept between the min and max; the max (the HTTP client timeout) applies until LLM_TIMEOUT_MIN_SAMPLES are seen
+LLM_TIMEOUT_PERCENTILE = float(os.getenv("LLM_TIMEOUT_PERCENTILE", "99"))
+LLM_TIMEOUT_MULTIPLIER = float(os.getenv("LLM_TIMEOUT_MULTIPLIER", "3"))
+LLM_TIMEOUT_MIN_SECONDS = float(os.getenv("LLM_TIMEOUT_MIN_SECONDS", "5"))
+LLM_TIMEOUT_MAX_SECONDS = float(os.getenv("LLM_TIMEOUT_MAX_SECONDS", str(LLM_REQUEST_TIMEOUT)))
+LLM_TIMEOUT_MIN_SAMPLES = int(os.getenv("LLM_TIMEOUT_MIN_SAMPLES", "20"))
+
+MODE_COMPLETE = "complete"
+MODE_STREAM = "stream"
+
+routed_requests = metrics.counter(
+    "llm_routed_requests_total", "LLM requests sent through the provider router", ("mode",))
+hedged_requests = metrics.counter(
+    "llm_hedged_requests_total",
+    "Requests sent to the secondary provider, by reason (slow, error, circuit_open), or no_slot when it was busy",
+    ("mode", "reason"))
+hedge_wins = metrics.counter(
+    "llm_hedge_wins_total", "Provider whose answer was used, for hedged requests", ("mode", "provider"))
+timeouts = metrics.counter(
+    "llm_provider_timeouts_total", "Provider requests abandoned for producing nothing within their timeout",
+    ("provider", "mode"))
+
+
+class LatencyWindow:
+    """The last `size` latencies of one provider and call mode, for percentile estimates."""
+
+    def __init__(self, size: int = LLM_LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> float | None:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+class Provider:
+    """The completion and streaming calls of one LLM provider."""
+
+    def __init__(self, name: str, complete, stream):
+        self.name = name
+        self.complete = complete  # async (prompt_messages) -> str
+        self.stream = stream  # async generator (prompt_messages) -> text chunks
+
+    def open(self, mode: str, prompt_messages: list):
+        """An async iterator over the call's output: the whole text once, or streamed chunks."""
+        if mode == MODE_STREAM:
+            return self.stream(prompt_messages)
+
+        async def once():
+            yield await self.complete(prompt_messages)
+        return once()
+
+
+class _Attempt:
+    __slots__ = ("provider", "iterator", "slot", "permit", "started", "deadline", "task")
+
+    def __init__(self, provider: Provider, mode: str, prompt_messages: list, slot, permit: int, timeout: float):
+        self.provider = provider
+        self.iterator = provider.open(mode, prompt_messages)
+        self.slot = slot  # gateway slot on this provider, released when the attempt closes
+        self.permit = permit  # from the provider's circuit breaker
+        self.started = time.perf_counter()
+        self.deadline = self.started + timeout
+        self.task = asyncio.ensure_future(anext(self.iterator))
+
+    async def close(self) -> None:
+        if not self.task.done():
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        await self.iterator.aclose()
+        self.release()
+
+    def release(self) -> None:
+        if self.slot is not None:
+            self.slot.release()
+
+
+class ProviderRouter:
+    """
+    Sends each LLM request to the primary provider, hedging to the secondary when the primary
+    has produced nothing within the LLM_HEDGE_PERCENTILE of its recent first-token latencies
+    (or fails outright). Whichever answers first is used and the other request is cancelled.
+
+    Every attempt holds a gateway slot on its own provider. The first one waits for it (see
+    `admit`); a hedge only goes out if the secondary has a free slot, so hedging never queues
+    behind, or adds to, a backlog.
+
+    Each provider has a circuit breaker; a provider whose circuit is open is skipped, and a
+    request no provider can take fails at once with CircuitOpen. A provider that produces
+    nothing within its adaptive timeout (see `timeout`) is abandoned and counted as failed.
+    """
+
+    def __init__(self, primary: str, secondary: str | None = None, percentile: float = LLM_HEDGE_PERCENTILE,
+                 gateway: LLMGateway = llm_gateway):
+        self.primary = primary
+        self.secondary = secondary
+        self.percentile = percentile
+        self.gateway = gateway
+        self.providers = {}
+        self.breakers = {}
+        self._latencies = {}  # (provider, mode) -> LatencyWindow
+        self._counts = {mode: {"requests": 0, "hedged": 0, "hedge_wins": 0, "no_slot": 0}
+                        for mode in (MODE_COMPLETE, MODE_STREAM)}
+
+    def register(self, name: str, complete, stream) -> None:
+        self.providers[name] = Provider(name, complete, stream)
+        self.breakers[name] = CircuitBreaker(name)
+
+    def latencies(self, provider: str, mode: str) -> LatencyWindow:
+        window = self._latencies.get((provider, mode))
+        if window is None:
+            window = self._latencies[(provider, mode)] = LatencyWindow()
+        return window
+
+    def hedge_delay(self, mode: str) -> float:
+        """Seconds to wait for the primary's first token before hedging."""
+        window = self.latencies(self.primary, mode)
+        if len(window) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_INITIAL_DELAY_SECONDS
+        return max(LLM_HEDGE_MIN_DELAY_SECONDS, window.percentile(self.percentile))
+
+    async def admit(self) -> Slot:
+        """
+        Wait for a gateway slot on the provider a request goes to first: the primary, or the
+        secondary while the primary's circuit is open. Raises CircuitOpen when no provider
+        would take the request and LLMOverloaded when the gateway turns it away.
+        """
+        for name in self._candidates():
+            if self.breakers[name].accepting():
+                return await self.gateway.acquire(name)
+        raise CircuitOpen(self.primary)
+
+    async def complete(self, prompt_messages: list, slot: Slot | None = None) -> str:
+        """The completion text. `slot` is one from `admit`, taken now if not given; the router releases it."""
+        if slot is None:
+            slot = await self.admit()
+        attempt, text = await self._first(MODE_COMPLETE, prompt_messages, slot)
+        await attempt.close()
+        return text
+
+    async def stream(self, prompt_messages: list, slot: Slot | None = None):
+        """Streamed text chunks; `slot` as for `complete`."""
+        if slot is None:
+            slot = await self.admit()
+        attempt, first = await self._first(MODE_STREAM, prompt_messages, slot)
+        try:
+            if first is not None:
+                yield first
+                async for chunk in attempt.iterator:
+                    yield chunk
+        finally:
+            await attempt.close()
+
+    def timeout(self, provider: str, mode: str) -> float:
+        """
+        Seconds `provider` gets to produce its first output: LLM_TIMEOUT_MULTIPLIER times its
+        recent LLM_TIMEOUT_PERCENTILE latency, within the configured bounds.
+        """
+        window = self.latencies(provider, mode)
+        if len(window) < LLM_TIMEOUT_MIN_SAMPLES:
+            return LLM_TIMEOUT_MAX_SECONDS
+        return min(LLM_TIMEOUT_MAX_SECONDS,
+                   max(LLM_TIMEOUT_MIN_SECONDS, window.percentile(LLM_TIMEOUT_PERCENTILE) * LLM_TIMEOUT_MULTIPLIER))
+
+    def available(self) -> bool:
+        """False while every provider the router could use has an open circuit."""
+        return any(self.breakers[name].accepting() for name in self._candidates())
+
+    def _candidates(self) -> list:
+        if self.secondary is not None and self.secondary in self.providers:
+            return [self.primary, self.secondary]
+        return [self.primary]
+
+    async def _first(self, mode: str, prompt_messages: list, slot: Slot):
+        """
+        Run the provider `slot` was admitted to, and the hedge when due, until one produces its first output.
+        Return (winning attempt, first output or None if it produced nothing); every other
+        attempt is cancelled. An attempt that outlives its timeout counts as failed. If every
+        attempt fails, the first error is raised; CircuitOpen if none could be started.
+        """
+        counts = self._counts[mode]
+        counts["requests"] += 1
+        routed_requests.inc(mode)
+        hedge_at = time.perf_counter() + self.hedge_delay(mode)
+        can_hedge = len(self._candidates()) > 1
+        hedged = hedge_sent = False
+        attempts = []
+        errors = []
+        try:
+            # The circuit may have opened while the request waited for its slot
+            permit = self.breakers[slot.provider].allow()
+            if permit is None:
+                slot.release()
+                if slot.provider == self.primary and can_hedge:
+                    hedged = True
+                    hedge_sent = self._hedge(mode, "circuit_open", attempts, prompt_messages)
+            else:
+                if slot.provider != self.primary:
+                    # Admitted straight to the secondary rather than to a provider known to be failing
+                    hedged = hedge_sent = True
+                    self._count_hedge(mode, "circuit_open")
+                attempts.append(self._start(slot.provider, mode, prompt_messages, slot, permit))
+            if not attempts:
+                raise CircuitOpen(self.primary)
+
+            while attempts:
+                wake_at = min(attempt.deadline for attempt in attempts)
+                if can_hedge and not hedged:
+                    wake_at = min(wake_at, hedge_at)
+                done, _ = await asyncio.wait([a.task for a in attempts], timeout=max(0.0, wake_at - time.perf_counter()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    now = time.perf_counter()
+                    for attempt in [a for a in attempts if a.deadline <= now]:
+                        attempts.remove(attempt)
+                        errors.append(await self._time_out(attempt, mode))
+                    if can_hedge and not hedged and (now >= hedge_at or not attempts):
+                        hedged = True
+                        hedge_sent = self._hedge(mode, "slow" if attempts else "error", attempts, prompt_messages)
+                    continue
+                for attempt in [a for a in attempts if a.task in done]:
+                    attempts.remove(attempt)
+                    name = attempt.provider.name
+                    error = attempt.task.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        elapsed = time.perf_counter() - attempt.started
+                        self.latencies(name, mode).record(elapsed)
+                        self.breakers[name].record_success(attempt.permit, elapsed)
+                        if hedge_sent:
+                            counts["hedge_wins"] += name == self.secondary
+                            hedge_wins.inc(mode, name)
+                        return attempt, None if error is not None else attempt.task.result()
+                    self.breakers[name].record_failure(attempt.permit)
+                    errors.append(error)
+                    await attempt.close()
+                    if can_hedge and not hedged:
+                        hedged = True
+                        hedge_sent = self._hedge(mode, "error", attempts, prompt_messages)
+            raise errors[0]
+        finally:
+            for attempt in attempts:
+                elapsed = time.perf_counter() - attempt.started
+                # A cancelled attempt took at least this long; keeping it as a sample stops the
+                # percentile drifting down to only the requests that beat the hedge
+                self.latencies(attempt.provider.name, mode).record(elapsed)
+                self.breakers[attempt.provider.name].record_cancelled(attempt.permit, elapsed)
+                await attempt.close()
+
+    def _start(self, name: str, mode: str, prompt_messages: list, slot, permit: int) -> _Attempt:
+        return _Attempt(self.providers[name], mode, prompt_messages, slot, permit, self.timeout(name, mode))
+
+    async def _time_out(self, attempt: _Attempt, mode: str) -> HTTPException:
+        name = attempt.provider.name
+        await attempt.close()
+        self.breakers[name].record_failure(attempt.permit)
+        timeouts.inc(name, mode)
+        seconds = attempt.deadline - attempt.started
+        logger.warning("%s %s request produced nothing in %.1f s, giving up on it", name, mode, seconds)
+        return HTTPException(status_code=504, detail=f"Request to {name} timed out after {seconds:.1f} s.")
+
+    def _count_hedge(self, mode: str, reason: str) -> None:
+        self._counts[mode]["hedged"] += 1
+        hedged_requests.inc(mode, reason)
+        logger.debug("Hedging %s request to %s (primary %s)", mode, self.secondary, reason)
+
+    def _hedge(self, mode: str, reason: str, attempts: list, prompt_messages: list) -> bool:
+        slot = self.gateway.try_acquire(self.secondary)
+        if slot is None:
+            self._counts[mode]["no_slot"] += 1
+            hedged_requests.inc(mode, "no_slot")
+            return False
+        permit = self.breakers[self.secondary].allow()
+        if permit is None:
+            slot.release()
+            return False
+        self._count_hedge(mode, reason)
+        attempts.append(self._start(self.secondary, mode, prompt_messages, slot, permit))
+        return True
+
+    def stats(self) -> dict:
+        modes = {}
+        for mode, counts in self._counts.items():
+            modes[mode] = {
+                **counts,
+                "hedge_rate": round(counts["hedged"] / counts["requests"], 4) if counts["requests"] else 0.0,
+                "win_rate": round(counts["hedge_wins"] / counts["hedged"], 4) if counts["hedged"] else 0.0,
+                "hedge_delay_seconds": round(self.hedge_delay(mode), 3),
+            }
+        providers = {
+            name: {**self.breakers[name].stats(),
+                   "timeout_seconds": {mode: round(self.timeout(name, mode), 3) for mode in self._counts}}
+            for name in self._candidates()
+        }
+        return {"primary": self.primary, "secondary": self.secondary, "percentile": self.percentile, "modes": modes,
+                "providers": providers}
+
+    def health(self) -> dict:
+        """Circuit state of each provider in use."""
+        return {name: self.breakers[name].state for name in self._candidates()}
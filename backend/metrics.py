@@ -0,0 +1,296 @@
+import asyncio
+import bisect
+import functools
+import inspect
+import threading
+import time
+
+# Bucket upper bounds in seconds, suited to request and LLM latencies
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Finer buckets for database queries and in-process searches
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+REGISTRY = {}  # metric name -> metric
+_registry_lock = threading.Lock()
+
+
+class _ThreadShards:
+    """
+    One {label values: cells} dict per thread. A thread only ever writes its own dict, so
+    recording takes no lock (list item updates are atomic under the GIL); readers merge
+    every thread's dict. The lock is taken once per thread, when its dict is created.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = []
+
+    def mine(self) -> dict:
+        try:
+            return self._local.series
+        except AttributeError:
+            series = self._local.series = {}
+            with self._lock:
+                self._all.append(series)
+            return series
+
+    def merged(self, size: int) -> dict:
+        with self._lock:
+            shards = list(self._all)
+        result = {}
+        for shard in shards:
+            for labels, cells in list(shard.items()):
+                total = result.setdefault(labels, [0] * size)
+                for i, value in enumerate(list(cells)):
+                    total[i] += value
+        return result
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by label values."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._shards = _ThreadShards()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        series = self._shards.mine()
+        cells = series.get(label_values)
+        if cells is None:
+            cells = series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        cells[index] += 1
+        cells[-1] += value
+
+    def snapshot(self) -> dict:
+        """Return {label values: {"count", "sum", "buckets": {upper bound: cumulative count}}}."""
+        result = {}
+        for labels, series in self._shards.merged(len(self.buckets) + 2).items():
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                buckets[bound] = cumulative
+            result[labels] = {"count": cumulative, "sum": series[-1], "buckets": buckets}
+        return result
+
+
+class Counter:
+    """Monotonic count (or total, e.g. bytes), optionally split by label values."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._shards = _ThreadShards()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        series = self._shards.mine()
+        cells = series.get(label_values)
+        if cells is None:
+            cells = series[label_values] = [0]
+        cells[0] += amount
+
+    def snapshot(self) -> dict:
+        """Return {label values: value}."""
+        return {labels: cells[0] for labels, cells in self._shards.merged(1).items()}
+
+
+class Gauge:
+    """
+    A value that goes up and down. Either tracked with inc/dec (e.g. requests in flight) or,
+    with `function`, read at scrape time from a callable returning {label values: value}.
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.function = function
+        self._shards = _ThreadShards()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        series = self._shards.mine()
+        cells = series.get(label_values)
+        if cells is None:
+            cells = series[label_values] = [0]
+        cells[0] += amount
+
+    def dec(self, *label_values, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def snapshot(self) -> dict:
+        """Return {label values: value}."""
+        if self.function is not None:
+            return dict(self.function())
+        return {labels: cells[0] for labels, cells in self._shards.merged(1).items()}
+
+
+def _register(name: str, factory):
+    with _registry_lock:
+        metric = REGISTRY.get(name)
+        if metric is None:
+            metric = REGISTRY[name] = factory()
+        return metric
+
+
+def histogram(name: str, documentation: str, label_names=(), buckets=LATENCY_BUCKETS) -> Histogram:
+    """Return the registered histogram called `name`, creating it on first use."""
+    return _register(name, lambda: Histogram(name, documentation, label_names, buckets))
+
+
+def counter(name: str, documentation: str, label_names=()) -> Counter:
+    """Return the registered counter called `name`, creating it on first use."""
+    return _register(name, lambda: Counter(name, documentation, label_names))
+
+
+def gauge(name: str, documentation: str, label_names=(), function=None) -> Gauge:
+    """Return the registered gauge called `name`, creating it on first use."""
+    return _register(name, lambda: Gauge(name, documentation, label_names, function))
+
+
+def timed(metric: Histogram, *label_values):
+    """
+    Decorate a coroutine function or async generator so each call is observed in `metric`
+    with `label_values` plus an outcome label: "ok", "error", or "cancelled" when the caller
+    went away first. An async generator is timed until it is exhausted or closed.
+    """
+    def decorate(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def generator_wrapper(*args, **kwargs):
+                started, outcome = time.perf_counter(), "error"
+                try:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                    outcome = "ok"
+                except (GeneratorExit, asyncio.CancelledError):
+                    outcome = "cancelled"
+                    raise
+                finally:
+                    metric.observe(time.perf_counter() - started, *label_values, outcome)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started, outcome = time.perf_counter(), "error"
+            try:
+                result = await func(*args, **kwargs)
+                outcome = "ok"
+                return result
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            finally:
+                metric.observe(time.perf_counter() - started, *label_values, outcome)
+        return wrapper
+    return decorate
+
+
+def snapshot_all() -> dict:
+    """JSON-friendly view of every registered metric, keyed by metric name."""
+    result = {}
+    for name, metric in list(REGISTRY.items()):
+        if isinstance(metric, Histogram):
+            result[name] = [
+                {
+                    "labels": dict(zip(metric.label_names, labels)),
+                    "count": data["count"],
+                    "sum": round(data["sum"], 6),
+                    "buckets": {("+Inf" if bound == float("inf") else str(bound)): count
+                                for bound, count in data["buckets"].items()},
+                }
+                for labels, data in metric.snapshot().items()
+            ]
+        else:
+            result[name] = [{"labels": dict(zip(metric.label_names, labels)), "value": value}
+                            for labels, value in metric.snapshot().items()]
+    return result
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus() -> str:
+    """Every registered metric in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for name, metric in sorted(REGISTRY.items()):
+        lines.append(f"# HELP {name} {_escape(metric.documentation)}")
+        lines.append(f"# TYPE {name} {metric.type_name}")
+        if isinstance(metric, Histogram):
+            for labels, data in sorted(metric.snapshot().items()):
+                for bound, count in data["buckets"].items():
+                    le = f'le="{_number(bound)}"'
+                    lines.append(f"{name}_bucket{_labels(metric.label_names, labels, le)} {count}")
+                lines.append(f"{name}_sum{_labels(metric.label_names, labels)} {_number(data['sum'])}")
+                lines.append(f"{name}_count{_labels(metric.label_names, labels)} {data['count']}")
+        else:
+            for labels, value in sorted(metric.snapshot().items()):
+                lines.append(f"{name}{_labels(metric.label_names, labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+http_request_duration = histogram(
+    "http_request_duration_seconds", "Time to serve an HTTP request, by route template", ("method", "route"))
+http_requests = counter(
+    "http_requests_total", "HTTP requests served, by route template and status code", ("method", "route", "status"))
+http_in_flight = gauge("http_requests_in_flight", "HTTP requests currently being served")
+
+
+class HTTPMetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, status and in-flight count of every HTTP request.
+
+    Requests are labelled with the route template ("/api/products/{product_id}"), never the raw
+    path, so label cardinality stays bounded; mounted apps use their mount path, and requests no
+    route matched are "unmatched". An exception escaping the app counts as status 500.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+        http_in_flight.inc()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_in_flight.dec()
+            route = scope.get("route")
+            template = getattr(route, "path", None) or scope.get("root_path") or "unmatched"
+            http_request_duration.observe(time.perf_counter() - started, scope["method"], template)
+            http_requests.inc(scope["method"], template, str(status))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index, func
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
 
@@ -20,9 +20,13 @@ class Company(Base):
     services = relationship('Service', back_populates='company', cascade="all, delete-orphan")
     faqs = relationship('FAQ', back_populates='company', cascade="all, delete-orphan")
     policies = relationship('Policy', back_populates='company', cascade="all, delete-orphan")
+    # Company lookups by name are case-insensitive
+    __table_args__ = (Index('ix_companies_lower_name', func.lower(name)),)
 
 class User(Base):
     __tablename__ = 'users'
+    # Tenant-scoped lists and keyset pages filter on company_id and walk id (same for the catalog tables below)
+    __table_args__ = (Index('ix_users_company_id_id', 'company_id', 'id'),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String, unique=True, index=True, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
@@ -36,6 +40,7 @@ class User(Base):
 
 class Product(Base):
     __tablename__ = 'products'
+    __table_args__ = (Index('ix_products_company_id_id', 'company_id', 'id'),)
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True, nullable=False)
     description = Column(String, nullable=True)
@@ -47,6 +52,7 @@ class Product(Base):
 
 class Service(Base):
     __tablename__ = 'services'
+    __table_args__ = (Index('ix_services_company_id_id', 'company_id', 'id'),)
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True, nullable=False)
     description = Column(String, nullable=True)
@@ -57,6 +63,7 @@ class Service(Base):
 
 class FAQ(Base):
     __tablename__ = 'faqs'
+    __table_args__ = (Index('ix_faqs_company_id_id', 'company_id', 'id'),)
     id = Column(Integer, primary_key=True, index=True)
     question = Column(String, nullable=False)
     answer = Column(String, nullable=False)
@@ -65,6 +72,7 @@ class FAQ(Base):
 
 class Policy(Base):
     __tablename__ = 'policies'
+    __table_args__ = (Index('ix_policies_company_id_id', 'company_id', 'id'),)
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
     content = Column(String, nullable=False)
@@ -75,7 +83,7 @@ class ProductQuestion(Base):
     __tablename__ = 'product_questions'
     id = Column(Integer, primary_key=True, index=True)
     question = Column(String, nullable=False)
-    customer_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    customer_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
     answers = relationship('ProductAnswer', back_populates='question', cascade="all, delete-orphan")
     
@@ -84,12 +92,17 @@ class ProductAnswer(Base):
     id = Column(Integer, primary_key=True, index=True)
     answer = Column(String, nullable=False)
     agent_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    question_id = Column(Integer, ForeignKey('product_questions.id'), nullable=False)
+    question_id = Column(Integer, ForeignKey('product_questions.id'), nullable=False, index=True)
     product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
     question = relationship('ProductQuestion', back_populates='answers')
 
 class CartItem(Base):
     __tablename__ = 'cart_items'
+    # One line per product or service in a user's cart; also the ON CONFLICT targets of the cart upsert
+    __table_args__ = (
+        Index('uq_cart_items_user_id_product_id', 'user_id', 'product_id', unique=True),
+        Index('uq_cart_items_user_id_service_id', 'user_id', 'service_id', unique=True),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     product_id = Column(Integer, ForeignKey('products.id'), nullable=True)
@@ -98,4 +111,36 @@ class CartItem(Base):
     added_at = Column(String, nullable=False)  # Store timestamp as string
     user = relationship('User', backref='cart_items')
     product = relationship('Product', backref='cart_items')
-    service = relationship('Service', backref='cart_items')
\ No newline at end of file
+    service = relationship('Service', backref='cart_items')
+
+class Order(Base):
+    __tablename__ = 'orders'
+    __table_args__ = (Index('ix_orders_user_id_id', 'user_id', 'id'),)
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    company_id = Column(Integer, ForeignKey('companies.id'), nullable=False)
+    status = Column(String, nullable=False, default='placed')
+    total = Column(Integer, nullable=False, default=0)  # Store total in cents
+    created_at = Column(String, nullable=False)  # Store timestamp as string
+    lines = relationship('OrderLine', back_populates='order', cascade="all, delete-orphan")
+
+class OrderLine(Base):
+    __tablename__ = 'order_lines'
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=True)
+    service_id = Column(Integer, ForeignKey('services.id'), nullable=True)
+    # Name, price and period as they were at checkout, later catalog edits don't change the order
+    name = Column(String, nullable=False)
+    unit_price = Column(Integer, nullable=True)  # Store price in cents
+    period = Column(String, nullable=True)
+    quantity = Column(Integer, nullable=False)
+    order = relationship('Order', back_populates='lines')
+
+class ChatMessage(Base):
+    __tablename__ = 'chat_messages'
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, index=True, nullable=False)  # Chat user id, not necessarily a users row
+    role = Column(String, nullable=False)  # user or assistant
+    content = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
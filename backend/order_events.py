@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+import time
+import metrics
+
+ORDER_EVENT_QUEUE_SIZE = int(os.getenv("ORDER_EVENT_QUEUE_SIZE", "10000"))
+ORDER_EVENT_WORKERS = int(os.getenv("ORDER_EVENT_WORKERS", "2"))
+
+logger = logging.getLogger(__name__)
+
+task_duration = metrics.histogram(
+    "order_event_task_seconds", "Time spent in each post-checkout task", ("task",))
+order_value = metrics.histogram(
+    "order_value_cents", "Total of each placed order in cents",
+    buckets=(500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000))
+
+
+async def send_order_confirmation(event: dict) -> None:
+    # No mail service is configured; this is where the confirmation email would be sent
+    logger.info("Order %s confirmed for %s: %s lines, total %s cents", event['order_id'], event['email'], event['line_count'], event['total'])
+
+
+async def record_order_analytics(event: dict) -> None:
+    order_value.observe(event["total"])
+
+
+ORDER_EVENT_HANDLERS = (send_order_confirmation, record_order_analytics)
+
+
+class OrderEventQueue:
+    """
+    Runs post-checkout work (confirmation, analytics) on background tasks, off the request path.
+
+    Checkout commits the order, publishes an event and returns; `workers` tasks take events
+    from a bounded queue and run each handler. When the queue is full the event is dropped
+    (and counted) rather than slowing checkout down. Events still queued at shutdown are
+    drained for up to `drain_seconds`.
+    """
+
+    def __init__(self, handlers=ORDER_EVENT_HANDLERS, maxsize: int = ORDER_EVENT_QUEUE_SIZE,
+                 workers: int = ORDER_EVENT_WORKERS, drain_seconds: float = 5.0):
+        self.handlers = handlers
+        self.maxsize = maxsize
+        self.workers = workers
+        self.drain_seconds = drain_seconds
+        self._queue = None
+        self._tasks = []
+        self._loop = None
+        self.published = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+
+    async def start(self) -> None:
+        """Start the workers on the running loop. Called from the app lifespan."""
+        self._ensure_started()
+
+    def _ensure_started(self) -> None:
+        # Also used outside the app lifespan (scripts, benchmarks): start on first publish
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue(self.maxsize)
+            self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def publish(self, event: dict) -> bool:
+        """Queue an event for the handlers; False if the queue was full and the event dropped."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("Order event queue full, dropped event for order %s", event.get('order_id'))
+            return False
+        self.published += 1
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            event = await self._queue.get()
+            try:
+                for handler in self.handlers:
+                    started = time.perf_counter()
+                    try:
+                        await handler(event)
+                    except Exception as e:
+                        self.failed += 1
+                        logger.warning("Order event handler %s failed for order %s: %s", handler.__name__, event.get('order_id'), e)
+                    finally:
+                        task_duration.observe(time.perf_counter() - started, handler.__name__)
+                self.processed += 1
+            finally:
+                self._queue.task_done()
+
+    async def shutdown(self) -> None:
+        if self._loop is not asyncio.get_running_loop():
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), self.drain_seconds)
+        except asyncio.TimeoutError:
+            logger.warning("Order event queue: %s events not processed at shutdown", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks, self._queue, self._loop = [], None, None
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "published": self.published,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+order_events = OrderEventQueue()
@@ -0,0 +1,102 @@
+import base64
+import binascii
+import os
+from fastapi import HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+# Hard cap on list page size; clients asking for more get this many
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+DEFAULT_PAGE_SIZE = 100
+# Rows fetched per query while streaming an NDJSON export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+
+def encode_cursor(company_id: int, last_id: int) -> str:
+    """Opaque token for the page after the row (company_id, last_id)."""
+    return base64.urlsafe_b64encode(f"{company_id}:{last_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None, company_id: int) -> int:
+    """Return the id to continue after (0 for the first page); 400 for a malformed or foreign cursor."""
+    if not cursor:
+        return 0
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        cursor_company_id, last_id = (int(part) for part in raw.split(":"))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    if cursor_company_id != company_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor belongs to another company")
+    return last_id
+
+
+class PageParams:
+    """Query parameters of a keyset-paginated list: ?limit=&cursor="""
+
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, description=f"Page size, at most {MAX_PAGE_SIZE}"),
+        cursor: str | None = Query(None, description="next_cursor of the previous page"),
+    ):
+        self.limit = min(limit, MAX_PAGE_SIZE)
+        self.cursor = cursor
+
+
+def keyset_select(model, company_id: int, after_id: int, limit: int):
+    """The next `limit` rows of a company after `after_id`, walking the (company_id, id) index."""
+    return (select(model)
+            .where(model.company_id == company_id, model.id > after_id)
+            .order_by(model.id)
+            .limit(limit))
+
+
+def page_select(model, company_id: int, page: PageParams):
+    # One extra row tells us whether there is a next page
+    return keyset_select(model, company_id, decode_cursor(page.cursor, company_id), page.limit + 1)
+
+
+def split_page(rows, company_id: int, page: PageParams) -> tuple[list, str | None]:
+    """Trim the look-ahead row; returns the page's rows and the cursor of the next page (None on the last)."""
+    rows = list(rows)
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        return rows, encode_cursor(company_id, rows[-1].id)
+    return rows, None
+
+
+def set_next_page_headers(response: Response, next_cursor: str | None, page: PageParams, request: Request) -> None:
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+        next_url = request.url.include_query_params(cursor=next_cursor, limit=page.limit)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+
+
+def finish_page(rows, company_id: int, page: PageParams, request: Request, response: Response) -> list:
+    """
+    Trim the look-ahead row and advertise the next page. The body stays a plain JSON list;
+    the next cursor goes in the X-Next-Cursor header and a Link: rel="next" header.
+    """
+    rows, next_cursor = split_page(rows, company_id, page)
+    set_next_page_headers(response, next_cursor, page, request)
+    return rows
+
+
+def ndjson_export(session_factory, model, schema, company_id: int, batch_size: int = EXPORT_BATCH_SIZE) -> StreamingResponse:
+    """
+    Stream every row of a company as newline-delimited JSON, one keyset batch at a time, so
+    memory use stays flat however large the tenant is. Each batch uses its own short session.
+    """
+    async def lines():
+        after_id = 0
+        while True:
+            async with session_factory() as db:
+                rows = (await db.scalars(keyset_select(model, company_id, after_id, batch_size))).all()
+            if not rows:
+                return
+            yield "".join(schema.model_validate(row).model_dump_json() + "\n" for row in rows)
+            if len(rows) < batch_size:
+                return
+            after_id = rows[-1].id
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
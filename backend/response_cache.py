@@ -0,0 +1,256 @@
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from kb_index import tokenize
+from tenant_kb import tenant_knowledge_bases
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+# Near-duplicate tier: serve "business hours of the store?" from the entry for "what are the store's business hours"
+# Off by default; a match also needs exactly the same content words, so "opened"/"unopened" never share an answer
+RESPONSE_CACHE_NEAR_DUPLICATES = os.getenv("RESPONSE_CACHE_NEAR_DUPLICATES", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.9"))
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase and strip punctuation and extra whitespace."""
+    return " ".join(_WORD_RE.findall(message.lower()))
+
+
+def content_words(message: str) -> frozenset:
+    """The words that carry the question's meaning: stop words dropped, negations kept."""
+    return frozenset(tokenize(message))
+
+
+def history_digest(history) -> str:
+    """Digest of the conversation messages sent to the LLM before the question; "" for a first message."""
+    if not history:
+        return ""
+    hasher = hashlib.sha256()
+    for message in history:
+        hasher.update(f"{message['role']}\x00{message['content']}\x00".encode())
+    return hasher.hexdigest()
+
+
+def _shingles(normalized: str) -> set:
+    # Character trigrams tolerate typos and abbreviations ("ur" for "your") better than whole words
+    padded = f" {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MinHasher:
+    """MinHash signatures for estimating Jaccard similarity of shingle sets."""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._params = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+
+    def signature(self, shingles: set) -> tuple:
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingles]
+        if not hashes:
+            return ()
+        return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._params)
+
+    @staticmethod
+    def similarity(sig_a: tuple, sig_b: tuple) -> float:
+        if not sig_a or len(sig_a) != len(sig_b):
+            return 0.0
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class _Entry:
+    __slots__ = ("response", "expires_at", "company_id", "doc_ids", "words", "signature", "bands")
+
+    def __init__(self, response, expires_at, company_id, doc_ids, words, signature, bands):
+        self.response = response
+        self.expires_at = expires_at
+        self.company_id = company_id
+        self.doc_ids = doc_ids
+        self.words = words
+        self.signature = signature
+        self.bands = bands
+
+
+class ResponseCache:
+    """
+    Cache of LLM chat responses keyed on (company, conversation so far, normalized message,
+    KB hit set).
+
+    The conversation is part of the key as a digest of the history sent to the LLM, so a
+    follow-up such as "cancel it" is only answered from a conversation identical to its own;
+    first messages, with no history, are shared across users. The KB hit set is part of the key, so adding a document that changes what a question
+    retrieves produces a miss on its own. Updates and deletes of a document drop every
+    entry that was answered with it. The optional near-duplicate tier uses MinHash with
+    LSH banding and only matches entries with the same company, conversation, KB hit set and content
+    words (see `content_words`): similar spelling alone never shares an answer.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+                 near_duplicates: bool = RESPONSE_CACHE_NEAR_DUPLICATES,
+                 similarity_threshold: float = RESPONSE_CACHE_SIMILARITY, num_perm: int = 64, bands: int = 16):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.near_duplicates = near_duplicates
+        self.similarity_threshold = similarity_threshold
+        self.bands = bands
+        self._rows_per_band = num_perm // bands
+        self._hasher = MinHasher(num_perm)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> _Entry, least recently used first
+        self._by_document = {}         # (company_id, doc_id) -> set of keys answered with that document
+        self._lsh_buckets = {}         # band key -> set of keys
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(company_id, context: str, normalized: str, doc_ids: tuple) -> tuple:
+        return (company_id, context, normalized, doc_ids)
+
+    def _band_keys(self, company_id, context, doc_ids, signature):
+        if not signature:
+            return ()
+        rows = self._rows_per_band
+        return tuple((company_id, context, doc_ids, band, signature[band * rows:(band + 1) * rows])
+                     for band in range(self.bands))
+
+    def get(self, company_id, message: str, kb_doc_ids, history=()) -> str | None:
+        """The cached answer to `message` after the conversation `history` (messages sent to the LLM)."""
+        normalized = normalize_message(message)
+        doc_ids = tuple(sorted(kb_doc_ids))
+        context = history_digest(history)
+        key = self.make_key(company_id, context, normalized, doc_ids)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._lookup(key, now)
+            if entry is not None:
+                self.hits += 1
+                return entry.response
+
+        if self.near_duplicates:
+            signature = self._hasher.signature(_shingles(normalized))
+            words = content_words(message)
+            with self._lock:
+                best_key, best_similarity = None, self.similarity_threshold
+                for band_key in self._band_keys(company_id, context, doc_ids, signature):
+                    for candidate in self._lsh_buckets.get(band_key, ()):
+                        candidate_entry = self._entries[candidate]
+                        if candidate_entry.words != words:
+                            continue
+                        similarity = MinHasher.similarity(signature, candidate_entry.signature)
+                        if similarity >= best_similarity:
+                            best_key, best_similarity = candidate, similarity
+                entry = self._lookup(best_key, now) if best_key is not None else None
+                if entry is not None:
+                    self.near_hits += 1
+                    return entry.response
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _lookup(self, key, now):
+        # Caller must hold the lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, company_id, message: str, kb_doc_ids, response: str, history=()) -> None:
+        normalized = normalize_message(message)
+        if not normalized:
+            return
+        doc_ids = tuple(sorted(kb_doc_ids))
+        context = history_digest(history)
+        key = self.make_key(company_id, context, normalized, doc_ids)
+        signature = self._hasher.signature(_shingles(normalized)) if self.near_duplicates else ()
+        words = content_words(message) if self.near_duplicates else frozenset()
+        bands = self._band_keys(company_id, context, doc_ids, signature)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(response, time.monotonic() + self.ttl_seconds, company_id, doc_ids, words,
+                                       signature, bands)
+            for doc_id in doc_ids:
+                self._by_document.setdefault((company_id, doc_id), set()).add(key)
+            for band_key in bands:
+                self._lsh_buckets.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key) -> None:
+        # Caller must hold the lock
+        entry = self._entries.pop(key)
+        for doc_id in entry.doc_ids:
+            keys = self._by_document.get((entry.company_id, doc_id))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_document[(entry.company_id, doc_id)]
+        for band_key in entry.bands:
+            keys = self._lsh_buckets.get(band_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._lsh_buckets[band_key]
+
+    def invalidate_document(self, company_id, doc_id) -> None:
+        """Drop every response that was generated with `doc_id` in its KB context."""
+        with self._lock:
+            for key in list(self._by_document.get((company_id, doc_id), ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def invalidate_company(self, company_id) -> None:
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry.company_id == company_id]:
+                self._remove(key)
+                self.invalidations += 1
+
+    def on_kb_change(self, company_id, doc_id) -> None:
+        # Listener for tenant KB changes; doc_id is None when the whole tenant was invalidated
+        if doc_id is None:
+            self.invalidate_company(company_id)
+        else:
+            self.invalidate_document(company_id, doc_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_document.clear()
+            self._lsh_buckets.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "near_duplicate_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+response_cache = ResponseCache()
+tenant_knowledge_bases.add_change_listener(response_cache.on_kb_change)
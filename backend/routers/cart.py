@@ -1,7 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete, insert, update, literal, null, func, and_, or_
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import sys
+import logging
 import os
 from datetime import datetime
 # Add the parent directory to sys.path
@@ -9,115 +13,134 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 import schemas
 from dependencies import get_current_user_company_id, get_customer_only, get_customer_user
-from database import get_db
+from database import get_async_db, get_async_repeatable_read_db
+from customer_profile import invalidate_customer_profile
+from order_events import order_events
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/cart",
     tags=["cart"],
 )
 
-@router.post("/items", response_model=schemas.CartItemResponse, status_code=status.HTTP_201_CREATED)
-def add_to_cart(
-    item: schemas.CartItemCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_customer_user)  # All users can add to cart
-):
-    print(f"Adding item to cart: {item}")
-    print(f"Current user: {current_user.email}, role: {current_user.role}, company_id: {current_user.company_id}")
+def check_cart_target(product_id: int | None, service_id: int | None):
     # Validate that either product_id or service_id is provided, but not both
-    if (item.product_id is None and item.service_id is None) or (item.product_id is not None and item.service_id is not None):
+    if (product_id is None and service_id is None) or (product_id is not None and service_id is not None):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Either product_id or service_id must be provided, but not both"
         )
+
+def cart_upsert(dialect_name: str, user_id: int, company_id: int, product_id: int | None, service_id: int | None,
+                quantity: int, added_at: str, replace: bool = False):
+    """
+    Add a product or service line to a cart in one statement:
+    INSERT ... SELECT ... ON CONFLICT (user_id, product_id|service_id) DO UPDATE.
+
+    The SELECT reads the product/service row filtered by the user's company, so nothing is
+    inserted (and no row returned) for one that doesn't exist or belongs to another company.
+    An existing line gets `quantity` added to it, or replaced with it if `replace`.
+    """
+    dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    catalog, target = (models.Product, "product_id") if product_id is not None else (models.Service, "service_id")
+    source = select(
+        literal(user_id),
+        catalog.id if product_id is not None else null(),
+        catalog.id if service_id is not None else null(),
+        literal(quantity),
+        literal(added_at),
+    ).where(catalog.id == (product_id if product_id is not None else service_id), catalog.company_id == company_id)
+    stmt = dialect_insert(models.CartItem).from_select(["user_id", "product_id", "service_id", "quantity", "added_at"], source)
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", target],
+        set_={"quantity": stmt.excluded.quantity if replace else models.CartItem.quantity + stmt.excluded.quantity},
+    ).returning(*models.CartItem.__table__.c)
+
+def not_found_in_company(product_id: int | None) -> HTTPException:
+    kind = "Product" if product_id is not None else "Service"
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"{kind} not found or not available to your company")
+
+@router.post("/items", response_model=schemas.CartItemResponse, status_code=status.HTTP_201_CREATED)
+async def add_to_cart(
+    item: schemas.CartItemCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_customer_user)  # All users can add to cart
+):
+    logger.debug("Adding item to cart: %s", item)
+    check_cart_target(item.product_id, item.service_id)
     
-    # Check if the product or service exists and belongs to the user's company
-    if item.product_id:
-        db_product = db.query(models.Product).filter(
-            models.Product.id == item.product_id,
-            models.Product.company_id == current_user.company_id
-        ).first()
-        if db_product is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Product not found or not available to your company"
-            )
-    
-    if item.service_id:
-        db_service = db.query(models.Service).filter(
-            models.Service.id == item.service_id,
-            models.Service.company_id == current_user.company_id
-        ).first()
-        if db_service is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Service not found or not available to your company"
-            )
-    
-    # Check if the item is already in the cart
-    existing_item = None
-    if item.product_id:
-        existing_item = db.query(models.CartItem).filter(
-            models.CartItem.user_id == current_user.id,
-            models.CartItem.product_id == item.product_id
-        ).first()
-    elif item.service_id:
-        existing_item = db.query(models.CartItem).filter(
-            models.CartItem.user_id == current_user.id,
-            models.CartItem.service_id == item.service_id
-        ).first()
-    
-    # If the item is already in the cart, update the quantity
-    if existing_item:
-        existing_item.quantity += item.quantity
-        db.commit()
-        db.refresh(existing_item)
-        return existing_item
-    
-    # Otherwise, create a new cart item
+    # Adds the line or bumps its quantity atomically, so concurrent adds can't create duplicate lines
+    result = await db.execute(cart_upsert(
+        db.get_bind().dialect.name, current_user.id, current_user.company_id,
+        item.product_id, item.service_id, item.quantity, datetime.now().isoformat()
+    ))
+    db_item = result.mappings().first()
+    if db_item is None:
+        raise not_found_in_company(item.product_id)
+    await db.commit()
+    invalidate_customer_profile(current_user.id)
+    return dict(db_item)
+
+@router.post("/items:batch", response_model=List[schemas.CartItemResponse])
+async def batch_cart_items(
+    batch: schemas.CartBatchRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_customer_user)  # All users can change their cart
+):
+    """
+    Add, set or remove many cart lines in one transaction and return the resulting cart.
+
+    Operations run in order; if one fails (bad target, unknown product or service) none
+    of them are applied.
+    """
+    dialect_name = db.get_bind().dialect.name
     timestamp = datetime.now().isoformat()
-    print(f"Creating new cart item with timestamp: {timestamp}")
-    print(f"User ID: {current_user.id}")
-    print(f"Product ID: {item.product_id}")
-    print(f"Service ID: {item.service_id}")
-    print(f"Quantity: {item.quantity}")
-    
-    db_item = models.CartItem(
-        user_id=current_user.id,
-        product_id=item.product_id,
-        service_id=item.service_id,
-        quantity=item.quantity,
-        added_at=timestamp
-    )
-    
-    print(f"Created cart item: {db_item.__dict__}")
-    
-    db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+    for position, operation in enumerate(batch.operations):
+        try:
+            check_cart_target(operation.product_id, operation.service_id)
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=f"operations[{position}]: {e.detail}")
+        
+        if operation.op == "remove" or (operation.op == "set" and operation.quantity <= 0):
+            column = models.CartItem.product_id if operation.product_id is not None else models.CartItem.service_id
+            await db.execute(delete(models.CartItem).where(
+                models.CartItem.user_id == current_user.id,
+                column == (operation.product_id if operation.product_id is not None else operation.service_id)
+            ))
+            continue
+        
+        result = await db.execute(cart_upsert(
+            dialect_name, current_user.id, current_user.company_id, operation.product_id, operation.service_id,
+            operation.quantity, timestamp, replace=operation.op == "set"
+        ))
+        if result.first() is None:
+            e = not_found_in_company(operation.product_id)
+            raise HTTPException(status_code=e.status_code, detail=f"operations[{position}]: {e.detail}")
     
-    print(f"Saved cart item: {db_item.__dict__}")
-    
-    return db_item
+    await db.commit()
+    invalidate_customer_profile(current_user.id)
+    result = await db.execute(select(models.CartItem).where(models.CartItem.user_id == current_user.id))
+    return result.scalars().all()
 
 @router.get("/items", response_model=List[schemas.CartItemResponse])
-def get_cart_items(
-    db: Session = Depends(get_db),
+async def get_cart_items(
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_customer_user)  # All users can view their cart
 ):
-    cart_items = db.query(models.CartItem).filter(models.CartItem.user_id == current_user.id).all()
-    return cart_items
+    result = await db.execute(select(models.CartItem).where(models.CartItem.user_id == current_user.id))
+    return result.scalars().all()
 
 @router.delete("/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
-def remove_from_cart(
+async def remove_from_cart(
     item_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_customer_user)  # All users can remove items from their cart
 ):
-    db_item = db.query(models.CartItem).filter(
+    db_item = await db.scalar(select(models.CartItem).where(
         models.CartItem.id == item_id,
         models.CartItem.user_id == current_user.id
-    ).first()
+    ))
     
     if db_item is None:
         raise HTTPException(
@@ -125,21 +148,22 @@ def remove_from_cart(
             detail="Cart item not found or not owned by user"
         )
     
-    db.delete(db_item)
-    db.commit()
+    await db.delete(db_item)
+    await db.commit()
+    invalidate_customer_profile(current_user.id)
     return
 
 @router.put("/items/{item_id}", response_model=schemas.CartItemResponse)
-def update_cart_item(
+async def update_cart_item(
     item_id: int,
     item: schemas.CartItemBase,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_customer_user)  # All users can update their cart
 ):
-    db_item = db.query(models.CartItem).filter(
+    db_item = await db.scalar(select(models.CartItem).where(
         models.CartItem.id == item_id,
         models.CartItem.user_id == current_user.id
-    ).first()
+    ))
     
     if db_item is None:
         raise HTTPException(
@@ -149,29 +173,94 @@ def update_cart_item(
     
     # Update the quantity
     db_item.quantity = item.quantity
-    db.commit()
-    db.refresh(db_item)
+    await db.commit()
+    invalidate_customer_profile(current_user.id)
+    await db.refresh(db_item)
     return db_item
 
+def order_lines_from_cart(order_id: int, user_id: int, company_id: int):
+    """
+    SELECT the user's cart lines as order lines, with the product or service name, price and
+    period copied from the catalog. Lines whose product or service is gone are left out.
+    """
+    return select(
+        literal(order_id),
+        models.CartItem.product_id,
+        models.CartItem.service_id,
+        func.coalesce(models.Product.name, models.Service.name),
+        func.coalesce(models.Product.price, models.Service.price),
+        models.Service.period,
+        models.CartItem.quantity,
+    ).select_from(models.CartItem).outerjoin(
+        models.Product, and_(models.Product.id == models.CartItem.product_id, models.Product.company_id == company_id)
+    ).outerjoin(
+        models.Service, and_(models.Service.id == models.CartItem.service_id, models.Service.company_id == company_id)
+    ).where(
+        models.CartItem.user_id == user_id,
+        or_(models.Product.id.isnot(None), models.Service.id.isnot(None))
+    )
+
 @router.post("/checkout", status_code=status.HTTP_200_OK)
-def checkout(
-    db: Session = Depends(get_db),
+async def checkout(
+    # REPEATABLE READ on PostgreSQL: the cart DELETE must remove exactly the lines the INSERT ... SELECT
+    # copied; a concurrent change to one of them fails the checkout instead of being silently dropped
+    db: AsyncSession = Depends(get_async_repeatable_read_db),
     current_user: models.User = Depends(get_customer_only)  # Only customers can checkout
 ):
-    # Get all cart items for the user
-    cart_items = db.query(models.CartItem).filter(models.CartItem.user_id == current_user.id).all()
-    
-    if not cart_items:
+    """
+    Turn the cart into an order in one transaction, with a fixed number of statements
+    however many lines the cart has: insert the order, INSERT ... SELECT its lines from the
+    cart (snapshotting prices), set the order total, and bulk-delete the cart. Confirmation
+    and analytics run afterwards on the order event queue.
+    """
+    try:
+        order_id = await db.scalar(insert(models.Order).values(
+            user_id=current_user.id,
+            company_id=current_user.company_id,
+            status="placed",
+            total=0,
+            created_at=datetime.now().isoformat()
+        ).returning(models.Order.id))
+        
+        lines = await db.execute(insert(models.OrderLine).from_select(
+            ["order_id", "product_id", "service_id", "name", "unit_price", "period", "quantity"],
+            order_lines_from_cart(order_id, current_user.id, current_user.company_id)
+        ))
+        # Make sure the user has something in the cart (the order insert is rolled back with the session)
+        if lines.rowcount == 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cart is empty"
+            )
+        
+        total = await db.scalar(update(models.Order).where(models.Order.id == order_id).values(
+            total=select(func.coalesce(func.sum(models.OrderLine.unit_price * models.OrderLine.quantity), 0))
+            .where(models.OrderLine.order_id == order_id).scalar_subquery()
+        ).returning(models.Order.total))
+        
+        await db.execute(delete(models.CartItem).where(models.CartItem.user_id == current_user.id))
+        await db.commit()
+    except DBAPIError as e:
+        if getattr(e.orig, "sqlstate", None) != "40001":  # serialization_failure
+            raise
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Cart is empty"
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Your cart changed during checkout, please try again"
         )
     
-    # In a real application, you would process the order here
-    # For this demo, we'll just clear the cart
-    for item in cart_items:
-        db.delete(item)
-    
-    db.commit()
+    invalidate_customer_profile(current_user.id)
+    order_events.publish({
+        "order_id": order_id,
+        "user_id": current_user.id,
+        "email": current_user.email,
+        "company_id": current_user.company_id,
+        "total": total,
+        "line_count": lines.rowcount,
+    })
     
-    return {"message": "Checkout successful. Your order has been placed."}
\ No newline at end of file
+    return {
+        "message": "Checkout successful. Your order has been placed.",
+        "order_id": order_id,
+        "total": total,
+        "line_count": lines.rowcount
+    }
@@ -2,16 +2,18 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 import sys
+import logging
 import os
 # Add the parent directory to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 import schemas
 from database import get_db
-from passlib.context import CryptContext
+from password_hashing import password_hasher
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 @router.post("/register", response_model=schemas.CompanyResponse)
 async def register_company(
@@ -26,15 +28,15 @@ async def register_company(
     db: Session = Depends(get_db)
 ):
     try:
-        print(f"Registering company: {companyName}, {companyEmail}, {phone}, {website}, {industry}, {description}, logo={logo.filename if logo else None}")
+        logger.debug("Registering company: %s, %s, %s, %s, %s, %s, logo=%s", companyName, companyEmail, phone, website, industry, description, logo.filename if logo else None)
         normalized_name = companyName.strip().lower()
         db_company = db.query(models.Company).filter(models.Company.name == normalized_name).first()
         if db_company:
-            print("Company name already registered")
+            logger.warning("Company name already registered")
             raise HTTPException(status_code=400, detail="Company name already registered")
         db_email = db.query(models.Company).filter(models.Company.email == companyEmail).first()
         if db_email:
-            print("Company email already registered")
+            logger.warning("Company email already registered")
             raise HTTPException(status_code=400, detail="Company email already registered")
         logo_path = None
         if logo:
@@ -43,7 +45,7 @@ async def register_company(
             logo_path = os.path.join(logo_dir, logo.filename)
             with open(logo_path, "wb") as f:
                 f.write(await logo.read())
-        hashed_password = pwd_context.hash(password)
+        hashed_password = await password_hasher.hash(password)
         new_company = models.Company(
             name=normalized_name,
             email=companyEmail,
@@ -57,7 +59,7 @@ async def register_company(
         db.add(new_company)
         db.commit()
         db.refresh(new_company)
-        print(f"Company registered: {new_company.id}")
+        logger.info("Company registered: %s", new_company.id)
         return schemas.CompanyResponse(
             id=new_company.id,
             name=new_company.name,
@@ -69,7 +71,7 @@ async def register_company(
             logo=new_company.logo,
         )
     except Exception as e:
-        print(f"Registration error: {e}")
+        logger.error("Registration error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/by-name/{name}", response_model=schemas.CompanyResponse)
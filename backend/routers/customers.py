@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+import sys
+import os
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
+from dependencies import get_agent_user
+from database import get_async_read_db
+from customer_profile import get_customer_profile
+
+router = APIRouter(
+    prefix="/customers",
+    tags=["customers"],
+)
+
+@router.get("/{customer_id}/profile")
+async def read_customer_profile(
+    customer_id: str,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: models.User = Depends(get_agent_user)  # Only agents and admins can see customer profiles
+):
+    """Customer-360 view for agents: personal info, cart and product questions. customer_id is a user ID or email."""
+    profile = await get_customer_profile(db, customer_id, current_user.company_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Customer not found in your company")
+    return profile
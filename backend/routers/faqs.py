@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List
-
-from backend import models, schemas
-from backend.dependencies import get_current_user_company_id
-from backend.database import get_db
+import sys
+import os
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
+import schemas
+from dependencies import get_current_user_company_id
+from database import get_db, get_read_db, async_read_sessionmaker
+from pagination import PageParams, page_select, finish_page, ndjson_export
+from tenant_kb import tenant_knowledge_bases
 
 router = APIRouter(
     prefix="/faqs",
@@ -21,22 +28,32 @@ def create_faq(
     db.add(db_faq)
     db.commit()
     db.refresh(db_faq)
+    tenant_knowledge_bases.upsert(current_company_id, db_faq)
     return db_faq
 
 @router.get("/", response_model=List[schemas.FAQResponse])
 def read_faqs(
-    skip: int = 0, 
-    limit: int = 100, 
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_read_db),
+    current_company_id: int = Depends(get_current_user_company_id)
+):
+    faqs = db.scalars(page_select(models.FAQ, current_company_id, page)).all()
+    return finish_page(faqs, current_company_id, page, request, response)
+
+@router.get("/export", response_class=StreamingResponse)
+def export_faqs(
+    request: Request,
     current_company_id: int = Depends(get_current_user_company_id)
 ):
-    faqs = db.query(models.FAQ).filter(models.FAQ.company_id == current_company_id).offset(skip).limit(limit).all()
-    return faqs
+    """Every faq of the company as NDJSON, streamed in keyset batches."""
+    return ndjson_export(async_read_sessionmaker(request), models.FAQ, schemas.FAQResponse, current_company_id)
 
 @router.get("/{faq_id}", response_model=schemas.FAQResponse)
 def read_faq(
     faq_id: int, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_company_id: int = Depends(get_current_user_company_id)
 ):
     db_faq = db.query(models.FAQ).filter(models.FAQ.id == faq_id, models.FAQ.company_id == current_company_id).first()
@@ -61,6 +78,7 @@ def update_faq(
     
     db.commit()
     db.refresh(db_faq)
+    tenant_knowledge_bases.upsert(current_company_id, db_faq)
     return db_faq
 
 @router.delete("/{faq_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -74,4 +92,5 @@ def delete_faq(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="FAQ not found or not owned by company")
     db.delete(db_faq)
     db.commit()
+    tenant_knowledge_bases.remove(current_company_id, "faq", faq_id)
     return 
\ No newline at end of file
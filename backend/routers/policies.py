@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List
 import sys
@@ -8,7 +9,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 import schemas
 from dependencies import get_current_user_company_id, get_admin_user, get_agent_user, get_customer_user
-from database import get_db
+from database import get_db, get_read_db, async_read_sessionmaker
+from pagination import PageParams, page_select, finish_page, ndjson_export
+from tenant_kb import tenant_knowledge_bases
 
 router = APIRouter(
     prefix="/policies",
@@ -26,22 +29,32 @@ def create_policy(
     db.add(db_policy)
     db.commit()
     db.refresh(db_policy)
+    tenant_knowledge_bases.upsert(current_company_id, db_policy)
     return db_policy
 
 @router.get("/", response_model=List[schemas.PolicyResponse])
 def read_policies(
-    skip: int = 0, 
-    limit: int = 100, 
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_read_db),
     current_company_id: int = Depends(get_current_user_company_id)
 ):
-    policies = db.query(models.Policy).filter(models.Policy.company_id == current_company_id).offset(skip).limit(limit).all()
-    return policies
+    policies = db.scalars(page_select(models.Policy, current_company_id, page)).all()
+    return finish_page(policies, current_company_id, page, request, response)
+
+@router.get("/export", response_class=StreamingResponse)
+def export_policies(
+    request: Request,
+    current_company_id: int = Depends(get_current_user_company_id)
+):
+    """Every policy of the company as NDJSON, streamed in keyset batches."""
+    return ndjson_export(async_read_sessionmaker(request), models.Policy, schemas.PolicyResponse, current_company_id)
 
 @router.get("/{policy_id}", response_model=schemas.PolicyResponse)
 def read_policy(
     policy_id: int, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_company_id: int = Depends(get_current_user_company_id)
 ):
     db_policy = db.query(models.Policy).filter(models.Policy.id == policy_id, models.Policy.company_id == current_company_id).first()
@@ -67,6 +80,7 @@ def update_policy(
     
     db.commit()
     db.refresh(db_policy)
+    tenant_knowledge_bases.upsert(current_company_id, db_policy)
     return db_policy
 
 @router.delete("/{policy_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -81,4 +95,5 @@ def delete_policy(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Policy not found or not owned by company")
     db.delete(db_policy)
     db.commit()
+    tenant_knowledge_bases.remove(current_company_id, "policy", policy_id)
     return 
\ No newline at end of file
@@ -1,5 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import TypeAdapter
 from typing import List
 import sys
 import os
@@ -8,7 +11,10 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 import schemas
 from dependencies import get_current_user_company_id, get_admin_user, get_agent_user, get_customer_user, get_customer_only
-from database import get_db
+from database import get_async_db, get_async_read_db, async_read_sessionmaker
+from pagination import PageParams, page_select, ndjson_export
+from catalog_cache import CatalogCache, get_catalog_cache
+from tenant_kb import tenant_knowledge_bases
 
 router = APIRouter(
     prefix="/products",
@@ -16,51 +22,78 @@ router = APIRouter(
     # dependencies=[Depends(get_current_active_user)] # You can add global auth here if all routes need it
 )
 
+product_list_adapter = TypeAdapter(List[schemas.ProductResponse])
+product_adapter = TypeAdapter(schemas.ProductResponse)
+
+async def get_company_product(db: AsyncSession, product_id: int, company_id: int) -> models.Product | None:
+    result = await db.execute(
+        select(models.Product).where(models.Product.id == product_id, models.Product.company_id == company_id)
+    )
+    return result.scalars().first()
+
 @router.post("/", response_model=schemas.ProductResponse, status_code=status.HTTP_201_CREATED)
-def create_product(
+async def create_product(
     product: schemas.ProductCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    cache: CatalogCache = Depends(get_catalog_cache),
     current_company_id: int = Depends(get_current_user_company_id),
     current_user: models.User = Depends(get_admin_user)  # Only admins can create products
 ):
     db_product = models.Product(**product.model_dump(), company_id=current_company_id)
     db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
+    await db.commit()
+    await db.refresh(db_product)
+    tenant_knowledge_bases.upsert(current_company_id, db_product)
+    await cache.invalidate("products", current_company_id, db_product.id)
     return db_product
 
 @router.get("/", response_model=List[schemas.ProductResponse])
-def read_products(
-    skip: int = 0, 
-    limit: int = 100, 
-    db: Session = Depends(get_db),
+async def read_products(
+    request: Request,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_read_db),
+    cache: CatalogCache = Depends(get_catalog_cache),
     current_company_id: int = Depends(get_current_user_company_id),
     current_user: models.User = Depends(get_customer_user)  # All authenticated users can view products
 ):
-    products = db.query(models.Product).filter(models.Product.company_id == current_company_id).offset(skip).limit(limit).all()
-    return products
+    async def load_rows():
+        result = await db.execute(page_select(models.Product, current_company_id, page))
+        return result.scalars().all()
+    return await cache.page("products", current_company_id, page, request, load_rows, product_list_adapter)
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_products(
+    request: Request,
+    current_company_id: int = Depends(get_current_user_company_id),
+    current_user: models.User = Depends(get_customer_user)
+):
+    """Every product of the company as NDJSON, streamed in keyset batches."""
+    return ndjson_export(async_read_sessionmaker(request), models.Product, schemas.ProductResponse, current_company_id)
 
 @router.get("/{product_id}", response_model=schemas.ProductResponse)
-def read_product(
+async def read_product(
     product_id: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
+    cache: CatalogCache = Depends(get_catalog_cache),
     current_company_id: int = Depends(get_current_user_company_id),
     current_user: models.User = Depends(get_customer_user)  # All authenticated users can view a specific product
 ):
-    db_product = db.query(models.Product).filter(models.Product.id == product_id, models.Product.company_id == current_company_id).first()
-    if db_product is None:
+    response = await cache.item("products", current_company_id, product_id,
+                                lambda: get_company_product(db, product_id, current_company_id), product_adapter)
+    if response is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found or not owned by company")
-    return db_product
+    return response
 
 @router.put("/{product_id}", response_model=schemas.ProductResponse)
-def update_product(
+async def update_product(
     product_id: int, 
     product: schemas.ProductCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    cache: CatalogCache = Depends(get_catalog_cache),
     current_company_id: int = Depends(get_current_user_company_id),
     current_user: models.User = Depends(get_admin_user)  # Only admins can update products
 ):
-    db_product = db.query(models.Product).filter(models.Product.id == product_id, models.Product.company_id == current_company_id).first()
+    db_product = await get_company_product(db, product_id, current_company_id)
     if db_product is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found or not owned by company")
     
@@ -68,22 +101,27 @@ def update_product(
     for key, value in update_data.items():
         setattr(db_product, key, value)
     
-    db.commit()
-    db.refresh(db_product)
+    await db.commit()
+    await db.refresh(db_product)
+    tenant_knowledge_bases.upsert(current_company_id, db_product)
+    await cache.invalidate("products", current_company_id, db_product.id)
     return db_product
 
 @router.delete("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_product(
+async def delete_product(
     product_id: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    cache: CatalogCache = Depends(get_catalog_cache),
     current_company_id: int = Depends(get_current_user_company_id),
     current_user: models.User = Depends(get_admin_user)  # Only admins can delete products
 ):
-    db_product = db.query(models.Product).filter(models.Product.id == product_id, models.Product.company_id == current_company_id).first()
+    db_product = await get_company_product(db, product_id, current_company_id)
     if db_product is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found or not owned by company")
-    db.delete(db_product)
-    db.commit()
+    await db.delete(db_product)
+    await db.commit()
+    tenant_knowledge_bases.remove(current_company_id, "product", product_id)
+    await cache.invalidate("products", current_company_id, product_id)
     return 
 
 # Schema for product questions
@@ -103,15 +141,15 @@ class PurchaseResponse(schemas.BaseModel):
     success: bool
 
 @router.post("/{product_id}/answer", response_model=ProductAnswer)
-def answer_product_question(
+async def answer_product_question(
     product_id: int,
     question: ProductQuestion,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_company_id: int = Depends(get_current_user_company_id),
     current_user: models.User = Depends(get_agent_user)  # Only agents and admins can answer questions
 ):
     # First check if the product exists
-    db_product = db.query(models.Product).filter(models.Product.id == product_id, models.Product.company_id == current_company_id).first()
+    db_product = await get_company_product(db, product_id, current_company_id)
     if db_product is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found or not owned by company")
     
@@ -124,14 +162,14 @@ def answer_product_question(
     }
 
 @router.post("/{product_id}/purchase", response_model=PurchaseResponse)
-def purchase_product(
+async def purchase_product(
     product_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_company_id: int = Depends(get_current_user_company_id),
     current_user: models.User = Depends(get_customer_only)  # Only customers can purchase products
 ):
     # First check if the product exists
-    db_product = db.query(models.Product).filter(models.Product.id == product_id, models.Product.company_id == current_company_id).first()
+    db_product = await get_company_product(db, product_id, current_company_id)
     if db_product is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found or not owned by company")
     
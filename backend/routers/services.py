@@ -1,5 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import TypeAdapter
 from typing import List
 import sys
 import os
@@ -8,58 +11,88 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 import schemas
 from dependencies import get_current_user_company_id, get_admin_user, get_agent_user, get_customer_user, get_customer_only
-from database import get_db
+from database import get_async_db, get_async_read_db, async_read_sessionmaker
+from pagination import PageParams, page_select, ndjson_export
+from catalog_cache import CatalogCache, get_catalog_cache
+from tenant_kb import tenant_knowledge_bases
 
 router = APIRouter(
     prefix="/services",
     tags=["services"],
 )
 
+service_list_adapter = TypeAdapter(List[schemas.ServiceResponse])
+service_adapter = TypeAdapter(schemas.ServiceResponse)
+
+async def get_company_service(db: AsyncSession, service_id: int, company_id: int) -> models.Service | None:
+    result = await db.execute(
+        select(models.Service).where(models.Service.id == service_id, models.Service.company_id == company_id)
+    )
+    return result.scalars().first()
+
 @router.post("/", response_model=schemas.ServiceResponse, status_code=status.HTTP_201_CREATED)
-def create_service(
+async def create_service(
     service: schemas.ServiceCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    cache: CatalogCache = Depends(get_catalog_cache),
     current_company_id: int = Depends(get_current_user_company_id),
     current_user: models.User = Depends(get_admin_user)  # Only admins can create services
 ):
     db_service = models.Service(**service.model_dump(), company_id=current_company_id)
     db.add(db_service)
-    db.commit()
-    db.refresh(db_service)
+    await db.commit()
+    await db.refresh(db_service)
+    tenant_knowledge_bases.upsert(current_company_id, db_service)
+    await cache.invalidate("services", current_company_id, db_service.id)
     return db_service
 
 @router.get("/", response_model=List[schemas.ServiceResponse])
-def read_services(
-    skip: int = 0, 
-    limit: int = 100, 
-    db: Session = Depends(get_db),
+async def read_services(
+    request: Request,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_read_db),
+    cache: CatalogCache = Depends(get_catalog_cache),
     current_company_id: int = Depends(get_current_user_company_id),
     current_user: models.User = Depends(get_customer_user)  # All authenticated users can view services
 ):
-    services = db.query(models.Service).filter(models.Service.company_id == current_company_id).offset(skip).limit(limit).all()
-    return services
+    async def load_rows():
+        result = await db.execute(page_select(models.Service, current_company_id, page))
+        return result.scalars().all()
+    return await cache.page("services", current_company_id, page, request, load_rows, service_list_adapter)
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_services(
+    request: Request,
+    current_company_id: int = Depends(get_current_user_company_id),
+    current_user: models.User = Depends(get_customer_user)
+):
+    """Every service of the company as NDJSON, streamed in keyset batches."""
+    return ndjson_export(async_read_sessionmaker(request), models.Service, schemas.ServiceResponse, current_company_id)
 
 @router.get("/{service_id}", response_model=schemas.ServiceResponse)
-def read_service(
+async def read_service(
     service_id: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
+    cache: CatalogCache = Depends(get_catalog_cache),
     current_company_id: int = Depends(get_current_user_company_id),
     current_user: models.User = Depends(get_customer_user)  # All authenticated users can view a specific service
 ):
-    db_service = db.query(models.Service).filter(models.Service.id == service_id, models.Service.company_id == current_company_id).first()
-    if db_service is None:
+    response = await cache.item("services", current_company_id, service_id,
+                                lambda: get_company_service(db, service_id, current_company_id), service_adapter)
+    if response is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Service not found or not owned by company")
-    return db_service
+    return response
 
 @router.put("/{service_id}", response_model=schemas.ServiceResponse)
-def update_service(
+async def update_service(
     service_id: int, 
     service: schemas.ServiceCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    cache: CatalogCache = Depends(get_catalog_cache),
     current_company_id: int = Depends(get_current_user_company_id),
     current_user: models.User = Depends(get_admin_user)  # Only admins can update services
 ):
-    db_service = db.query(models.Service).filter(models.Service.id == service_id, models.Service.company_id == current_company_id).first()
+    db_service = await get_company_service(db, service_id, current_company_id)
     if db_service is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Service not found or not owned by company")
     
@@ -67,22 +100,27 @@ def update_service(
     for key, value in update_data.items():
         setattr(db_service, key, value)
     
-    db.commit()
-    db.refresh(db_service)
+    await db.commit()
+    await db.refresh(db_service)
+    tenant_knowledge_bases.upsert(current_company_id, db_service)
+    await cache.invalidate("services", current_company_id, db_service.id)
     return db_service
 
 @router.delete("/{service_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_service(
+async def delete_service(
     service_id: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    cache: CatalogCache = Depends(get_catalog_cache),
     current_company_id: int = Depends(get_current_user_company_id),
     current_user: models.User = Depends(get_admin_user)  # Only admins can delete services
 ):
-    db_service = db.query(models.Service).filter(models.Service.id == service_id, models.Service.company_id == current_company_id).first()
+    db_service = await get_company_service(db, service_id, current_company_id)
     if db_service is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Service not found or not owned by company")
-    db.delete(db_service)
-    db.commit()
+    await db.delete(db_service)
+    await db.commit()
+    tenant_knowledge_bases.remove(current_company_id, "service", service_id)
+    await cache.invalidate("services", current_company_id, service_id)
     return
 
 class BookingResponse(schemas.BaseModel):
@@ -92,14 +130,14 @@ class BookingResponse(schemas.BaseModel):
     success: bool
 
 @router.post("/{service_id}/book", response_model=BookingResponse)
-def book_service(
+async def book_service(
     service_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_company_id: int = Depends(get_current_user_company_id),
     current_user: models.User = Depends(get_customer_only)  # Only customers can book services
 ):
     # First check if the service exists
-    db_service = db.query(models.Service).filter(models.Service.id == service_id, models.Service.company_id == current_company_id).first()
+    db_service = await get_company_service(db, service_id, current_company_id)
     if db_service is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Service not found or not owned by company")
     
@@ -1,23 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import sys
+import logging
 import os
 # Add the parent directory to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 import schemas
-from passlib.context import CryptContext
 from datetime import timedelta, datetime, timezone
 from config import settings
 from jose import jwt as jose_jwt
-from database import get_db
+from database import get_db, get_async_db, async_read_sessionmaker
+from dependencies import get_agent_user
+from pagination import PageParams, page_select, finish_page, ndjson_export
+from password_hashing import pwd_context, password_hasher
 import os
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+router = APIRouter()
 
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 SECRET_KEY = settings.SECRET_KEY
@@ -48,7 +53,7 @@ async def register_user(
     db: Session = Depends(get_db)
 ):
     try:
-        print(f"Registering user: {fullName}, {email}, {role}, {department}, {companyCode}, profilePic={profilePic.filename if profilePic else None}")
+        logger.debug("Registering user: %s, %s, %s, %s, %s, profilePic=%s", fullName, email, role, department, companyCode, profilePic.filename if profilePic else None)
         # Use fullName as user_id, companyCode as company_id or company name
         user_id = fullName.strip().replace(" ", "_").lower()
         # Try to interpret companyCode as an integer ID first
@@ -67,7 +72,7 @@ async def register_user(
         import re
         company_name_match = re.match(r'^([a-zA-Z]+)[0-9]+$', companyCode)
         if not company_name_match:
-            print(f"Invalid company code format: {companyCode}")
+            logger.warning("Invalid company code format: %s", companyCode)
             raise HTTPException(
                 status_code=400, 
                 detail="Company code must start with company name followed by a number (e.g., acme123)"
@@ -88,18 +93,18 @@ async def register_user(
                     db.refresh(new_company)
                     company_id = new_company.id
                     db_company = new_company
-                    print(f"Created new company: {company_name} with ID: {company_id}")
+                    logger.info("Created new company: %s with ID: %s", company_name, company_id)
                 else:
-                    print("Company not found for companyCode:", companyCode)
+                    logger.warning("Company not found for companyCode: %s", companyCode)
                     raise HTTPException(status_code=404, detail="Company not found")
             except Exception as e:
-                print(f"Error creating company: {e}")
+                logger.error("Error creating company: %s", e)
                 raise HTTPException(status_code=500, detail="Error creating company")
         
         # Validate email format (should be user@company.com)
         email_parts = email.split('@')
         if len(email_parts) != 2 or not email_parts[1].startswith(company_name):
-            print(f"Email '{email}' does not match the required format user@{company_name}.com")
+            logger.warning("Email '%s' does not match the required format user@%s.com", email, company_name)
             raise HTTPException(
                 status_code=400, 
                 detail=f"Email must be in the format user@{company_name}.com"
@@ -108,11 +113,11 @@ async def register_user(
         # Check if user already exists
         db_user_by_id = db.query(models.User).filter(models.User.user_id == user_id).first()
         if db_user_by_id:
-            print("User ID already exists:", user_id)
+            logger.warning("User ID already exists: %s", user_id)
             raise HTTPException(status_code=400, detail="User ID already exists")
         db_user_by_email = db.query(models.User).filter(models.User.email == email).first()
         if db_user_by_email:
-            print("Email already registered:", email)
+            logger.warning("Email already registered: %s", email)
             raise HTTPException(status_code=400, detail="Email already registered")
         profile_pic_path = None
         if profilePic:
@@ -121,12 +126,12 @@ async def register_user(
             profile_pic_path = os.path.join(pic_dir, profilePic.filename)
             with open(profile_pic_path, "wb") as f:
                 f.write(await profilePic.read())
-        hashed_password = pwd_context.hash(password)
+        hashed_password = await password_hasher.hash(password)
         new_user = models.User(user_id=user_id, email=email, hashed_password=hashed_password, company_id=company_id, role=role)
         db.add(new_user)
         db.commit()
         db.refresh(new_user)
-        print(f"User registered: {new_user.id}")
+        logger.info("User registered: %s", new_user.id)
         return schemas.UserResponse(
             id=new_user.id,
             user_id=new_user.user_id,
@@ -134,25 +139,26 @@ async def register_user(
             company_id=new_user.company_id,
         )
     except Exception as e:
-        print(f"User registration error: {e}")
+        logger.error("User registration error: %s", e)
         raise
 
 @router.post("/login")
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    print(f"Login attempt with username: {form_data.username}")
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    logger.debug("Login attempt with username: %s", form_data.username)
     
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
+    user = await db.scalar(select(models.User).where(models.User.email == form_data.username))
+    await db.close()  # Don't hold a connection during the password check
     
     if not user:
-        print(f"User not found with email: {form_data.username}")
+        logger.warning("User not found with email: %s", form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
         
-    if not verify_password(form_data.password, user.hashed_password):
-        print(f"Password verification failed for user: {form_data.username}")
+    if not await password_hasher.verify(form_data.password, user.hashed_password):
+        logger.warning("Password verification failed for user: %s", form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -170,6 +176,17 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
     }
 
 @router.get("/list/{company_id}", response_model=list[schemas.UserResponse])
-def list_users(company_id: int, db: Session = Depends(get_db)):
-    users = db.query(models.User).filter(models.User.company_id == company_id).all()
-    return users 
\ No newline at end of file
+def list_users(company_id: int, request: Request, response: Response, page: PageParams = Depends(), db: Session = Depends(get_db)):
+    users = db.scalars(page_select(models.User, company_id, page)).all()
+    return finish_page(users, company_id, page, request, response)
+
+@router.get("/list/{company_id}/export", response_class=StreamingResponse)
+def export_users(
+    company_id: int,
+    request: Request,
+    current_user: models.User = Depends(get_agent_user)  # Only agents and admins can export users
+):
+    """Every user of the caller's company as NDJSON, streamed in keyset batches."""
+    if company_id != current_user.company_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to export another company's users")
+    return ndjson_export(async_read_sessionmaker(request), models.User, schemas.UserResponse, current_user.company_id) 
\ No newline at end of file
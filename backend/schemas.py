@@ -1,4 +1,5 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
+from typing import Literal
 
 class CompanyCreate(BaseModel):
     name: str
@@ -36,6 +37,17 @@ class UserResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# Authenticated user as seen by request handlers; immutable so it can be cached across requests
+class Principal(BaseModel):
+    id: int
+    user_id: str
+    email: str
+    company_id: int | None = None
+    role: str
+    class Config:
+        from_attributes = True
+        frozen = True
+
 # Product Schemas
 class ProductBase(BaseModel):
     name: str
@@ -132,4 +144,15 @@ class CartItemResponse(CartItemBase):
     service_id: int | None = None
     added_at: str
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class CartBatchOperation(BaseModel):
+    # add: add quantity to the line (creating it), set: make the line's quantity exactly this (0 removes it),
+    # remove: delete the line
+    op: Literal["add", "set", "remove"]
+    product_id: int | None = None
+    service_id: int | None = None
+    quantity: int = 1
+
+class CartBatchRequest(BaseModel):
+    operations: list[CartBatchOperation] = Field(max_length=500)
\ No newline at end of file
@@ -0,0 +1,235 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from starlette.concurrency import run_in_threadpool
+import models
+from database import SessionLocal
+from kb_index import KnowledgeBaseIndex
+
+# Number of tenant indexes kept in memory; the least recently used tenant is evicted first
+KB_MAX_TENANTS = int(os.getenv("KB_MAX_TENANTS", "256"))
+# Upper bound on documents indexed per tenant, keeps memory per tenant bounded
+KB_MAX_DOCS_PER_TENANT = int(os.getenv("KB_MAX_DOCS_PER_TENANT", "20000"))
+# Long text fields are truncated before indexing
+KB_MAX_FIELD_CHARS = int(os.getenv("KB_MAX_FIELD_CHARS", "2000"))
+# A resident tenant is reloaded after this long, picking up writes made through other workers
+KB_TENANT_TTL_SECONDS = float(os.getenv("KB_TENANT_TTL_SECONDS", "300"))
+
+
+def kb_doc_id(doc_type: str, row_id: int) -> str:
+    return f"{doc_type}_{row_id}"
+
+
+def _clip(text):
+    if text is None:
+        return ""
+    return text[:KB_MAX_FIELD_CHARS]
+
+
+def _format_price(cents):
+    return f"${cents / 100:.2f}" if cents is not None else None
+
+
+def faq_to_item(faq: models.FAQ) -> dict:
+    return {"type": "faq", "id": kb_doc_id("faq", faq.id), "question": _clip(faq.question), "answer": _clip(faq.answer)}
+
+
+def policy_to_item(policy: models.Policy) -> dict:
+    return {"type": "policy", "id": kb_doc_id("policy", policy.id), "title": _clip(policy.title), "content": _clip(policy.content)}
+
+
+def product_to_item(product: models.Product) -> dict:
+    return {
+        "type": "product",
+        "id": kb_doc_id("product", product.id),
+        "name": _clip(product.name),
+        "description": _clip(product.description),
+        "price": _format_price(product.price),
+    }
+
+
+def service_to_item(service: models.Service) -> dict:
+    item = {
+        "type": "service",
+        "id": kb_doc_id("service", service.id),
+        "name": _clip(service.name),
+        "description": _clip(service.description),
+        "price": _format_price(service.price),
+    }
+    if service.period:
+        item["details"] = f"Billed {service.period}"
+    return item
+
+
+# Keyed by table name so rows match regardless of which import path loaded models
+ROW_CONVERTERS = {
+    "faqs": faq_to_item,
+    "policies": policy_to_item,
+    "products": product_to_item,
+    "services": service_to_item,
+}
+
+
+def row_to_item(row) -> dict:
+    return ROW_CONVERTERS[row.__tablename__](row)
+
+
+class TenantKnowledgeBases:
+    """
+    Per-company knowledge base indexes loaded from the FAQ, Policy, Product and Service tables.
+
+    A tenant is loaded on first use and then kept in sync by the CRUD routers calling
+    `upsert` and `remove`, so retrieval never touches the database while the tenant
+    stays resident. Those calls only reach the worker that handled the write; other
+    workers see it when their copy expires, `ttl_seconds` after it was loaded. Idle
+    tenants are evicted in LRU order once `max_tenants` is reached. Loads of different
+    tenants run concurrently; concurrent first requests for one tenant share its load.
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_tenants: int = KB_MAX_TENANTS,
+                 max_docs_per_tenant: int = KB_MAX_DOCS_PER_TENANT, ttl_seconds: float = KB_TENANT_TTL_SECONDS):
+        self.session_factory = session_factory
+        self.max_tenants = max_tenants
+        self.max_docs_per_tenant = max_docs_per_tenant
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._load_locks = {}  # company_id -> [lock, callers using it], only while a load is wanted
+        self._indexes = OrderedDict()  # company_id -> KnowledgeBaseIndex, most recently used last
+        self._expires_at = {}  # company_id -> time.monotonic() after which the resident index is reloaded
+        self._loading = {}  # company_id -> writes seen since its load started, only while it is loading
+        self._listeners = []
+        self.loads = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def add_change_listener(self, callback) -> None:
+        """Call `callback(company_id, doc_id)` after every change; doc_id is None for a whole tenant."""
+        self._listeners.append(callback)
+
+    def _notify(self, company_id: int, doc_id) -> None:
+        for callback in self._listeners:
+            callback(company_id, doc_id)
+
+    def peek(self, company_id: int):
+        """Return the resident index for a tenant (marking it recently used) or None."""
+        with self._lock:
+            index = self._indexes.get(company_id)
+            if index is None:
+                return None
+            if self._expires_at[company_id] <= time.monotonic():
+                self._drop(company_id)
+                self.expirations += 1
+                return None
+            self._indexes.move_to_end(company_id)
+            return index
+
+    def _drop(self, company_id: int) -> None:
+        # Caller holds _lock
+        self._indexes.pop(company_id, None)
+        self._expires_at.pop(company_id, None)
+
+    def get(self, company_id: int) -> KnowledgeBaseIndex:
+        """Return the tenant index, loading it from the database if it is not resident."""
+        index = self.peek(company_id)
+        if index is not None:
+            return index
+        with self._lock:
+            load_lock = self._load_locks.setdefault(company_id, [threading.Lock(), 0])
+            load_lock[1] += 1
+        try:
+            with load_lock[0]:
+                # Another caller may have loaded the tenant while we waited
+                index = self.peek(company_id)
+                if index is not None:
+                    return index
+                return self._load(company_id)
+        finally:
+            with self._lock:
+                load_lock[1] -= 1
+                if not load_lock[1]:
+                    del self._load_locks[company_id]
+
+    async def get_async(self, company_id: int) -> KnowledgeBaseIndex:
+        index = self.peek(company_id)
+        if index is not None:
+            return index
+        return await run_in_threadpool(self.get, company_id)
+
+    def _load(self, company_id: int) -> KnowledgeBaseIndex:
+        with self._lock:
+            self._loading[company_id] = 0
+
+        index = KnowledgeBaseIndex()
+        db = self.session_factory()
+        try:
+            budget = self.max_docs_per_tenant
+            for model, converter in ((models.FAQ, faq_to_item), (models.Policy, policy_to_item),
+                                     (models.Product, product_to_item), (models.Service, service_to_item)):
+                if budget <= 0:
+                    break
+                rows = db.query(model).filter(model.company_id == company_id).order_by(model.id).limit(budget).all()
+                index.add_many(converter(row) for row in rows)
+                budget -= len(rows)
+        except BaseException:
+            with self._lock:
+                self._loading.pop(company_id, None)
+            raise
+        finally:
+            db.close()
+
+        with self._lock:
+            self.loads += 1
+            # Only cache the snapshot if no write for this tenant happened while loading
+            if self._loading.pop(company_id, None) == 0:
+                self._indexes[company_id] = index
+                self._indexes.move_to_end(company_id)
+                self._expires_at[company_id] = time.monotonic() + self.ttl_seconds
+                while len(self._indexes) > self.max_tenants:
+                    self._drop(next(iter(self._indexes)))
+                    self.evictions += 1
+        return index
+
+    def _note_write(self, company_id: int) -> None:
+        # Caller holds _lock. Only a load in progress needs to know; resident indexes are updated in place
+        if company_id in self._loading:
+            self._loading[company_id] += 1
+
+    def upsert(self, company_id: int, row) -> None:
+        """Add or replace a FAQ/Policy/Product/Service row in its tenant index."""
+        item = row_to_item(row)
+        with self._lock:
+            self._note_write(company_id)
+            index = self._indexes.get(company_id)
+        # Not resident: the next load reads the row from the database
+        if index is not None and (item["id"] in index or len(index) < self.max_docs_per_tenant):
+            index.add(item)
+        self._notify(company_id, item["id"])
+
+    def remove(self, company_id: int, doc_type: str, row_id: int) -> None:
+        with self._lock:
+            self._note_write(company_id)
+            index = self._indexes.get(company_id)
+        doc_id = kb_doc_id(doc_type, row_id)
+        if index is not None:
+            index.remove(doc_id)
+        self._notify(company_id, doc_id)
+
+    def invalidate(self, company_id: int) -> None:
+        with self._lock:
+            self._note_write(company_id)
+            self._drop(company_id)
+        self._notify(company_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "resident_tenants": len(self._indexes),
+                "resident_documents": sum(len(index) for index in self._indexes.values()),
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+tenant_knowledge_bases = TenantKnowledgeBases()
@@ -0,0 +1,50 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+# Run against a throwaway SQLite database, never the app's own
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir.name, 'test.db')}"
+os.environ.setdefault("HUGGINGFACE_API_KEY", "test-key")
+
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import httpx
+import main
+from llm_breaker import CircuitOpen
+
+
+def parse_events(body: str) -> list:
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = frame.split("\n")
+        event = lines[0][len("event: "):] if lines[0].startswith("event: ") else None
+        events.append((event, json.loads(lines[-1][len("data: "):])))
+    return events
+
+
+def test_circuit_opening_after_admission_answers_from_the_knowledge_base(monkeypatch):
+    async def circuit_opens(prompt_messages, slot=None):
+        slot.release()
+        raise CircuitOpen("huggingface")
+        yield  # an async generator, like the router's stream
+
+    monkeypatch.setattr(main.llm_router, "stream", circuit_opens)
+    main.response_cache.clear()
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/api/chat/stream",
+                                         json={"user_id": "stream_test_user", "message": "What is your return policy?"})
+            assert response.status_code == 200
+            return parse_events(response.text)
+
+    events = asyncio.run(run())
+    event, done = events[-1]
+    assert event == "done"
+    assert done["degraded"] is True
+    assert "error" not in done
+    assert events[0] == (None, {"token": done["response"]})
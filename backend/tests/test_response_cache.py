@@ -0,0 +1,57 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+# Run against a throwaway SQLite database, never the app's own
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir.name, 'test.db')}"
+
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import httpx
+import main
+from response_cache import ResponseCache
+
+
+async def fake_ai_service(prompt_messages: list) -> str:
+    # Answers from the conversation, like the real model: "cancel it" refers to the user's own order
+    ordered = [m["content"] for m in prompt_messages if m["role"] == "user" and m["content"].startswith("I ordered")]
+    question = prompt_messages[-1]["content"]
+    return f"About '{question}': that is your {ordered[-1][len('I ordered '):]}" if ordered else f"About '{question}'"
+
+
+async def chat(client, user_id: str, message: str) -> str:
+    response = await client.post("/api/chat", json={"user_id": user_id, "message": message})
+    assert response.status_code == 200
+    return response.json()["response"]
+
+
+def test_same_follow_up_after_different_conversations_gets_different_answers(monkeypatch):
+    monkeypatch.setattr(main, "call_ai_service", fake_ai_service)
+    main.response_cache.clear()
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await chat(client, "cache_test_alice", "I ordered a desk lamp")
+            await chat(client, "cache_test_bob", "I ordered an office chair")
+            return (await chat(client, "cache_test_alice", "Can you cancel it?"),
+                    await chat(client, "cache_test_bob", "Can you cancel it?"))
+
+    alice, bob = asyncio.run(run())
+    assert "desk lamp" in alice
+    assert "office chair" in bob
+
+
+def test_first_messages_are_shared_and_follow_ups_keyed_on_history():
+    cache = ResponseCache(near_duplicates=False)
+    cache.put(1, "What are your business hours?", ["faq_1"], "9 to 5")
+    assert cache.get(1, "what are your business hours", ["faq_1"]) == "9 to 5"
+
+    history = [{"role": "user", "content": "I ordered a desk lamp"}, {"role": "assistant", "content": "Thanks!"}]
+    cache.put(1, "cancel it", [], "Your desk lamp order is cancelled", history)
+    assert cache.get(1, "cancel it", [], history) == "Your desk lamp order is cancelled"
+    assert cache.get(1, "cancel it", []) is None
+    assert cache.get(1, "cancel it", [], [{"role": "user", "content": "I ordered an office chair"},
+                                          {"role": "assistant", "content": "Thanks!"}]) is None
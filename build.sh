@@ -14,6 +14,10 @@ npm install
 npm run build
 cd ..
 
+# Precompressed .br/.gz siblings for the /assets handler
+echo "Compressing frontend assets..."
+(cd backend && python compress_assets.py)
+
 echo "Frontend build completed."
 
 # Create necessary directories for static files